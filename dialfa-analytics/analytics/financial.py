@@ -6,9 +6,9 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-from .utils import format_currency, calculate_growth_rate, calculate_risk_score, clean_dataframe
-from database.queries import FinancialQueries
-from cache_config import cache, get_cache_timeout
+from .utils import format_currency, get_currency_formatter, calculate_growth_rate, calculate_risk_scores, clean_dataframe
+from database.queries import FinancialQueries, MaterializedQueries
+from cache_config import cache, cached_by_args, get_cache_timeout
 
 class FinancialAnalytics:
     def __init__(self, db_manager, **kwargs):
@@ -21,7 +21,7 @@ class FinancialAnalytics:
         """Get key financial metrics for executive dashboard"""
         self.logger.info("Executing get_executive_summary (cache miss or expired)")
         try:
-            df = self.db.execute_query(self.queries.EXECUTIVE_SUMMARY, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('EXECUTIVE_SUMMARY'), 'SPISA')
 
             if not df.empty:
                 row = df.iloc[0]
@@ -51,11 +51,11 @@ class FinancialAnalytics:
             df = clean_dataframe(df)
             
             # Add risk scoring
-            df['RiskScore'] = df.apply(calculate_risk_score, axis=1)
+            df['RiskScore'] = calculate_risk_scores(df)
             
             # Add formatted currency columns
-            df['FormattedBalance'] = df['CurrentBalance'].apply(lambda x: format_currency(x, 'ARS', 'SPISA'))
-            df['FormattedOverdue'] = df['OverdueAmount'].apply(lambda x: format_currency(x, 'ARS', 'SPISA'))
+            df['FormattedBalance'] = df['CurrentBalance'].apply(get_currency_formatter('ARS', 'SPISA'))
+            df['FormattedOverdue'] = df['OverdueAmount'].apply(get_currency_formatter('ARS', 'SPISA'))
             
             # Sort by risk score descending
             df = df.sort_values('RiskScore', ascending=False)
@@ -65,14 +65,46 @@ class FinancialAnalytics:
             self.logger.error(f"Error in credit risk analysis: {e}")
             return []
     
-    @cache.cached(timeout=get_cache_timeout('cash_flow'), key_prefix='financial_cash_flow_%(months)s')
+    @cache.cached(timeout=get_cache_timeout('credit_risk'), key_prefix='financial_high_risk_count')
+    def get_high_risk_count(self):
+        """Number of customers classified HIGH RISK by the credit risk analysis"""
+        self.logger.info("Executing get_high_risk_count (cache miss or expired)")
+        try:
+            df = self.db.execute_query(self.queries.HIGH_RISK_COUNT, 'SPISA')
+            return int(df.iloc[0]['HighRiskCount']) if not df.empty else 0
+        except Exception as e:
+            self.logger.error(f"Error counting high risk customers: {e}")
+            return 0
+    
+    # Cleared-payment columns of PAYMENTS_ROLLUP -> names used by the cash flow charts
+    CASH_FLOW_COLUMNS = {
+        'ClearedPayments': 'ActualPayments',
+        'ClearedCashPayments': 'CashPayments',
+        'ClearedElectronicPayments': 'ElectronicPayments',
+        'ClearedCount': 'TransactionCount',
+        'ClearedCashCount': 'CashCount',
+        'ClearedElectronicCount': 'ElectronicCount',
+    }
+
+    def _payments_rollup(self, months=12):
+        """Monthly payments rollup shared by the cash flow history and monthly collections
+        (same months -> one query, served from the query cache for the second caller)"""
+        return clean_dataframe(self.db.execute_query(self.queries.PAYMENTS_ROLLUP, 'SPISA', {'months': months}))
+
+    def _cash_flow(self, months):
+        """Payments already made in the last months, one row per month"""
+        df = self._payments_rollup(months)
+        if df.empty:
+            return df
+        df = df[df['ClearedCount'] > 0]
+        return df[['Year', 'Month', *self.CASH_FLOW_COLUMNS]].rename(columns=self.CASH_FLOW_COLUMNS)
+
+    @cached_by_args(timeout=get_cache_timeout('cash_flow'), key_prefix='financial_cash_flow_%(months)s')
     def get_cash_flow_history(self, months=12):
         """Get historical cash flow data"""
         self.logger.info(f"Executing get_cash_flow_history for {months} months (cache miss or expired)")
         try:
-            query = self.queries.CASH_FLOW_FORECAST.format(months=months)
-            df = self.db.execute_query(query, 'SPISA')
-            df = clean_dataframe(df)
+            df = self._cash_flow(months)
             
             if not df.empty:
                 # Sort by Year, Month for proper trend calculation
@@ -88,8 +120,8 @@ class FinancialAnalytics:
                 df = df.replace([float('inf'), float('-inf')], 0)
                 
                 # Add formatted values
-                df['FormattedPayments'] = df['ActualPayments'].apply(lambda x: format_currency(x, '$', 'SPISA'))
-                df['FormattedMovingAvg'] = df['MovingAvg3'].apply(lambda x: format_currency(x, '$', 'SPISA'))
+                df['FormattedPayments'] = df['ActualPayments'].apply(get_currency_formatter('$', 'SPISA'))
+                df['FormattedMovingAvg'] = df['MovingAvg3'].apply(get_currency_formatter('$', 'SPISA'))
                 
                 # Create month-year label
                 df['MonthYear'] = df.apply(lambda x: f"{x['Year']}-{x['Month']:02d}", axis=1)
@@ -103,13 +135,13 @@ class FinancialAnalytics:
             self.logger.error(f"Error in cash flow history: {e}")
             return []
     
+    @cached_by_args(timeout=get_cache_timeout('cash_flow'), key_prefix='financial_cash_flow_forecast_%(forecast_months)s')
     def get_cash_flow_forecast(self, forecast_months=6):
         """Generate actual cash flow forecast using multiple algorithms"""
+        self.logger.info(f"Executing get_cash_flow_forecast for {forecast_months} months (cache miss or expired)")
         try:
             # Get 24 months of historical data for better predictions
-            historical_query = self.queries.CASH_FLOW_FORECAST.format(months=24)
-            df_historical = self.db.execute_query(historical_query, 'SPISA')
-            df_historical = clean_dataframe(df_historical)
+            df_historical = self._cash_flow(24)
             
             if df_historical.empty:
                 return []
@@ -252,8 +284,8 @@ class FinancialAnalytics:
             return self._linear_trend_forecast(df_historical, df_future)
         
         # Calculate seasonal factors (month-over-month patterns)
-        df_historical['MonthNum'] = df_historical['Month']
-        monthly_avg = df_historical.groupby('MonthNum')['ActualPayments'].mean()
+        # Factors are looked up by month, so skip sorting the group keys
+        monthly_avg = df_historical.groupby('Month', sort=False)['ActualPayments'].mean()
         overall_avg = df_historical['ActualPayments'].mean()
         seasonal_factors = monthly_avg / overall_avg
         
@@ -329,18 +361,18 @@ class FinancialAnalytics:
         
         return forecasts
     
-    @cache.cached(timeout=get_cache_timeout('top_customers'), key_prefix='financial_top_customers_%(limit)s')
+    @cached_by_args(timeout=get_cache_timeout('top_customers'), key_prefix='financial_top_customers_%(limit)s')
     def get_top_customers(self, limit=10):
         """Get top customers by outstanding balance"""
         self.logger.info(f"Executing get_top_customers (top {limit}) (cache miss or expired)")
         try:
-            query = self.queries.TOP_CUSTOMERS.format(limit=limit)
-            df = self.db.execute_query(query, 'SPISA')
+            query = self.queries.TOP_CUSTOMERS
+            df = self.db.execute_query(query, 'SPISA', {'limit': limit})
             df = clean_dataframe(df)
             
             # Add formatted currency columns
-            df['FormattedBalance'] = df['OutstandingBalance'].apply(lambda x: format_currency(x, 'ARS', 'SPISA'))
-            df['FormattedOverdue'] = df['OverdueAmount'].apply(lambda x: format_currency(x, 'ARS', 'SPISA'))
+            df['FormattedBalance'] = df['OutstandingBalance'].apply(get_currency_formatter('ARS', 'SPISA'))
+            df['FormattedOverdue'] = df['OverdueAmount'].apply(get_currency_formatter('ARS', 'SPISA'))
             
             # Add risk level based on overdue percentage
             df['RiskLevel'] = df['OverduePercentage'].apply(self._categorize_risk)
@@ -350,17 +382,20 @@ class FinancialAnalytics:
             self.logger.error(f"Error getting top customers: {e}")
             return []
     
+    @cache.cached(timeout=get_cache_timeout('customer_profitability'), key_prefix='financial_customer_profitability')
     def get_customer_profitability(self):
         """Analyze customer profitability and lifetime value"""
+        self.logger.info("Executing get_customer_profitability (cache miss or expired)")
         try:
-            df = self.db.execute_query(self.queries.CUSTOMER_PROFITABILITY, 'SPISA')
+            query_name = 'CUSTOMER_PROFITABILITY_MATERIALIZED' if MaterializedQueries.enabled() else 'CUSTOMER_PROFITABILITY'
+            df = self.db.execute_query(getattr(self.queries, query_name), 'SPISA')
             df = clean_dataframe(df)
             
             # Add formatted currency columns
-            df['FormattedRevenue'] = df['TotalRevenue'].apply(lambda x: format_currency(x, '$', 'SPISA'))
-            df['FormattedPayments'] = df['TotalPayments'].apply(lambda x: format_currency(x, '$', 'SPISA'))
-            df['FormattedBalance'] = df['CurrentBalance'].apply(lambda x: format_currency(x, '$', 'SPISA'))
-            df['FormattedAnnualized'] = df['AnnualizedRevenue'].apply(lambda x: format_currency(x, '$', 'SPISA'))
+            df['FormattedRevenue'] = df['TotalRevenue'].apply(get_currency_formatter('$', 'SPISA'))
+            df['FormattedPayments'] = df['TotalPayments'].apply(get_currency_formatter('$', 'SPISA'))
+            df['FormattedBalance'] = df['CurrentBalance'].apply(get_currency_formatter('$', 'SPISA'))
+            df['FormattedAnnualized'] = df['AnnualizedRevenue'].apply(get_currency_formatter('$', 'SPISA'))
             
             return df.to_dict('records')
         except Exception as e:
@@ -372,39 +407,12 @@ class FinancialAnalytics:
         """Analyze accounts receivable aging"""
         self.logger.info("Executing get_aging_analysis (cache miss or expired)")
         try:
-            # Custom aging query
-            aging_query = """
-            SELECT
-                c.name,
-                b.amount as "TotalBalance",
-                CASE
-                    WHEN b.due = 0 THEN b.amount
-                    ELSE 0
-                END as "Current",
-                CASE
-                    WHEN b.due > 0 AND b.due <= b.amount * 0.3 THEN b.due
-                    ELSE 0
-                END as "Days30",
-                CASE
-                    WHEN b.due > b.amount * 0.3 AND b.due <= b.amount * 0.6 THEN b.due
-                    ELSE 0
-                END as "Days60",
-                CASE
-                    WHEN b.due > b.amount * 0.6 THEN b.due
-                    ELSE 0
-                END as "Days90Plus"
-            FROM sync_customers c
-            INNER JOIN sync_balances b ON c.id = b.customer_id
-            WHERE b.amount > 0
-            ORDER BY b.amount DESC
-            """
-            
-            df = self.db.execute_query(aging_query, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('AGING_ANALYSIS'), 'SPISA')
             df = clean_dataframe(df)
             
             # Add formatted columns
             for col in ['TotalBalance', 'Current', 'Days30', 'Days60', 'Days90Plus']:
-                df[f'Formatted{col}'] = df[col].apply(lambda x: format_currency(x, '$', 'SPISA'))
+                df[f'Formatted{col}'] = df[col].apply(get_currency_formatter('$', 'SPISA'))
             
             return df.to_dict('records')
         except Exception as e:
@@ -446,8 +454,8 @@ class FinancialAnalytics:
                 df['PaymentGrowth'] = df['PaymentGrowth'].replace([np.inf, -np.inf], 0)
                 
                 # Format currency
-                df['FormattedPayments'] = df['TotalPayments'].apply(lambda x: format_currency(x, '$', 'SPISA'))
-                df['FormattedAvgSize'] = df['AvgPaymentSize'].apply(lambda x: format_currency(x, '$', 'SPISA'))
+                df['FormattedPayments'] = df['TotalPayments'].apply(get_currency_formatter('$', 'SPISA'))
+                df['FormattedAvgSize'] = df['AvgPaymentSize'].apply(get_currency_formatter('$', 'SPISA'))
                 
                 # Sort back to descending for display
                 df = df.sort_values(['Year', 'Month'], ascending=[False, False])
@@ -482,7 +490,8 @@ class FinancialAnalytics:
             AND EXTRACT(YEAR FROM invoice_date)::int = EXTRACT(YEAR FROM NOW())::int
             """
             
-            current_df = self.db.execute_query(current_month_query, 'SPISA')
+            # Both months are fetched concurrently on the query pool
+            current_future = self.db.submit_query(current_month_query, 'SPISA')
             
             # Get previous month for comparison
             previous_month_query = """
@@ -495,6 +504,7 @@ class FinancialAnalytics:
             """
             
             previous_df = self.db.execute_query(previous_month_query, 'SPISA')
+            current_df = current_future.result()
             
             if not current_df.empty and not previous_df.empty:
                 current = current_df.iloc[0]
@@ -555,17 +565,20 @@ class FinancialAnalytics:
     def get_spisa_due_balance(self):
         """Get SPISA due balance exactly as in Retool"""
         try:
-            df = self.db.execute_query(self.queries.SPISA_DUE_BALANCE, 'SPISA')
+            # Shares the executive summary's balance totals
+            df = self.db.execute_query(MaterializedQueries.resolve('EXECUTIVE_SUMMARY'), 'SPISA')
             df = clean_dataframe(df)
             if not df.empty:
-                return {'Due': float(df.iloc[0]['Due'])}
+                return {'Due': float(df.iloc[0]['TotalDue'])}
             return {'Due': 0}
         except Exception as e:
             self.logger.error(f"Error getting SPISA due balance: {e}")
             return {'Due': 0}
 
+    @cache.cached(timeout=get_cache_timeout('billing_monthly'), key_prefix='financial_spisa_billed_monthly')
     def get_spisa_billed_monthly(self):
         """Get SPISA monthly billing exactly as in Retool"""
+        self.logger.info("Executing get_spisa_billed_monthly (cache miss or expired)")
         try:
             df = self.db.execute_query(self.queries.SPISA_BILLED_MONTHLY, 'SPISA')
             df = clean_dataframe(df)
@@ -576,8 +589,10 @@ class FinancialAnalytics:
             self.logger.error(f"Error getting SPISA monthly billing: {e}")
             return {'InvoiceAmount': 0}
 
+    @cache.cached(timeout=get_cache_timeout('billing_today'), key_prefix='financial_spisa_billed_today')
     def get_spisa_billed_today(self):
         """Get SPISA today billing exactly as in Retool"""
+        self.logger.info("Executing get_spisa_billed_today (cache miss or expired)")
         try:
             df = self.db.execute_query(self.queries.SPISA_BILLED_TODAY, 'SPISA')
             df = clean_dataframe(df)
@@ -588,11 +603,14 @@ class FinancialAnalytics:
             self.logger.error(f"Error getting SPISA today billing: {e}")
             return {'InvoiceAmount': 0}
     
+    @cache.cached(timeout=get_cache_timeout('collected_monthly'), key_prefix='financial_collected_monthly')
     def get_spisa_collected_monthly(self):
         """Get SPISA monthly collections (payments received this month) with breakdown by status and type"""
+        self.logger.info("Executing get_spisa_collected_monthly (cache miss or expired)")
         try:
-            df = self.db.execute_query(self.queries.SPISA_COLLECTED_MONTHLY, 'SPISA')
-            df = clean_dataframe(df)
+            df = self._payments_rollup()
+            if not df.empty:
+                df = df[df['IsCurrentMonth'].astype(bool)]
             if not df.empty:
                 row = df.iloc[0]
                 total = float(row['TotalPayments'])
@@ -738,8 +756,8 @@ class FinancialAnalytics:
             df['MonthYear'] = df.apply(lambda x: f"{int(x['Year'])}-{int(x['Month']):02d}", axis=1)
             
             # Format values
-            df['FormattedSales'] = df['MonthlySales'].apply(lambda x: format_currency(x, 'ARS', 'xERP'))
-            df['FormattedOutstanding'] = df['OutstandingAmount'].apply(lambda x: format_currency(x, 'ARS', 'xERP'))
+            df['FormattedSales'] = df['MonthlySales'].apply(get_currency_formatter('ARS', 'xERP'))
+            df['FormattedOutstanding'] = df['OutstandingAmount'].apply(get_currency_formatter('ARS', 'xERP'))
             
             monthly_metrics = df.to_dict('records')
             
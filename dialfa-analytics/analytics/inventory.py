@@ -6,15 +6,14 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-from .utils import format_currency, categorize_stock_movement, calculate_carrying_cost, clean_dataframe
-from database.queries import InventoryQueries
-from cache_config import cache, get_cache_timeout
+from .utils import format_currency, get_currency_formatter, categorize_stock_movement, calculate_carrying_cost, clean_dataframe
+from database.queries import InventoryQueries, MaterializedQueries
+from cache_config import cache, cached_by_args, get_cache_timeout
 
 class InventoryAnalytics:
     def __init__(self, db_manager, **kwargs):
         self.db = db_manager
         self.logger = logging.getLogger(__name__)
-        from database.queries import InventoryQueries
         self.queries = InventoryQueries()
     
     def get_summary(self):
@@ -41,16 +40,18 @@ class InventoryAnalytics:
             self.logger.error(f"Error getting inventory summary: {e}")
             return {}
     
+    @cached_by_args(timeout=get_cache_timeout('top_stock_value'), key_prefix='inventory_top_stock_value_%(limit)s')
     def get_top_stock_value(self, limit=10):
         """Get products with highest stock value"""
+        self.logger.info(f"Executing get_top_stock_value (top {limit}) (cache miss or expired)")
         try:
-            query = self.queries.TOP_STOCK_VALUE.format(limit=limit)
-            df = self.db.execute_query(query, 'SPISA')
+            query = self.queries.TOP_STOCK_VALUE
+            df = self.db.execute_query(query, 'SPISA', {'limit': limit})
             df = clean_dataframe(df)
             
             # Add formatted columns (SPISA data = USD)
-            df['FormattedStockValue'] = df['StockValue'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedUnitPrice'] = df['UnitPrice'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
+            df['FormattedStockValue'] = df['StockValue'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedUnitPrice'] = df['UnitPrice'].apply(get_currency_formatter('USD', 'SPISA'))
             
             return df.to_dict('records')
         except Exception as e:
@@ -60,16 +61,17 @@ class InventoryAnalytics:
     def get_slow_moving_analysis(self):
         """Analyze slow-moving and dead stock"""
         try:
-            df = self.db.execute_query(self.queries.SLOW_MOVING_ANALYSIS, 'SPISA')
+            query_name = 'SLOW_MOVING_ANALYSIS_MATERIALIZED' if MaterializedQueries.enabled() else 'SLOW_MOVING_ANALYSIS'
+            df = self.db.execute_query(getattr(self.queries, query_name), 'SPISA')
             df = clean_dataframe(df)
             
             # Add formatted columns (SPISA data = USD)
-            df['FormattedStockValue'] = df['StockValue'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedCarryingCost'] = df['MonthlyCarryingCost'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
+            df['FormattedStockValue'] = df['StockValue'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedCarryingCost'] = df['MonthlyCarryingCost'].apply(get_currency_formatter('USD', 'SPISA'))
             
             # Calculate annual carrying cost
             df['AnnualCarryingCost'] = df['MonthlyCarryingCost'] * 12
-            df['FormattedAnnualCost'] = df['AnnualCarryingCost'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
+            df['FormattedAnnualCost'] = df['AnnualCarryingCost'].apply(get_currency_formatter('USD', 'SPISA'))
             
             return df.to_dict('records')
         except Exception as e:
@@ -164,36 +166,7 @@ class InventoryAnalytics:
         """Perform ABC analysis on inventory"""
         self.logger.info("Executing get_abc_analysis (cache miss or expired)")
         try:
-            # Get inventory with sales data
-            abc_query = """
-            WITH InventoryValue AS (
-                SELECT
-                    a.id as "IdArticulo",
-                    a.description as "ProductName",
-                    a.stock * a.unit_price as "StockValue",
-                    COALESCE(sales."TotalSold", 0) as "TotalSold",
-                    COALESCE(sales."SalesValue", 0) as "SalesValue"
-                FROM articles a
-                LEFT JOIN (
-                    SELECT
-                        soi.article_id,
-                        SUM(soi.quantity) as "TotalSold",
-                        SUM(soi.quantity * a2.unit_price) as "SalesValue"
-                    FROM sales_order_items soi
-                    INNER JOIN sales_orders so ON soi.sales_order_id = so.id
-                    INNER JOIN articles a2 ON soi.article_id = a2.id
-                    WHERE so.order_date >= NOW() - INTERVAL '1 year'
-                    AND so.deleted_at IS NULL
-                    GROUP BY soi.article_id
-                ) sales ON a.id = sales.article_id
-                WHERE a.stock > 0 AND a.is_discontinued = false
-                AND a.deleted_at IS NULL
-            )
-            SELECT * FROM InventoryValue
-            ORDER BY "SalesValue" DESC
-            """
-            
-            df = self.db.execute_query(abc_query, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('ABC_ANALYSIS'), 'SPISA')
             df = clean_dataframe(df)
             
             if not df.empty:
@@ -203,7 +176,8 @@ class InventoryAnalytics:
                 df['CumulativePercentage'] = df['SalesPercentage'].cumsum()
                 
                 # Assign ABC categories
-                df['ABCCategory'] = df['CumulativePercentage'].apply(self._assign_abc_category)
+                cumulative = df['CumulativePercentage'].to_numpy(dtype=float, na_value=np.nan)
+                df['ABCCategory'] = np.select([cumulative <= 80, cumulative <= 95], ['A', 'B'], 'C')
                 
                 # Add formatted columns
                 df['FormattedStockValue'] = df['StockValue'].apply(format_currency)
@@ -275,15 +249,6 @@ class InventoryAnalytics:
         except:
             return 0
     
-    def _assign_abc_category(self, cumulative_percentage):
-        """Assign ABC category based on cumulative percentage"""
-        if cumulative_percentage <= 80:
-            return 'A'
-        elif cumulative_percentage <= 95:
-            return 'B'
-        else:
-            return 'C'
-    
     @cache.cached(timeout=get_cache_timeout('stock_alerts'), key_prefix='inventory_alerts')
     def get_stock_alerts(self):
         """Get stock level alerts"""
@@ -322,6 +287,20 @@ class InventoryAnalytics:
             self.logger.error(f"Error getting stock alerts: {e}")
             return []
     
+    @cache.cached(timeout=get_cache_timeout('stock_alerts'), key_prefix='inventory_alert_counts')
+    def get_stock_alert_counts(self):
+        """Out-of-stock and low-stock product counts of the stock alerts"""
+        self.logger.info("Executing get_stock_alert_counts (cache miss or expired)")
+        try:
+            df = self.db.execute_query(self.queries.STOCK_ALERT_COUNTS, 'SPISA')
+            if not df.empty:
+                row = df.iloc[0]
+                return {'out_of_stock': int(row['OutOfStockCount']), 'low_stock': int(row['LowStockCount'])}
+            return {'out_of_stock': 0, 'low_stock': 0}
+        except Exception as e:
+            self.logger.error(f"Error counting stock alerts: {e}")
+            return {'out_of_stock': 0, 'low_stock': 0}
+    
     def get_stock_variation_over_time(self):
         """Get detailed stock variation analysis over time"""
         try:
@@ -329,10 +308,10 @@ class InventoryAnalytics:
             df = clean_dataframe(df)
             
             # Add formatted currency columns
-            df['FormattedUnitPrice'] = df['UnitPrice'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedStockValue'] = df['StockValue'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedSalesValue'] = df['MonthlySalesValue'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedCarryingCost'] = df['MonthlyCarryingCost'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
+            df['FormattedUnitPrice'] = df['UnitPrice'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedStockValue'] = df['StockValue'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedSalesValue'] = df['MonthlySalesValue'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedCarryingCost'] = df['MonthlyCarryingCost'].apply(get_currency_formatter('USD', 'SPISA'))
             
             # Add percentage formatting
             df['FormattedTurnoverRate'] = df['TurnoverRate'].apply(lambda x: f"{x:.1%}" if pd.notna(x) else "0.0%")
@@ -345,7 +324,7 @@ class InventoryAnalytics:
     def get_stock_velocity_summary(self):
         """Get comprehensive stock velocity and turnover analysis"""
         try:
-            df = self.db.execute_query(self.queries.STOCK_VELOCITY_SUMMARY, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('STOCK_VELOCITY_SUMMARY'), 'SPISA')
             df = clean_dataframe(df)
             
             # Handle NaT (Not a Time) values in LastSaleDate
@@ -353,10 +332,10 @@ class InventoryAnalytics:
                 df['LastSaleDate'] = df['LastSaleDate'].fillna(pd.Timestamp('1900-01-01'))
             
             # Add formatted currency columns
-            df['FormattedUnitPrice'] = df['UnitPrice'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedStockValue'] = df['StockValue'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedAnnualSalesValue'] = df['AnnualSalesValue'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-            df['FormattedCarryingCost'] = df['MonthlyCarryingCost'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
+            df['FormattedUnitPrice'] = df['UnitPrice'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedStockValue'] = df['StockValue'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedAnnualSalesValue'] = df['AnnualSalesValue'].apply(get_currency_formatter('USD', 'SPISA'))
+            df['FormattedCarryingCost'] = df['MonthlyCarryingCost'].apply(get_currency_formatter('USD', 'SPISA'))
             
             # Add percentage formatting
             df['FormattedTurnoverPercentage'] = df['AnnualTurnoverPercentage'].apply(lambda x: f"{x:.1f}%" if pd.notna(x) else "0.0%")
@@ -446,19 +425,19 @@ class InventoryAnalytics:
             self.logger.error(f"Error calculating stock variation KPIs: {e}")
             return {}
     
-    @cache.cached(timeout=get_cache_timeout('stock_value_evolution'), key_prefix='inventory_stock_value_evolution_%(months)s')
+    @cached_by_args(timeout=get_cache_timeout('stock_value_evolution'), key_prefix='inventory_stock_value_evolution_%(months)s')
     def get_stock_value_evolution(self, months=12):
         """Get historical stock value evolution from StockSnapshots"""
         self.logger.info(f"Executing get_stock_value_evolution for {months} months (cache miss or expired)")
         try:
-            query = self.queries.STOCK_VALUE_EVOLUTION.format(months=months)
-            df = self.db.execute_query(query, 'SPISA')
+            query = self.queries.STOCK_VALUE_EVOLUTION
+            df = self.db.execute_query(query, 'SPISA', {'months': months})
             df = clean_dataframe(df)
 
             if not df.empty:
                 # Format dates
                 df['FormattedDate'] = pd.to_datetime(df['Date']).dt.strftime('%Y-%m-%d')
-                df['FormattedValue'] = df['StockValue'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
+                df['FormattedValue'] = df['StockValue'].apply(get_currency_formatter('USD', 'SPISA'))
 
                 return df.to_dict('records')
             return []
@@ -471,13 +450,13 @@ class InventoryAnalytics:
         """Get detailed analysis of out of stock items with classification"""
         self.logger.info("Executing get_out_of_stock_analysis (cache miss or expired)")
         try:
-            df = self.db.execute_query(self.queries.OUT_OF_STOCK_ANALYSIS, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('OUT_OF_STOCK_ANALYSIS'), 'SPISA')
             df = clean_dataframe(df)
             
             if not df.empty:
                 # Format values
-                df['FormattedUnitPrice'] = df['UnitPrice'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
-                df['FormattedLostSales'] = df['EstimatedLostSales'].apply(lambda x: format_currency(x, 'USD', 'SPISA'))
+                df['FormattedUnitPrice'] = df['UnitPrice'].apply(get_currency_formatter('USD', 'SPISA'))
+                df['FormattedLostSales'] = df['EstimatedLostSales'].apply(get_currency_formatter('USD', 'SPISA'))
                 df['FormattedLastSaleDate'] = pd.to_datetime(df['LastSaleDate']).dt.strftime('%Y-%m-%d')
                 
                 return df.to_dict('records')
@@ -6,9 +6,9 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-from .utils import format_currency, clean_dataframe
-from database.queries import PurchaseQueries
-from cache_config import cache, get_cache_timeout
+from .utils import format_currency, get_currency_formatter, clean_dataframe
+from database.queries import PurchaseQueries, MaterializedQueries
+from cache_config import cache, get_cache_timeout, request_memoize
 
 class PurchaseAnalytics:
     def __init__(self, db_manager):
@@ -16,6 +16,7 @@ class PurchaseAnalytics:
         self.logger = logging.getLogger(__name__)
         self.queries = PurchaseQueries()
     
+    @request_memoize
     def get_reorder_analysis(self, demand_days=90):
         """Get comprehensive reorder analysis with priorities
         
@@ -33,15 +34,16 @@ class PurchaseAnalytics:
         self.logger.info(f"Executing get_reorder_analysis for {demand_days} days (cache miss or expired)")
         try:
             # Format query with demand_days parameter
-            query = self.queries.REORDER_ANALYSIS.format(demand_days=demand_days)
+            query_name = 'REORDER_ANALYSIS_MATERIALIZED' if MaterializedQueries.enabled() else 'REORDER_ANALYSIS'
+            query = self.queries.render(query_name, demand_days=demand_days)
             df = self.db.execute_query(query, 'SPISA')
             df = clean_dataframe(df)
             
             if not df.empty:
                 # Format values
-                df['FormattedUnitPrice'] = df['UnitPrice'].apply(lambda x: format_currency(x, '', 'SPISA'))
-                df['FormattedStockValue'] = df['StockValue'].apply(lambda x: format_currency(x, '', 'SPISA'))
-                df['FormattedOrderValue'] = df['SuggestedOrderValue'].apply(lambda x: format_currency(x, '', 'SPISA'))
+                df['FormattedUnitPrice'] = df['UnitPrice'].apply(get_currency_formatter('', 'SPISA'))
+                df['FormattedStockValue'] = df['StockValue'].apply(get_currency_formatter('', 'SPISA'))
+                df['FormattedOrderValue'] = df['SuggestedOrderValue'].apply(get_currency_formatter('', 'SPISA'))
                 df['FormattedReorderPoint'] = df['ReorderPoint'].apply(lambda x: f"{x:.0f}")
                 df['FormattedDaysOfCoverage'] = df['DaysOfCoverage'].apply(lambda x: f"{x:.0f}" if x < 999 else '∞')
                 df['FormattedExpectedStockoutDate'] = df['ExpectedStockoutDate'].apply(
@@ -63,38 +65,42 @@ class PurchaseAnalytics:
             self.logger.error(f"Error in reorder analysis: {e}")
             return []
     
-    def get_reorder_summary(self):
-        """Get summary KPIs for reorder dashboard"""
+    def get_reorder_summary(self, demand_days=90):
+        """Get summary KPIs for reorder dashboard, over the same demand window as the analysis"""
         try:
-            reorder_data = self.get_reorder_analysis()
+            reorder_data = self.get_reorder_analysis(demand_days)
             
             if not reorder_data:
                 return {}
             
-            df = pd.DataFrame(reorder_data)
+            # Calculate KPIs in a single pass over the cached rows
+            urgent_count = 0
+            high_priority_count = 0
+            total_order_value = 0
+            needs_reorder_count = 0
+            by_supplier = {}
+            by_priority = {}
             
-            # Calculate KPIs
-            urgent_count = len(df[df['Priority'].isin(['OUT_OF_STOCK', 'URGENT'])])
-            high_priority_count = len(df[df['Priority'] == 'HIGH'])
-            total_order_value = df['SuggestedOrderValue'].sum()
-            
-            # Items needing reorder
-            needs_reorder = df[df['SuggestedOrderQuantity'] > 0]
-            
-            # By supplier
-            by_supplier = needs_reorder.groupby('PreferredSupplier').agg({
-                'SuggestedOrderValue': 'sum',
-                'idArticulo': 'count'
-            }).to_dict('index')
-            
-            # By priority
-            by_priority = needs_reorder.groupby('Priority').agg({
-                'SuggestedOrderValue': 'sum',
-                'idArticulo': 'count'
-            }).to_dict('index')
+            for row in reorder_data:
+                priority = row['Priority']
+                order_value = row['SuggestedOrderValue']
+                total_order_value += order_value
+                
+                if priority in ('OUT_OF_STOCK', 'URGENT'):
+                    urgent_count += 1
+                elif priority == 'HIGH':
+                    high_priority_count += 1
+                
+                # Items needing reorder, grouped by supplier and priority
+                if row['SuggestedOrderQuantity'] > 0:
+                    needs_reorder_count += 1
+                    for groups, key in ((by_supplier, row['PreferredSupplier']), (by_priority, priority)):
+                        group = groups.setdefault(key, {'SuggestedOrderValue': 0, 'idArticulo': 0})
+                        group['SuggestedOrderValue'] += order_value
+                        group['idArticulo'] += 1
             
             return {
-                'total_items_to_reorder': len(needs_reorder),
+                'total_items_to_reorder': needs_reorder_count,
                 'urgent_items': urgent_count,
                 'high_priority_items': high_priority_count,
                 'total_order_value': total_order_value,
@@ -113,12 +119,12 @@ class PurchaseAnalytics:
         """Get supplier performance metrics"""
         self.logger.info("Executing get_supplier_performance (cache miss or expired)")
         try:
-            df = self.db.execute_query(self.queries.SUPPLIER_PERFORMANCE, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('SUPPLIER_PERFORMANCE'), 'SPISA')
             df = clean_dataframe(df)
             
             if not df.empty:
                 # Format values
-                df['FormattedStockValue'] = df['CurrentStockValue'].apply(lambda x: format_currency(x, '', 'SPISA'))
+                df['FormattedStockValue'] = df['CurrentStockValue'].apply(get_currency_formatter('', 'SPISA'))
                 df['FormattedPurchaseValue'] = df['TotalPurchaseValue'].apply(lambda x: format_currency(x, '', 'SPISA') if pd.notna(x) else '-')
                 df['FormattedLeadTime'] = df['AvgLeadTimeDays'].apply(lambda x: f"{x:.0f} dias" if pd.notna(x) else 'N/A')
                 
@@ -4,22 +4,29 @@ Provides comprehensive sales analysis capabilities
 """
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import logging
-from .utils import format_currency, calculate_growth_rate, clean_dataframe
-from database.queries import SalesQueries
-from cache_config import cache, get_cache_timeout
+from .utils import format_currency, get_currency_formatter, calculate_growth_rate, clean_dataframe
+from database.queries import MaterializedQueries, SalesQueries, XERP_BILLS_RANGES, XERP_CUSTOMER_COUNT
+from cache_config import cache, cached_by_args, get_cache_timeout
+
+# Argentina time, which the xERP SQL uses as 'now' (DATEADD(HOUR, -3, GETDATE()))
+ARGENTINA_TZ = timezone(timedelta(hours=-3))
 
 class SalesAnalytics:
+    # Customers kept in the hourly xERP top-customer snapshot; smaller limits are sliced from it
+    TOP_CUSTOMERS_SNAPSHOT = 50
+    
     def __init__(self, db_manager):
         self.db = db_manager
         self.logger = logging.getLogger(__name__)
         self.queries = SalesQueries()
     
-    def get_summary(self):
-        """Get sales summary metrics from xERP database"""
+    def get_summary(self, precise=False):
+        """Get sales summary metrics from xERP database (approximate customer count unless precise)"""
         try:
-            df = self.db.execute_query(self.queries.XERP_SALES_SUMMARY, 'xERP')
+            query = self.queries.render('XERP_SALES_SUMMARY', customer_count=XERP_CUSTOMER_COUNT[precise])
+            df = self.db.execute_query(query, 'xERP')
             df = clean_dataframe(df)
             
             if not df.empty:
@@ -39,18 +46,34 @@ class SalesAnalytics:
             self.logger.error(f"Error getting sales summary: {e}")
             return {}
     
+    def get_monthly_trends(self, precise=False):
+        """Get monthly sales trends from xERP database (approximate customer counts unless precise)"""
+        if precise:
+            # Exact counts are for occasional audits; keep them out of the shared cache entry
+            return self._monthly_trends(precise=True)
+        return self._cached_monthly_trends()
+    
     @cache.cached(timeout=get_cache_timeout('monthly_trends'), key_prefix='sales_monthly_trends')
-    def get_monthly_trends(self):
-        """Get monthly sales trends from xERP database"""
+    def _cached_monthly_trends(self):
+        return self._monthly_trends(precise=False)
+    
+    def _monthly_trends(self, precise):
         self.logger.info("Executing get_monthly_trends (cache miss or expired)")
         try:
-            df = self.db.execute_query(self.queries.XERP_MONTHLY_SALES_TREND, 'xERP')
-            df = clean_dataframe(df)
+            # Closed months come from the long-lived query cache; only the current month is rescanned
+            month_start = datetime.now(ARGENTINA_TZ).replace(day=1, hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+            customer_count = XERP_CUSTOMER_COUNT[precise]
+            history_future = self.db.submit_query(
+                self.queries.render('XERP_MONTHLY_SALES_HISTORY', customer_count=customer_count), 'xERP', (month_start,))
+            current = self.db.execute_query(
+                self.queries.render('XERP_MONTHLY_SALES_CURRENT', customer_count=customer_count), 'xERP', (month_start,))
+            history = history_future.result()
+            df = clean_dataframe(pd.concat([current, history], ignore_index=True))
             
             if not df.empty:
                 # Add formatted columns (xERP data = ARS)
-                df['FormattedRevenue'] = df['MonthlyRevenue'].apply(lambda x: format_currency(x, 'ARS', 'xERP'))
-                df['MonthYearLabel'] = df.apply(lambda x: f"{x['MonthName']} {x['Year']}", axis=1)
+                df['FormattedRevenue'] = df['MonthlyRevenue'].apply(get_currency_formatter('ARS', 'xERP'))
+                df['MonthYearLabel'] = df['MonthName'].astype(str) + ' ' + df['Year'].astype(str)
                 
                 # Calculate month-over-month growth manually since xERP query doesn't include it
                 df = df.sort_values(['Year', 'Month'])
@@ -68,9 +91,10 @@ class SalesAnalytics:
     def get_xerp_top_customers(self, limit=10):
         """Get top customers from xERP system"""
         try:
-            query = self.queries.XERP_TOP_CUSTOMERS.format(limit=limit)
-            df = self.db.execute_query(query, 'xERP')
-            df = clean_dataframe(df)
+            # Every limit up to the snapshot size shares one cached ranking
+            query = self.queries.XERP_TOP_CUSTOMERS
+            df = self.db.execute_query(query, 'xERP', (max(limit, self.TOP_CUSTOMERS_SNAPSHOT),))
+            df = clean_dataframe(df.head(limit).copy())
             
             # Add formatted columns
             df['FormattedRevenue'] = df['TotalRevenue'].apply(format_currency)
@@ -82,8 +106,10 @@ class SalesAnalytics:
             self.logger.error(f"Error getting xERP top customers: {e}")
             return []
     
+    @cached_by_args(timeout=get_cache_timeout('sales_performance'), key_prefix='sales_performance_%(period)s')
     def get_sales_performance_by_period(self, period='month'):
         """Get sales performance by different time periods"""
+        self.logger.info("Executing get_sales_performance_by_period (cache miss or expired)")
         try:
             if period == 'month':
                 period_query = """
@@ -146,15 +172,13 @@ class SalesAnalytics:
                 df['RevenueGrowth'] = df['RevenueGrowth'].fillna(0)
                 
                 # Format currency for xERP (ARS)
-                df['FormattedRevenue'] = df['Revenue'].apply(lambda x: format_currency(x, 'ARS', 'xERP'))
+                df['FormattedRevenue'] = df['Revenue'].apply(get_currency_formatter('ARS', 'xERP'))
                 df['AvgTransactionSize'] = df['Revenue'] / df['TransactionCount']
-                df['FormattedAvgTransaction'] = df['AvgTransactionSize'].apply(lambda x: format_currency(x, 'ARS', 'xERP'))
+                df['FormattedAvgTransaction'] = df['AvgTransactionSize'].apply(get_currency_formatter('ARS', 'xERP'))
                 
                 # Create period labels for display
-                if period == 'month':
-                    df['PeriodLabel'] = df.apply(lambda x: f"{x['PeriodName']} {x['Year']}", axis=1)
-                elif period == 'quarter':
-                    df['PeriodLabel'] = df.apply(lambda x: f"{x['PeriodName']} {x['Year']}", axis=1)
+                if period in ('month', 'quarter'):
+                    df['PeriodLabel'] = df['PeriodName'].astype(str) + ' ' + df['Year'].astype(str)
                 else:
                     df['PeriodLabel'] = df['Year'].astype(str)
                 
@@ -171,39 +195,7 @@ class SalesAnalytics:
         """Segment customers based on sales behavior"""
         self.logger.info("Executing get_customer_segmentation (cache miss or expired)")
         try:
-            segmentation_query = """
-            WITH "CustomerSales" AS (
-                SELECT
-                    c.name,
-                    COUNT(t.id) as "TransactionCount",
-                    SUM(t.invoice_amount) as "TotalRevenue",
-                    AVG(t.invoice_amount) as "AvgInvoiceSize",
-                    EXTRACT(EPOCH FROM (MAX(t.invoice_date) - MIN(t.invoice_date))) / 86400 as "CustomerLifespanDays",
-                    MAX(t.invoice_date) as "LastPurchaseDate",
-                    EXTRACT(EPOCH FROM (NOW() - MAX(t.invoice_date))) / 86400 as "DaysSinceLastPurchase"
-                FROM sync_customers c
-                INNER JOIN sync_transactions t ON c.id = t.customer_id
-                WHERE t.type = 1
-                AND t.invoice_date >= NOW() - INTERVAL '2 years'
-                AND t.invoice_date > '2020-01-01'
-                GROUP BY c.id, c.name
-            )
-            SELECT
-                *,
-                CASE
-                    WHEN "TotalRevenue" > 500000 AND "DaysSinceLastPurchase" < 90 THEN 'Champions'
-                    WHEN "TotalRevenue" > 200000 AND "DaysSinceLastPurchase" < 180 THEN 'Loyal Customers'
-                    WHEN "TotalRevenue" > 100000 AND "DaysSinceLastPurchase" < 365 THEN 'Potential Loyalists'
-                    WHEN "DaysSinceLastPurchase" < 90 THEN 'New Customers'
-                    WHEN "DaysSinceLastPurchase" > 365 THEN 'At Risk'
-                    ELSE 'Regular Customers'
-                END as "CustomerSegment",
-                "TotalRevenue" / NULLIF("CustomerLifespanDays", 0) * 365 as "AnnualizedRevenue"
-            FROM "CustomerSales"
-            ORDER BY "TotalRevenue" DESC
-            """
-            
-            df = self.db.execute_query(segmentation_query, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('CUSTOMER_SEGMENTATION'), 'SPISA')
             df = clean_dataframe(df)
             
             # Add formatted columns
@@ -216,31 +208,12 @@ class SalesAnalytics:
             self.logger.error(f"Error in customer segmentation: {e}")
             return []
     
+    @cache.cached(timeout=get_cache_timeout('product_performance'), key_prefix='sales_product_performance')
     def get_product_performance(self):
         """Analyze product sales performance"""
+        self.logger.info("Executing get_product_performance (cache miss or expired)")
         try:
-            product_query = """
-            SELECT
-                a.description as "ProductName",
-                c.name as "Category",
-                SUM(soi.quantity) as "TotalQuantitySold",
-                SUM(soi.quantity * a.unit_price) as "TotalRevenue",
-                COUNT(DISTINCT so.id) as "OrderCount",
-                AVG(a.unit_price) as "AvgSellingPrice",
-                MAX(so.order_date) as "LastSaleDate"
-            FROM sales_order_items soi
-            INNER JOIN sales_orders so ON soi.sales_order_id = so.id
-            INNER JOIN articles a ON soi.article_id = a.id
-            INNER JOIN categories c ON a.category_id = c.id
-            WHERE so.order_date >= NOW() - INTERVAL '1 years'
-            AND a.deleted_at IS NULL
-            AND so.deleted_at IS NULL
-            AND a.is_discontinued = false
-            GROUP BY a.id, a.description, c.name
-            ORDER BY "TotalRevenue" DESC
-            """
-            
-            df = self.db.execute_query(product_query, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('PRODUCT_PERFORMANCE'), 'SPISA')
             df = clean_dataframe(df)
             
             if not df.empty:
@@ -258,25 +231,12 @@ class SalesAnalytics:
             self.logger.error(f"Error in product performance analysis: {e}")
             return []
     
+    @cache.cached(timeout=get_cache_timeout('seasonal_analysis'), key_prefix='sales_seasonal_analysis')
     def get_seasonal_analysis(self):
         """Analyze seasonal sales patterns"""
+        self.logger.info("Executing get_seasonal_analysis (cache miss or expired)")
         try:
-            seasonal_query = """
-            SELECT
-                EXTRACT(MONTH FROM invoice_date)::int as "Month",
-                TO_CHAR(invoice_date, 'Month') as "MonthName",
-                AVG(invoice_amount) as "AvgMonthlyRevenue",
-                COUNT(*) as "AvgTransactionCount",
-                STDDEV(invoice_amount) as "RevenueVolatility"
-            FROM sync_transactions
-            WHERE type = 1
-            AND invoice_date >= NOW() - INTERVAL '3 years'
-            AND invoice_date > '2020-01-01'
-            GROUP BY EXTRACT(MONTH FROM invoice_date)::int, TO_CHAR(invoice_date, 'Month')
-            ORDER BY "Month"
-            """
-            
-            df = self.db.execute_query(seasonal_query, 'SPISA')
+            df = self.db.execute_query(MaterializedQueries.resolve('SEASONAL_ANALYSIS'), 'SPISA')
             df = clean_dataframe(df)
             
             if not df.empty:
@@ -286,59 +246,56 @@ class SalesAnalytics:
                 df['FormattedRevenue'] = df['AvgMonthlyRevenue'].apply(format_currency)
                 
                 # Categorize seasons
-                df['SeasonCategory'] = df['SeasonalityIndex'].apply(self._categorize_season)
+                index = df['SeasonalityIndex'].to_numpy(dtype=float, na_value=np.nan)
+                df['SeasonCategory'] = np.select(
+                    [index > 120, index > 110, index < 80, index < 90],
+                    ['Peak Season', 'High Season', 'Low Season', 'Slow Season'],
+                    'Normal Season'
+                )
                 
             return df.to_dict('records')
         except Exception as e:
             self.logger.error(f"Error in seasonal analysis: {e}")
             return []
     
+    @cache.cached(timeout=get_cache_timeout('sales_kpis'), key_prefix='sales_kpis')
     def get_sales_kpis(self):
         """Calculate key sales KPIs"""
+        self.logger.info("Executing get_sales_kpis (cache miss or expired)")
         try:
-            # Current vs previous period comparison
-            current_period_query = """
+            # Current vs previous period comparison in a single scan
+            kpis_query = """
             SELECT
-                SUM(invoice_amount) as "CurrentRevenue",
-                COUNT(*) as "CurrentTransactions",
-                COUNT(DISTINCT customer_id) as "CurrentCustomers",
-                AVG(invoice_amount) as "CurrentAvgInvoice"
-            FROM sync_transactions
-            WHERE type = 1
-            AND invoice_date >= NOW() - INTERVAL '1 months'
-            AND invoice_date > '2020-01-01'
-            """
-
-            previous_period_query = """
-            SELECT
-                SUM(invoice_amount) as "PreviousRevenue",
-                COUNT(*) as "PreviousTransactions",
-                COUNT(DISTINCT customer_id) as "PreviousCustomers",
-                AVG(invoice_amount) as "PreviousAvgInvoice"
+                SUM(invoice_amount) FILTER (WHERE invoice_date >= NOW() - INTERVAL '1 months') as "CurrentRevenue",
+                COUNT(*) FILTER (WHERE invoice_date >= NOW() - INTERVAL '1 months') as "CurrentTransactions",
+                COUNT(DISTINCT customer_id) FILTER (WHERE invoice_date >= NOW() - INTERVAL '1 months') as "CurrentCustomers",
+                AVG(invoice_amount) FILTER (WHERE invoice_date >= NOW() - INTERVAL '1 months') as "CurrentAvgInvoice",
+                SUM(invoice_amount) FILTER (WHERE invoice_date < NOW() - INTERVAL '1 months') as "PreviousRevenue",
+                COUNT(*) FILTER (WHERE invoice_date < NOW() - INTERVAL '1 months') as "PreviousTransactions",
+                COUNT(DISTINCT customer_id) FILTER (WHERE invoice_date < NOW() - INTERVAL '1 months') as "PreviousCustomers",
+                AVG(invoice_amount) FILTER (WHERE invoice_date < NOW() - INTERVAL '1 months') as "PreviousAvgInvoice"
             FROM sync_transactions
             WHERE type = 1
             AND invoice_date >= NOW() - INTERVAL '2 months'
-            AND invoice_date < NOW() - INTERVAL '1 months'
+            AND invoice_date > '2020-01-01'
             """
             
-            current_df = self.db.execute_query(current_period_query, 'SPISA')
-            previous_df = self.db.execute_query(previous_period_query, 'SPISA')
+            df = self.db.execute_query(kpis_query, 'SPISA')
             
-            if not current_df.empty and not previous_df.empty:
-                current = current_df.iloc[0]
-                previous = previous_df.iloc[0]
+            if not df.empty:
+                row = df.iloc[0]
                 
                 return {
-                    'current_revenue': float(current['CurrentRevenue']),
-                    'current_transactions': int(current['CurrentTransactions']),
-                    'current_customers': int(current['CurrentCustomers']),
-                    'current_avg_invoice': float(current['CurrentAvgInvoice']),
-                    'revenue_growth': calculate_growth_rate(current['CurrentRevenue'], previous['PreviousRevenue']),
-                    'transaction_growth': calculate_growth_rate(current['CurrentTransactions'], previous['PreviousTransactions']),
-                    'customer_growth': calculate_growth_rate(current['CurrentCustomers'], previous['PreviousCustomers']),
+                    'current_revenue': float(row['CurrentRevenue']),
+                    'current_transactions': int(row['CurrentTransactions']),
+                    'current_customers': int(row['CurrentCustomers']),
+                    'current_avg_invoice': float(row['CurrentAvgInvoice']),
+                    'revenue_growth': calculate_growth_rate(row['CurrentRevenue'], row['PreviousRevenue']),
+                    'transaction_growth': calculate_growth_rate(row['CurrentTransactions'], row['PreviousTransactions']),
+                    'customer_growth': calculate_growth_rate(row['CurrentCustomers'], row['PreviousCustomers']),
                     'formatted': {
-                        'current_revenue': format_currency(current['CurrentRevenue']),
-                        'current_avg_invoice': format_currency(current['CurrentAvgInvoice'])
+                        'current_revenue': format_currency(row['CurrentRevenue']),
+                        'current_avg_invoice': format_currency(row['CurrentAvgInvoice'])
                     }
                 }
             
@@ -347,21 +304,10 @@ class SalesAnalytics:
             self.logger.error(f"Error calculating sales KPIs: {e}")
             return {}
     
-    def _categorize_season(self, seasonality_index):
-        """Categorize seasonal performance"""
-        if seasonality_index > 120:
-            return 'Peak Season'
-        elif seasonality_index > 110:
-            return 'High Season'
-        elif seasonality_index < 80:
-            return 'Low Season'
-        elif seasonality_index < 90:
-            return 'Slow Season'
-        else:
-            return 'Normal Season'
-    
+    @cached_by_args(timeout=get_cache_timeout('sales_forecast'), key_prefix='sales_forecast_%(months_ahead)s')
     def get_sales_forecast(self, months_ahead=6):
         """Generate simple sales forecast based on trends"""
+        self.logger.info("Executing get_sales_forecast (cache miss or expired)")
         try:
             # Get historical data for trend analysis
             historical_query = """
@@ -385,54 +331,50 @@ class SalesAnalytics:
                 df['Period'] = range(len(df))
                 
                 # Calculate trend using simple linear regression
-                x = df['Period'].values
-                y = df['MonthlyRevenue'].values
+                x = df['Period'].values.astype(float)
+                y = df['MonthlyRevenue'].values.astype(float)
                 
-                # Simple trend calculation
-                trend = np.polyfit(x, y, 1)[0]  # slope
+                # Closed-form least-squares slope (avoids the lstsq/SVD in np.polyfit)
                 avg_revenue = y.mean()
+                x_dev = x - x.mean()
+                trend = (x_dev * (y - avg_revenue)).sum() / (x_dev * x_dev).sum()
                 
-                # Generate forecast
-                forecast = []
-                last_period = len(df) - 1
-                
-                for i in range(1, months_ahead + 1):
-                    forecast_period = last_period + i
-                    forecast_revenue = avg_revenue + (trend * forecast_period)
-                    
-                    # Add some seasonality based on historical patterns
-                    month_index = (forecast_period % 12)
-                    seasonal_factor = self._get_seasonal_factor(df, month_index)
-                    forecast_revenue *= seasonal_factor
-                    
-                    forecast.append({
-                        'period': forecast_period,
-                        'forecast_revenue': max(0, forecast_revenue),  # Ensure non-negative
-                        'formatted_forecast': format_currency(max(0, forecast_revenue))
-                    })
+                # Generate the whole horizon at once, with seasonality from historical patterns
+                periods = np.arange(len(df), len(df) + months_ahead)
+                seasonal_factors = self._get_seasonal_factors(y)
+                revenues = (avg_revenue + trend * periods) * seasonal_factors[periods % 12]
+                revenues = np.maximum(revenues, 0)  # Ensure non-negative
                 
-                return forecast
+                return [
+                    {
+                        'period': int(period),
+                        'forecast_revenue': float(revenue),
+                        'formatted_forecast': format_currency(revenue)
+                    }
+                    for period, revenue in zip(periods, revenues)
+                ]
             
             return []
         except Exception as e:
             self.logger.error(f"Error generating sales forecast: {e}")
             return []
     
-    def _get_seasonal_factor(self, df, month_index):
-        """Calculate seasonal factor for forecasting"""
-        try:
-            # Simple seasonal adjustment based on historical data
-            if len(df) >= 12:
-                monthly_avg = df.groupby(df.index % 12)['MonthlyRevenue'].mean()
-                overall_avg = df['MonthlyRevenue'].mean()
-                return monthly_avg.iloc[month_index] / overall_avg if overall_avg > 0 else 1.0
-            return 1.0  # No seasonal adjustment if insufficient data
-        except:
-            return 1.0
+    def _get_seasonal_factors(self, revenue):
+        """Seasonal factor of each of the 12 period positions for forecasting: the average
+        revenue at that position over the overall average"""
+        overall_avg = revenue.mean()
+        # No seasonal adjustment if insufficient data
+        if len(revenue) < 12 or not overall_avg > 0:
+            return np.ones(12)
+        positions = np.arange(len(revenue)) % 12
+        monthly_avg = np.bincount(positions, weights=revenue, minlength=12) / np.bincount(positions, minlength=12)
+        return monthly_avg / overall_avg
     
     # Retool-compatible methods
+    @cache.cached(timeout=get_cache_timeout('billing_monthly'), key_prefix='sales_billed_monthly')
     def get_xerp_billed_monthly(self):
         """Get xERP monthly billing exactly as in Retool"""
+        self.logger.info("Executing get_xerp_billed_monthly (cache miss or expired)")
         try:
             df = self.db.execute_query(self.queries.XERP_BILLED_MONTHLY, 'xERP')
             df = clean_dataframe(df)
@@ -443,8 +385,10 @@ class SalesAnalytics:
             self.logger.error(f"Error getting xERP monthly billing: {e}")
             return {'BilledMonthly': 0}
     
+    @cache.cached(timeout=get_cache_timeout('billing_today'), key_prefix='sales_billed_today')
     def get_xerp_billed_today(self):
         """Get xERP today billing exactly as in Retool"""
+        self.logger.info("Executing get_xerp_billed_today (cache miss or expired)")
         try:
             df = self.db.execute_query(self.queries.XERP_BILLED_TODAY, 'xERP')
             df = clean_dataframe(df)
@@ -458,7 +402,11 @@ class SalesAnalytics:
     def get_xerp_bills(self, view_filter='month'):
         """Get xERP bills exactly as in Retool"""
         try:
-            query = self.queries.XERP_BILLS.format(view_filter=view_filter)
+            bounds = XERP_BILLS_RANGES.get(view_filter)
+            if bounds is None:
+                return []
+            start, end = bounds
+            query = self.queries.render('XERP_BILLS', start=start, end=end)
             df = self.db.execute_query(query, 'xERP')
             df = clean_dataframe(df)
             return df.to_dict('records')
@@ -4,25 +4,35 @@ Utility functions for analytics
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from functools import lru_cache
 
 def format_currency(amount, currency_symbol='USD', database_source=None):
     """Format amount as currency with explicit currency code based on database source"""
-    if pd.isna(amount) or amount is None:
-        return f"{currency_symbol} 0"
+    return get_currency_formatter(currency_symbol, database_source)(amount)
+
+def _make_formatter(currency_symbol):
+    """Build a currency formatter with the symbol already resolved"""
+    zero = f"{currency_symbol} 0"
     
-    # Auto-detect currency based on database source ONLY if currency_symbol is the default 'USD'
-    if database_source and currency_symbol == 'USD':
-        if database_source.upper() == 'SPISA':
-            currency_symbol = 'USD'
-        elif database_source.upper() == 'XERP':
-            currency_symbol = 'ARS'
+    def formatter(amount):
+        if amount is None or pd.isna(amount):
+            return zero
+        if amount >= 1000000:
+            return f"{currency_symbol} {amount/1000000:.1f}M"
+        elif amount >= 1000:
+            return f"{currency_symbol} {amount/1000:.1f}K"
+        else:
+            return f"{currency_symbol} {amount:,.2f}"
     
-    if amount >= 1000000:
-        return f"{currency_symbol} {amount/1000000:.1f}M"
-    elif amount >= 1000:
-        return f"{currency_symbol} {amount/1000:.1f}K"
-    else:
-        return f"{currency_symbol} {amount:,.2f}"
+    return formatter
+
+@lru_cache(maxsize=None)
+def get_currency_formatter(currency_symbol='USD', database_source=None):
+    """Get a one-argument formatter specialized for a (symbol, database) pair, for use with Series.apply"""
+    # Auto-detect currency based on database source ONLY if currency_symbol is the default 'USD'
+    if database_source and currency_symbol == 'USD' and database_source.upper() == 'XERP':
+        currency_symbol = 'ARS'
+    return _make_formatter(currency_symbol)
 
 def calculate_growth_rate(current, previous):
     """Calculate growth rate percentage"""
@@ -30,29 +40,17 @@ def calculate_growth_rate(current, previous):
         return 0
     return ((current - previous) / previous) * 100
 
-def calculate_risk_score(row):
-    """Calculate risk score based on multiple factors"""
-    score = 0
-    
+def calculate_risk_scores(df):
+    """Risk score of every row based on multiple factors, computed on whole columns"""
     # Overdue percentage weight
-    overdue_pct = row.get('OverduePercentage', 0)
-    if overdue_pct > 50:
-        score += 40
-    elif overdue_pct > 20:
-        score += 20
-    elif overdue_pct > 10:
-        score += 10
+    overdue_pct = df['OverduePercentage'].to_numpy(dtype=float, na_value=np.nan)
+    score = np.select([overdue_pct > 50, overdue_pct > 20, overdue_pct > 10], [40, 20, 10], 0)
     
     # Balance size weight
-    balance = row.get('CurrentBalance', 0)
-    if balance > 1000000:
-        score += 30
-    elif balance > 500000:
-        score += 20
-    elif balance > 100000:
-        score += 10
+    balance = df['CurrentBalance'].to_numpy(dtype=float, na_value=np.nan)
+    score += np.select([balance > 1000000, balance > 500000, balance > 100000], [30, 20, 10], 0)
     
-    return min(score, 100)  # Cap at 100
+    return np.minimum(score, 100)  # Cap at 100
 
 def categorize_stock_movement(days_since_sale):
     """Categorize stock based on movement"""
@@ -90,7 +88,7 @@ def clean_dataframe(df):
     df[numeric_columns] = df[numeric_columns].fillna(0)
     
     # Replace NaN in string columns with empty string
-    string_columns = df.select_dtypes(include=['object']).columns
+    string_columns = df.select_dtypes(include=['object', 'string']).columns
     df[string_columns] = df[string_columns].fillna('')
     
     return df
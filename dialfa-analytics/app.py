@@ -3,27 +3,39 @@ Dialfa Business Intelligence Dashboard
 Main Flask Application
 """
 
-from flask import Flask, render_template, jsonify, request, send_file, session
+from flask import Flask, render_template, jsonify, request, redirect, flash, send_from_directory, session, g
 import os
+import importlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
-import traceback
-from flask_babel import Babel, _, get_locale
-from flask_login import LoginManager, login_required, current_user
+from flask_babel import Babel, _
+from flask_login import LoginManager, login_required, login_url, current_user
 from config import Config
 
 # Import cache configuration
-from cache_config import init_cache, cache
+from cache_config import init_cache, cache, get_cache_timeout
 
-# Import our custom modules
-from database.connection import DatabaseManager
-from analytics.financial import FinancialAnalytics
-from analytics.inventory import InventoryAnalytics
-from analytics.sales import SalesAnalytics
-from analytics.purchase import PurchaseAnalytics
+# orjson is optional; fall back to Flask's stdlib JSON provider without it
+try:
+    from json_provider import OrjsonProvider
+except ImportError:
+    OrjsonProvider = None
+
+# Flask-Compress is optional; responses are sent uncompressed without it
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+# Import our custom modules (analytics modules are imported lazily, see ANALYTICS_MODULES)
+from database.connection import DatabaseManager, start_query_count
+from database.queries import MaterializedQueries
+from jobs.refresh_matviews import start_refresh_scheduler
 
 # Import authentication
 from auth.models import get_user_by_id
+from auth.decorators import is_api_request
 
 # Import routes
 from routes.dashboard import dashboard_bp
@@ -35,15 +47,53 @@ from routes.retool_compat import retool_bp
 from routes.cache_admin import cache_admin_bp
 from auth.routes import auth_bp
 
+# App attribute -> (module, class) for analytics built on first access
+ANALYTICS_MODULES = {
+    'financial_analytics': ('analytics.financial', 'FinancialAnalytics'),
+    'inventory_analytics': ('analytics.inventory', 'InventoryAnalytics'),
+    'sales_analytics': ('analytics.sales', 'SalesAnalytics'),
+    'purchase_analytics': ('analytics.purchase', 'PurchaseAnalytics'),
+}
+
+# (threshold, suffix) pairs for the currency template filter, largest first
+CURRENCY_SCALES = ((1000000, 'M'), (1000, 'K'))
+
+class DialfaFlask(Flask):
+    """Flask app that imports and instantiates analytics modules on first access"""
+    
+    def __getattr__(self, name):
+        if name not in ANALYTICS_MODULES or 'db_manager' not in self.__dict__:
+            raise AttributeError(name)
+        module_name, class_name = ANALYTICS_MODULES[name]
+        try:
+            analytics_class = getattr(importlib.import_module(module_name), class_name)
+            instance = analytics_class(self.db_manager)
+            self.logger.info("Analytics module %s initialized", class_name)
+        except Exception as e:
+            self.logger.error("Failed to initialize %s: %s", class_name, e)
+            raise
+        # Store on the instance so later lookups bypass __getattr__
+        setattr(self, name, instance)
+        return instance
+
 def create_app():
     """Application factory pattern"""
-    app = Flask(__name__)
+    app = DialfaFlask(__name__)
+    
+    # Match routes with or without a trailing slash instead of answering with a 308 redirect
+    app.url_map.strict_slashes = False
     
-    # Configuration
-    app.config['SECRET_KEY'] = 'dialfa-analytics-2025'
-    app.config['DEBUG'] = True
+    # Configuration (DEBUG comes from FLASK_DEBUG, off unless explicitly enabled)
     app.config.from_object(Config)
     
+    # Faster JSON serialization for all API responses
+    if OrjsonProvider is not None:
+        app.json = OrjsonProvider(app)
+    
+    # Brotli/gzip for responses above COMPRESS_MIN_SIZE (see Config)
+    if Compress is not None:
+        Compress(app)
+    
     # Initialize Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -56,6 +106,14 @@ def create_app():
         """Load user by ID for Flask-Login"""
         return get_user_by_id(user_id)
     
+    @login_manager.unauthorized_handler
+    def unauthorized():
+        """Answer API calls with 401 JSON instead of a login redirect"""
+        if is_api_request():
+            return jsonify({'error': 'Authentication required', 'status': 'error'}), 401
+        flash(login_manager.login_message, login_manager.login_message_category)
+        return redirect(login_url(login_manager.login_view, request.url))
+    
     # Initialize cache
     init_cache(app)
     app.logger.info("Cache system initialized")
@@ -63,20 +121,32 @@ def create_app():
     # Initialize Babel for internationalization
     babel = Babel()
     
+    # Language codes as a tuple so best_match doesn't rebuild a keys view per call,
+    # and as a frozenset for membership checks
+    supported_languages = tuple(app.config['LANGUAGES'])
+    supported_language_set = frozenset(supported_languages)
+    
     def get_locale():
+        # Resolve once per request; templates call this repeatedly
+        if '_locale' in g:
+            return g._locale
+        g._locale = _select_locale()
+        return g._locale
+    
+    def _select_locale():
         # 1. Check if language is set in session
         if 'language' in session:
             lang = session['language']
-            app.logger.info(f"Language from session: {lang}")
+            app.logger.info("Language from session: %s", lang)
             return lang
         # 2. Check if language is in URL parameters
         if request.args.get('lang'):
             session['language'] = request.args.get('lang')
-            app.logger.info(f"Language from URL: {session['language']}")
+            app.logger.info("Language from URL: %s", session['language'])
             return session['language']
         # 3. Use browser's preferred language
-        default_lang = request.accept_languages.best_match(app.config['LANGUAGES'].keys()) or app.config['BABEL_DEFAULT_LOCALE']
-        app.logger.info(f"Language from browser/default: {default_lang}")
+        default_lang = request.accept_languages.best_match(supported_languages) or app.config['BABEL_DEFAULT_LOCALE']
+        app.logger.info("Language from browser/default: %s", default_lang)
         return default_lang
     
     babel.init_app(app, locale_selector=get_locale)
@@ -94,35 +164,32 @@ def create_app():
     
     # Setup logging
     logging.basicConfig(
-        level=logging.INFO,
+        level=app.config['LOG_LEVEL'],
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     
     # Initialize database manager
     try:
-        db_manager = DatabaseManager()
+        db_manager = DatabaseManager(
+            pool_size=app.config['DB_POOL_SIZE'],
+            max_overflow=app.config['DB_MAX_OVERFLOW'],
+            pool_timeout=app.config['DB_POOL_TIMEOUT'],
+            pool_recycle=app.config['DB_POOL_RECYCLE'],
+            pool_pre_ping=app.config['DB_POOL_PRE_PING']
+        )
         app.logger.info("Database manager initialized successfully")
     except Exception as e:
-        app.logger.error(f"Failed to initialize database manager: {e}")
+        app.logger.error("Failed to initialize database manager: %s", e)
         raise
     
-    # Initialize analytics modules
-    try:
-        financial_analytics = FinancialAnalytics(db_manager)
-        inventory_analytics = InventoryAnalytics(db_manager)
-        sales_analytics = SalesAnalytics(db_manager)
-        purchase_analytics = PurchaseAnalytics(db_manager)
-        app.logger.info("Analytics modules initialized successfully")
-    except Exception as e:
-        app.logger.error(f"Failed to initialize analytics modules: {e}")
-        raise
-    
-    # Store in app context for access in routes
+    # Store in app context for access in routes; analytics modules are
+    # created on first use through DialfaFlask.__getattr__
     app.db_manager = db_manager
-    app.financial_analytics = financial_analytics
-    app.inventory_analytics = inventory_analytics
-    app.sales_analytics = sales_analytics
-    app.purchase_analytics = purchase_analytics
+    app.analytics_pool = ThreadPoolExecutor(max_workers=app.config['ANALYTICS_WORKERS'], thread_name_prefix='analytics')
+    
+    # Keep the materialized views fresh without an external cron job
+    if app.config['MATVIEW_REFRESH_MINUTES'] > 0 and MaterializedQueries.enabled():
+        start_refresh_scheduler(db_manager, app.config['MATVIEW_REFRESH_MINUTES'])
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/auth')
@@ -134,6 +201,21 @@ def create_app():
     app.register_blueprint(purchase_bp, url_prefix='/purchase')
     app.register_blueprint(retool_bp)
     
+    @app.before_request
+    def count_queries():
+        """Count this request's queries, including those its worker threads run"""
+        g.query_counter = start_query_count()
+    
+    @app.after_request
+    def warn_query_count(response):
+        """Flag requests that ran suspiciously many queries (see DatabaseManager._count_query)"""
+        limit = app.config['QUERY_COUNT_WARNING']
+        counter = g.get('query_counter')
+        query_count = counter.count if counter else 0
+        if limit and query_count > limit:
+            app.logger.warning("%s %s ran %d database queries", request.method, request.path, query_count)
+        return response
+    
     @app.route('/')
     @login_required
     def index():
@@ -141,7 +223,7 @@ def create_app():
         try:
             return render_template('dashboard.html')
         except Exception as e:
-            app.logger.error(f"Error rendering dashboard: {e}")
+            app.logger.error("Error rendering dashboard: %s", e)
             return render_template('error.html', error=str(e)), 500
     
     @app.route('/api/health')
@@ -162,16 +244,26 @@ def create_app():
                 'timestamp': datetime.now().isoformat()
             }), 500
     
+    def is_ok_response(rv):
+        """response_filter for @cache.cached: keep only 200 responses, so an outage isn't served from cache"""
+        status = rv[1] if isinstance(rv, tuple) else getattr(rv, 'status_code', 200)
+        return status == 200
+    
     @app.route('/api/system-info')
+    @cache.cached(timeout=get_cache_timeout('health_check'), key_prefix='system_info', response_filter=is_ok_response)
     def system_info():
         """Get system information"""
         try:
             # Test both databases
             spisa_status = db_manager.test_connection()
             
-            # Get basic table counts
-            customer_count = db_manager.execute_scalar("SELECT COUNT(*) FROM Customers", 'SPISA')
-            transaction_count = db_manager.execute_scalar("SELECT COUNT(*) FROM Transactions", 'SPISA')
+            # Get basic table counts in a single round-trip
+            counts = db_manager.execute_scalar_batch({
+                'customers': "SELECT COUNT(*) FROM Customers",
+                'transactions': "SELECT COUNT(*) FROM Transactions"
+            }, 'SPISA')
+            customer_count = counts['customers']
+            transaction_count = counts['transactions']
             
             return jsonify({
                 'databases': {
@@ -185,20 +277,25 @@ def create_app():
                 'last_updated': datetime.now().isoformat()
             })
         except Exception as e:
-            app.logger.error(f"System info error: {e}")
+            app.logger.error("System info error: %s", e)
             return jsonify({'error': str(e)}), 500
     
     @app.route('/favicon.ico')
     def favicon():
-        """Serve favicon"""
-        return '', 204  # No content
+        """Serve favicon with long-lived cache headers so browsers stop re-requesting it"""
+        if os.path.isfile(os.path.join(app.static_folder, 'favicon.ico')):
+            response = send_from_directory(app.static_folder, 'favicon.ico', mimetype='image/x-icon')
+        else:
+            response = app.response_class(status=204)  # No content
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
     
     @app.route('/set_language/<language>')
     def set_language(language=None):
         """Set the language preference"""
-        if language in app.config['LANGUAGES']:
+        if language in supported_language_set:
             session['language'] = language
-            app.logger.info(f"Language set to: {language}")
+            app.logger.info("Language set to: %s", language)
         return jsonify({'status': 'success', 'language': session.get('language', 'es')})
     
     @app.route('/clear_session')
@@ -257,33 +354,39 @@ def create_app():
                 'headers': dict(request.headers)
             }), 500
     
+    # Rendered error pages for anonymous visitors, keyed by (code, message, locale, endpoint)
+    error_pages = {}
+    
+    def render_error_page(error, error_code):
+        """Render error.html, reusing the rendered page when it has no per-user content"""
+        # Only supported locales are cached: ?lang= is user input and must not grow the memo
+        locale = str(get_locale())
+        if current_user.is_authenticated or '_flashes' in session or locale not in supported_language_set:
+            return render_template('error.html', error=error, error_code=error_code)
+        key = (error_code, error, locale, request.endpoint)
+        page = error_pages.get(key)
+        if page is None:
+            page = error_pages[key] = render_template('error.html', error=error, error_code=error_code)
+        return page
+    
     @app.errorhandler(403)
     def forbidden(error):
-        return render_template('error.html', 
-                             error="You do not have permission to access this resource", 
-                             error_code=403), 403
+        return render_error_page("You do not have permission to access this resource", 403), 403
     
     @app.errorhandler(404)
     def not_found(error):
-        return render_template('error.html', 
-                             error="Page not found", 
-                             error_code=404), 404
+        return render_error_page("Page not found", 404), 404
     
     @app.errorhandler(500)
     def internal_error(error):
-        app.logger.error(f"Internal server error: {error}")
-        return render_template('error.html', 
-                             error="Internal server error", 
-                             error_code=500), 500
+        app.logger.error("Internal server error: %s", error)
+        return render_error_page("Internal server error", 500), 500
     
     @app.errorhandler(Exception)
     def handle_exception(e):
         """Handle uncaught exceptions"""
-        app.logger.error(f"Unhandled exception: {e}")
-        app.logger.error(traceback.format_exc())
-        return render_template('error.html', 
-                             error="An unexpected error occurred", 
-                             error_code=500), 500
+        app.logger.exception("Unhandled exception: %s", e)
+        return render_error_page("An unexpected error occurred", 500), 500
     
     # Add template filters
     @app.template_filter('currency')
@@ -291,12 +394,10 @@ def create_app():
         """Format currency in templates"""
         if amount is None:
             return "$0"
-        if amount >= 1000000:
-            return f"${amount/1000000:.1f}M"
-        elif amount >= 1000:
-            return f"${amount/1000:.1f}K"
-        else:
-            return f"${amount:,.2f}"
+        for threshold, suffix in CURRENCY_SCALES:
+            if amount >= threshold:
+                return f"${amount/threshold:.1f}{suffix}"
+        return f"${amount:,.2f}"
     
     @app.template_filter('percentage')
     def percentage_filter(value):
@@ -305,13 +406,18 @@ def create_app():
             return "0%"
         return f"{value:.1f}%"
     
+    # Build the URL matcher now rather than on the first request
+    app.url_map.update()
+    
     return app
 
 if __name__ == '__main__':
     try:
         app = create_app()
         app.logger.info("Starting Dialfa Analytics Dashboard...")
-        app.run(host='0.0.0.0', port=5000, debug=True)
+        # Development server only; production runs under gunicorn (see Procfile)
+        app.run(host='0.0.0.0', port=5000, debug=app.config['DEBUG'])
     except Exception as e:
+        import traceback
         print(f"Failed to start application: {e}")
         traceback.print_exc()
@@ -2,25 +2,47 @@
 Custom decorators for role-based access control
 """
 from functools import wraps
-from flask import flash, redirect, url_for, abort
+from flask import flash, redirect, url_for, abort, request, jsonify
 from flask_login import current_user
 
 
+def is_api_request():
+    """Check if the current request targets a JSON API endpoint"""
+    return '/api/' in request.path or request.accept_mimetypes.best == 'application/json'
+
+
+def unauthorized_response():
+    """401 JSON for API calls; flash and redirect to the login page otherwise"""
+    if is_api_request():
+        return jsonify({'error': 'Authentication required', 'status': 'error'}), 401
+    flash('Please log in to access this page.', 'warning')
+    return redirect(url_for('auth.login'))
+
+
+def forbidden_response(message):
+    """403 JSON for API calls; flash and abort with the HTML error page otherwise"""
+    if is_api_request():
+        return jsonify({'error': message, 'status': 'error'}), 403
+    flash(message, 'danger')
+    abort(403)
+
+
 def role_required(*roles):
     """
     Decorator to require specific roles for a route.
     Usage: @role_required('admin', 'user')
     """
+    allowed_roles = frozenset(roles)
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            if not current_user.is_authenticated:
-                flash('Please log in to access this page.', 'warning')
-                return redirect(url_for('auth.login'))
+            user = current_user._get_current_object()
+            if not user.is_authenticated:
+                return unauthorized_response()
             
-            if current_user.role not in roles:
-                flash('You do not have permission to access this page.', 'danger')
-                abort(403)
+            if user.role not in allowed_roles:
+                return forbidden_response('You do not have permission to access this page.')
             
             return f(*args, **kwargs)
         return decorated_function
@@ -34,14 +56,12 @@ def admin_required(f):
     """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated:
-            flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('auth.login'))
+        user = current_user._get_current_object()
+        if not user.is_authenticated:
+            return unauthorized_response()
         
-        if not current_user.is_admin():
-            flash('Admin access required.', 'danger')
-            abort(403)
+        if user.role != 'admin':
+            return forbidden_response('Admin access required.')
         
         return f(*args, **kwargs)
     return decorated_function
-
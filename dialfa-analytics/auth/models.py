@@ -2,7 +2,6 @@
 User model and authentication logic
 """
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 
 class User(UserMixin):
     """User model for authentication and authorization"""
@@ -16,6 +15,8 @@ class User(UserMixin):
     
     def check_password(self, password):
         """Verify password against hash"""
+        # Imported here since only the login path needs it
+        from werkzeug.security import check_password_hash
         return check_password_hash(self.password_hash, password)
     
     def is_admin(self):
@@ -27,12 +28,14 @@ class User(UserMixin):
 
 
 # In-memory user database (for now - can be moved to DB later)
+# Hashes are precomputed with werkzeug's generate_password_hash so that
+# importing this module does not run PBKDF2 on every startup
 # Password: Admin123!
 USERS = {
     'admin': User(
         id='1',
         username='admin',
-        password_hash=generate_password_hash('Admin123!'),
+        password_hash='pbkdf2:sha256:600000$9bdzf5CGOWo2N7vE$e407624001bedb6dac38bdd4c67ff2d4049ba5d91e7f95915bc6911870a78289',
         role='admin',
         full_name='Administrator'
     ),
@@ -40,12 +43,15 @@ USERS = {
     'user': User(
         id='2',
         username='user',
-        password_hash=generate_password_hash('User123!'),
+        password_hash='pbkdf2:sha256:600000$nLy633jfOfMBQDLj$d0506813003f4513ba57f065b21f7ae66dee69f2dd1f915edb826bb14b9bf171',
         role='user',
         full_name='Regular User'
     )
 }
 
+# Index by ID for the per-request Flask-Login user loader
+USERS_BY_ID = {user.id: user for user in USERS.values()}
+
 
 def get_user_by_username(username):
     """Get user by username"""
@@ -54,10 +60,7 @@ def get_user_by_username(username):
 
 def get_user_by_id(user_id):
     """Get user by ID (required by Flask-Login)"""
-    for user in USERS.values():
-        if user.id == user_id:
-            return user
-    return None
+    return USERS_BY_ID.get(user_id)
 
 
 def authenticate_user(username, password):
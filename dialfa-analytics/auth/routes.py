@@ -32,7 +32,7 @@ def login():
         
         if user:
             login_user(user, remember=remember)
-            logger.info(f"User {username} logged in successfully (role: {user.role})")
+            logger.info("User %s logged in successfully (role: %s)", username, user.role)
             flash(f'Welcome back, {user.full_name}!', 'success')
             
             # Redirect to next page or dashboard
@@ -41,7 +41,7 @@ def login():
                 return redirect(next_page)
             return redirect(url_for('index'))
         else:
-            logger.warning(f"Failed login attempt for username: {username}")
+            logger.warning("Failed login attempt for username: %s", username)
             flash('Invalid username or password.', 'danger')
     
     return render_template('auth/login.html')
@@ -53,7 +53,7 @@ def logout():
     """Logout handler"""
     username = current_user.username
     logout_user()
-    logger.info(f"User {username} logged out")
+    logger.info("User %s logged out", username)
     flash('You have been logged out successfully.', 'info')
     return redirect(url_for('auth.login'))
 
@@ -2,15 +2,19 @@
 Cache Configuration for Dialfa Analytics
 Supports SimpleCache (memory) and Redis backends
 """
+import inspect
 import os
+from functools import wraps
+from flask import g, has_app_context
 from flask_caching import Cache
+from flask_login import current_user
 
 # Auto-detect Redis from Railway REDIS_URL or REDIS_PRIVATE_URL
 REDIS_URL = os.getenv('REDIS_URL') or os.getenv('REDIS_PRIVATE_URL')
 
 # Cache configuration - easily switch between backends
 CACHE_CONFIG = {
-    # Development: SimpleCache (in-memory)
+    # Development: SimpleCache (in-memory, one copy per worker process)
     'simple': {
         'CACHE_TYPE': 'SimpleCache',
         'CACHE_DEFAULT_TIMEOUT': 300  # 5 minutes default
@@ -29,7 +33,7 @@ CACHE_CONFIG = {
         }
     },
     
-    # Filesystem cache (alternative to Redis)
+    # Filesystem cache (default when Redis is not available)
     'filesystem': {
         'CACHE_TYPE': 'FileSystemCache',
         'CACHE_DIR': 'cache',
@@ -40,14 +44,15 @@ CACHE_CONFIG = {
 
 # Auto-select cache backend:
 # - If REDIS_URL exists (Railway), use Redis
-# - Otherwise use CACHE_BACKEND env var or default to simple
+# - Otherwise use CACHE_BACKEND env var or default to filesystem, which is
+#   shared by all gunicorn workers (SimpleCache is per-process)
 if REDIS_URL:
     CACHE_BACKEND = 'redis'
     # Use logging instead of print to avoid Windows encoding issues
     import logging
     logging.info(f"[CACHE] Redis URL detected, using Redis cache: {REDIS_URL[:20]}...")
 else:
-    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'simple')
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'filesystem')
     import logging
     logging.info(f"[CACHE] No Redis URL found, using {CACHE_BACKEND} cache")
 
@@ -60,11 +65,16 @@ CACHE_TIMEOUTS = {
     'executive_summary': 300,     # 5 minutes - moderate changes
     'monthly_trends': 1800,       # 30 minutes - historical data
     'customer_segmentation': 900, # 15 minutes - changes slowly
+    'product_performance': 1800,  # 30 minutes - yearly totals
+    'seasonal_analysis': 3600,    # 60 minutes - three years of history
+    'sales_forecast': 1800,       # 30 minutes - fitted on closed months
+    'sales_performance': 900,     # 15 minutes - per period (month/quarter/year)
     'stock_alerts': 600,          # 10 minutes
     'aging_analysis': 900,        # 15 minutes
     'category_analysis': 1200,    # 20 minutes
     'abc_analysis': 1800,         # 30 minutes
     'inventory_kpis': 600,        # 10 minutes
+    'top_stock_value': 600,       # 10 minutes
     'stock_value_evolution': 3600, # 60 minutes - stock snapshots daily
     'out_of_stock_analysis': 300,  # 5 minutes - changes frequently, critical for operations
     'reorder_analysis': 600,       # 10 minutes - reorder calculations
@@ -80,8 +90,13 @@ CACHE_TIMEOUTS = {
     
     # Lighter queries or more dynamic
     'dashboard_alerts': 120,      # 2 minutes - should be relatively fresh
+    'sales_kpis': 600,            # 10 minutes - current month moves
     'billing_monthly': 600,       # 10 minutes
     'collected_monthly': 600,     # 10 minutes
+    'customer_profitability': 1800, # 30 minutes - lifetime totals
+    
+    # Raw query results shared across analytics methods
+    'query': 120,                 # 2 minutes - keyed by SQL hash
     
     # Real-time - short cache just to prevent spam
     'billing_today': 60,          # 1 minute - changes frequently
@@ -98,8 +113,6 @@ def make_cache_key(*args, **kwargs):
     Generate cache key including user role for role-specific caching
     Useful if admin sees different data than regular users
     """
-    from flask_login import current_user
-    
     # Include user role in cache key if authenticated
     role = 'guest'
     if current_user.is_authenticated:
@@ -116,6 +129,61 @@ def make_cache_key(*args, **kwargs):
 cache = Cache()
 
 
+def clear_cache_prefixes(prefixes):
+    """Delete the cache entries whose keys start with any of the prefixes.
+    Only Redis can match keys; returns False (nothing deleted) on other backends."""
+    if CACHE_BACKEND != 'redis':
+        return False
+    client = cache.cache._write_client
+    key_prefix = cache.cache.key_prefix
+    for prefix in prefixes:
+        batch = []
+        for key in client.scan_iter(match=f"{key_prefix}{prefix}*", count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                client.delete(*batch)
+                batch = []
+        if batch:
+            client.delete(*batch)
+    return True
+
+
+def cached_by_args(timeout, key_prefix):
+    """@cache.cached for analytics methods that take arguments: %(name)s placeholders
+    in key_prefix are filled with the call's argument values, defaults included,
+    so each argument set gets its own entry under a prefix cache_admin can clear"""
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        
+        def make_cache_key(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return key_prefix % bound.arguments
+        
+        return cache.cached(timeout=timeout, make_cache_key=make_cache_key)(fn)
+    return decorator
+
+
+def request_memoize(fn):
+    """Reuse a method's result for the rest of the current request (stored on flask.g),
+    so composite endpoints calling it more than once run it once; calls with the same
+    argument values, defaults included, share a result"""
+    signature = inspect.signature(fn)
+    
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not has_app_context():
+            return fn(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (fn.__qualname__, *bound.arguments.values())
+        memo = g.setdefault('_request_memo', {})
+        if key not in memo:
+            memo[key] = fn(*args, **kwargs)
+        return memo[key]
+    return wrapper
+
+
 def init_cache(app):
     """Initialize cache with Flask app"""
     app.config.update(cache_config)
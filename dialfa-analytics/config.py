@@ -2,22 +2,82 @@
 Configuration settings for Dialfa Analytics Dashboard
 """
 import os
+from types import MappingProxyType
 from dotenv import load_dotenv
 
-load_dotenv()
+# Load dialfa-analytics/.env directly (no directory walk) and skip ${VAR} expansion;
+# variables already set in the environment take precedence
+_ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')
+if os.path.isfile(_ENV_FILE):
+    load_dotenv(_ENV_FILE, override=False, interpolate=False)
 
 class Config:
     # Database Configuration
     DB_SERVER = os.environ.get('DB_SERVER', 'dialfa.database.windows.net')
     DB_USER = os.environ.get('DB_USER', 'fp')
-    DB_PASSWORD = os.environ.get('DB_PASSWORD', 'Ab1234,,,')
+    DB_PASSWORD = os.environ.get('DB_PASSWORD', '')
+    # 'sql' (DB_USER/DB_PASSWORD) or 'managed_identity' (Azure AD token, requires azure-identity)
+    DB_AUTH = os.environ.get('DB_AUTH', 'sql').lower()
     SPISA_DB = os.environ.get('SPISA_DB', 'SPISA')
     XERP_DB = os.environ.get('XERP_DB', 'xERP')
 
     # SPISA PostgreSQL (Railway) - direct connection for analytics queries
     SPISA_PG_URL = os.environ.get('SPISA_PG_URL', '')
+    # Serve the heaviest SPISA rollups from PostgreSQL materialized views (see
+    # MaterializedQueries); they must be refreshed periodically
+    USE_MATERIALIZED_VIEWS = os.environ.get('USE_MATERIALIZED_VIEWS', 'False').lower() == 'true'
+    # Refresh the materialized views from inside the app every N minutes (0 = leave it
+    # to cron or the admin endpoint); see jobs/refresh_matviews.py
+    MATVIEW_REFRESH_MINUTES = int(os.environ.get('MATVIEW_REFRESH_MINUTES', 0))
+
+    # Client library for SQL Server (xERP) queries: 'pyodbc' (default, via SQLAlchemy),
+    # 'fastmssql' (native TDS client), 'connectorx' (parallel Rust loader) or
+    # 'turbodbc' (columnar ODBC fetch); the others require their package to be installed
+    MSSQL_DRIVER = os.environ.get('MSSQL_DRIVER', 'pyodbc').lower()
+    # fastmssql's client API is not exercised by any test here, so MSSQL_DRIVER=fastmssql
+    # is ignored unless explicitly opted into
+    ENABLE_FASTMSSQL = os.environ.get('ENABLE_FASTMSSQL', 'False').lower() == 'true'
+    # Client library for SPISA PostgreSQL queries: 'psycopg2' (default, via SQLAlchemy)
+    # or 'connectorx' (reads result sets straight into Arrow/numpy columns)
+    PG_DRIVER = os.environ.get('PG_DRIVER', 'psycopg2').lower()
+
+    # Load query results into Arrow-backed columns (requires pyarrow)
+    USE_ARROW_DTYPES = os.environ.get('USE_ARROW_DTYPES', 'False').lower() == 'true'
+    
+    # SQLAlchemy connection pool sizing (per worker process)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'True').lower() == 'true'
+    
+    # Worker threads for queries run concurrently (submit_query)
+    DB_QUERY_WORKERS = int(os.environ.get('DB_QUERY_WORKERS', 8))
+    
+    # Worker threads for independent analytics calls fanned out by dashboard endpoints
+    # (kept apart from the query pool, which those calls submit to themselves)
+    ANALYTICS_WORKERS = int(os.environ.get('ANALYTICS_WORKERS', 8))
+    
+    # Log a warning for requests issuing more database queries than this, counting those
+    # run on worker threads (a sign of per-row queries, N+1); 0 disables the check
+    QUERY_COUNT_WARNING = int(os.environ.get('QUERY_COUNT_WARNING', 10))
+    
+    # Isolation level for SQL Server (xERP) reads; the dashboards only aggregate and
+    # tolerate dirty reads, so they don't take shared locks that block ERP writers.
+    # Set to '' to keep the server default (READ COMMITTED). The fastmssql and connectorx
+    # drivers can't apply it, so they are only used when this is ''
+    MSSQL_ISOLATION_LEVEL = os.environ.get('MSSQL_ISOLATION_LEVEL', 'READ UNCOMMITTED').upper()
+    
+    # Have the drivers return NUMERIC/DECIMAL/MONEY columns as float instead of Decimal;
+    # the dashboards only aggregate and display amounts, they never post them
+    NUMERIC_AS_FLOAT = os.environ.get('NUMERIC_AS_FLOAT', 'True').lower() == 'true'
+    
+    # 'ReadOnly' routes analytics connections to a readable secondary when the
+    # Azure SQL database has geo-replication / read scale-out
+    DB_APPLICATION_INTENT = os.environ.get('DB_APPLICATION_INTENT', 'ReadWrite')
     
     # Connection string template - working configuration
+    # (32 KB TDS packets halve round trips on large result sets; MARS is not used)
     CONNECTION_STRING = (
         'DRIVER={{ODBC Driver 17 for SQL Server}};'
         'SERVER={server};'
@@ -27,11 +87,23 @@ class Config:
         'Encrypt=yes;'
         'TrustServerCertificate=yes;'
         'Connection Timeout=30;'
+        'Packet Size=32767;'
+        'MARS_Connection=no;'
+        'APP=dialfa-analytics;'
+        'ApplicationIntent={application_intent};'
     )
     
     # Flask Configuration
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dialfa-analytics-2025'
     DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO' if DEBUG else 'WARNING').upper()
+    
+    # Response compression (Flask-Compress); JSON rows repeat their keys and shrink 6-10x.
+    # Low levels keep the CPU cost small next to the database time
+    COMPRESS_ALGORITHM = ['br', 'gzip']
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 4
+    COMPRESS_BR_LEVEL = 4
     
     # Analytics Configuration
     CACHE_TIMEOUT = 300  # 5 minutes
@@ -39,13 +111,13 @@ class Config:
     EXPORT_PATH = 'exports/'
     
     # Chart Configuration
-    CHART_COLORS = {
+    CHART_COLORS = MappingProxyType({
         'primary': '#033663',
         'success': '#28a745',
         'warning': '#ffc107',
         'danger': '#dc3545',
         'info': '#17a2b8'
-    }
+    })
     
     # Business Rules
     HIGH_RISK_THRESHOLD = 0.5  # 50% overdue
@@ -59,9 +131,13 @@ class Config:
     CURRENCY_SYMBOL = 'ARS'  # Show currency code explicitly
     
     # Internationalization Configuration
-    LANGUAGES = {
+    LANGUAGES = MappingProxyType({
         'en': 'English',
         'es': 'Español'
-    }
+    })
     BABEL_DEFAULT_LOCALE = 'es'
     BABEL_DEFAULT_TIMEZONE = 'UTC'
+
+
+# Shared read-only settings instance
+CONFIG = Config()
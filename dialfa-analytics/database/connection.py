@@ -1,67 +1,484 @@
 """
 Database connection and query execution module
 """
+import asyncio
+import hashlib
+import threading
+import struct
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import wraps
+from urllib.parse import quote
 import pyodbc
+import psycopg2.extensions
 import pandas as pd
 import logging
-from sqlalchemy import create_engine
+from flask import has_app_context, current_app
+from sqlalchemy import create_engine, event
 from sqlalchemy.engine import URL
-from config import Config
+from config import CONFIG
+from cache_config import cache, get_cache_timeout
+from .queries import MaterializedQueries, query_ttl
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import fastmssql
+    HAS_FASTMSSQL = True
+except ImportError:
+    HAS_FASTMSSQL = False
+
+try:
+    import connectorx
+    HAS_CONNECTORX = True
+except ImportError:
+    HAS_CONNECTORX = False
+
+try:
+    import turbodbc
+    HAS_TURBODBC = True
+except ImportError:
+    HAS_TURBODBC = False
+
+try:
+    from azure.identity import DefaultAzureCredential
+    HAS_AZURE_IDENTITY = True
+except ImportError:
+    HAS_AZURE_IDENTITY = False
+
+# ODBC pre-connect attribute that carries an Azure AD access token (msodbcsql)
+SQL_COPT_SS_ACCESS_TOKEN = 1256
+AZURE_SQL_TOKEN_SCOPE = 'https://database.windows.net/.default'
+
+# psycopg2 type caster reading NUMERIC values as float instead of Decimal
+PG_NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, 'NUMERIC_AS_FLOAT',
+    lambda value, cursor: float(value) if value is not None else None
+)
+
+
+def _pg_numeric_as_float(dbapi_connection, connection_record):
+    """connect hook: return NUMERIC columns as float on this PostgreSQL connection"""
+    psycopg2.extensions.register_type(PG_NUMERIC_AS_FLOAT, dbapi_connection)
+
+
+def _mssql_decimal_as_float(dbapi_connection, connection_record):
+    """connect hook: return DECIMAL/NUMERIC/MONEY columns as float on this pyodbc connection
+    (pyodbc hands the converter the value's text)"""
+    for sql_type in (pyodbc.SQL_DECIMAL, pyodbc.SQL_NUMERIC):
+        dbapi_connection.add_output_converter(sql_type, lambda value: float(value) if value is not None else None)
+
+
+class QueryCounter:
+    """Thread-safe count of the database round-trips run on behalf of one request"""
 
-class DatabaseManager:
     def __init__(self):
-        self.config = Config()
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def increment(self):
+        with self._lock:
+            self.count += 1
+
+
+# Counter of the request the current thread works for; worker threads get it through
+# carry_query_counter, since Flask gives them a fresh g
+_query_counter = ContextVar('query_counter', default=None)
+
+
+def start_query_count():
+    """Install a new QueryCounter for the current request and return it"""
+    counter = QueryCounter()
+    _query_counter.set(counter)
+    return counter
+
+
+def carry_query_counter(fn):
+    """Wrap fn, to be run on another thread, so its queries count against the calling request"""
+    counter = _query_counter.get()
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _query_counter.set(counter)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _query_counter.reset(token)
+    return wrapper
+
+
+class _TTLCache:
+    """Small thread-safe LRU cache whose entries expire after a fixed TTL"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DatabaseManager:
+    def __init__(self, pool_size=None, max_overflow=None, pool_timeout=None, pool_recycle=None, pool_pre_ping=None):
+        self.config = CONFIG
         self.logger = logging.getLogger(__name__)
-        self._pg_engine = None
+        # One engine (and connection pool) per database, created on first use
+        self._engines = {}
+        self._engines_lock = threading.Lock()
+        # Pool options passed to create_engine; unset values keep SQLAlchemy defaults
+        self._engine_options = {
+            key: value for key, value in {
+                'pool_size': pool_size,
+                'max_overflow': max_overflow,
+                'pool_timeout': pool_timeout,
+                'pool_recycle': pool_recycle,
+                'pool_pre_ping': pool_pre_ping,
+            }.items() if value is not None
+        }
+        self._read_sql_kwargs = {}
+        if self.config.USE_ARROW_DTYPES:
+            if HAS_PYARROW:
+                self._read_sql_kwargs['dtype_backend'] = 'pyarrow'
+            else:
+                self.logger.warning("USE_ARROW_DTYPES is set but pyarrow is not installed; using numpy dtypes")
+        self.mssql_driver = self.config.MSSQL_DRIVER
+        available_drivers = {
+            'pyodbc': True,
+            'fastmssql': HAS_FASTMSSQL,
+            'connectorx': HAS_CONNECTORX,
+            'turbodbc': HAS_TURBODBC,
+        }
+        if self.mssql_driver == 'fastmssql' and not self.config.ENABLE_FASTMSSQL:
+            self.logger.warning("MSSQL_DRIVER fastmssql is experimental and needs ENABLE_FASTMSSQL=True; using pyodbc")
+            self.mssql_driver = 'pyodbc'
+        if not available_drivers.get(self.mssql_driver):
+            self.logger.warning(f"MSSQL_DRIVER {self.mssql_driver} is not available; using pyodbc")
+            self.mssql_driver = 'pyodbc'
+        self.pg_driver = self.config.PG_DRIVER
+        if self.pg_driver == 'connectorx' and not HAS_CONNECTORX:
+            self.logger.warning("PG_DRIVER connectorx is not available; using psycopg2")
+            self.pg_driver = 'psycopg2'
+        self._connectorx_uris = {}
+        # turbodbc connections are not thread-safe; keep one per thread and database
+        self._turbodbc_local = threading.local()
+        # Azure AD (managed identity) authentication for SQL Server instead of a password
+        self.use_managed_identity = self.config.DB_AUTH == 'managed_identity'
+        if self.use_managed_identity and not HAS_AZURE_IDENTITY:
+            self.logger.warning("DB_AUTH is managed_identity but azure-identity is not installed; using SQL authentication")
+            self.use_managed_identity = False
+        if self.use_managed_identity and self.mssql_driver != 'pyodbc':
+            # The fast-path clients only take DB_USER/DB_PASSWORD; the access token is passed
+            # through the pyodbc/SQLAlchemy connection hook
+            self.logger.warning(f"MSSQL_DRIVER {self.mssql_driver} does not support managed identity; using pyodbc")
+            self.mssql_driver = 'pyodbc'
+        if self.config.MSSQL_ISOLATION_LEVEL and self.mssql_driver in ('fastmssql', 'connectorx'):
+            # Neither client can run a SET ahead of the query, so they would read at READ COMMITTED
+            self.logger.warning(f"MSSQL_DRIVER {self.mssql_driver} cannot apply MSSQL_ISOLATION_LEVEL; using pyodbc")
+            self.mssql_driver = 'pyodbc'
+        self._credential = None
+        self._access_token = None
+        self._token_lock = threading.Lock()
+        # ODBC connection strings and SQLAlchemy URLs, built once per known database
+        self._odbc_strings = {}
+        self._mssql_urls = {}
+        for database in (self.config.SPISA_DB, self.config.XERP_DB):
+            self._odbc_strings[database] = self._build_odbc_string(database)
+            self._mssql_urls[database] = self._build_mssql_url(database)
+        # Shared pool for running blocking queries off the calling thread
+        self._executor = ThreadPoolExecutor(max_workers=self.config.DB_QUERY_WORKERS, thread_name_prefix='db-query')
+        # Per-process copy of recent results in front of the shared cache backend,
+        # so repeat hits skip the Redis/filesystem round-trip and unpickling
+        self._local_cache = _TTLCache(maxsize=256, ttl=min(get_cache_timeout('query'), self.config.CACHE_TIMEOUT))
+        # Cache key -> Future of a query being read, so concurrent misses for the same
+        # query wait for one read instead of each hitting the server
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        # Last connectivity check, so health probes don't hit the server on every call
+        self._ping_cache = _TTLCache(maxsize=1, ttl=1.0)
+        # Column metadata per (database, table); the schema only changes on deploys,
+        # so entries live until clear_schema_cache()
+        self._schema_cache = {}
+
+    def _build_odbc_string(self, database):
+        """Format the ODBC connection string for a database"""
+        connection_string = self.config.CONNECTION_STRING.format(
+            server=self.config.DB_SERVER,
+            database=database,
+            user=self.config.DB_USER,
+            password=self.config.DB_PASSWORD,
+            application_intent=self.config.DB_APPLICATION_INTENT
+        )
+        if self.use_managed_identity:
+            # The driver rejects UID/PWD when an access token is supplied
+            connection_string = ';'.join(
+                part for part in connection_string.split(';') if not part.startswith(('UID=', 'PWD='))
+            )
+        return connection_string
+
+    def _build_mssql_url(self, database):
+        """Build the SQLAlchemy URL for a SQL Server database"""
+        return URL.create(
+            "mssql+pyodbc",
+            username=None if self.use_managed_identity else self.config.DB_USER,
+            password=None if self.use_managed_identity else self.config.DB_PASSWORD,
+            host=self.config.DB_SERVER,
+            database=database,
+            query={
+                "driver": "ODBC Driver 17 for SQL Server",
+                "Encrypt": "yes",
+                "TrustServerCertificate": "yes",
+                "Connection Timeout": "30",
+                "Packet Size": "32767",
+                "MARS_Connection": "no",
+                "APP": "dialfa-analytics",
+                "ApplicationIntent": self.config.DB_APPLICATION_INTENT
+            }
+        )
+
+    def _access_token_struct(self):
+        """Azure AD access token packed for SQL_COPT_SS_ACCESS_TOKEN, reused until shortly before expiry"""
+        with self._token_lock:
+            if self._access_token is None or self._access_token.expires_on - 300 < time.time():
+                if self._credential is None:
+                    self._credential = DefaultAzureCredential()
+                self._access_token = self._credential.get_token(AZURE_SQL_TOKEN_SCOPE)
+            token = self._access_token.token.encode('utf-16-le')
+        return struct.pack(f'<I{len(token)}s', len(token), token)
+
+    def _inject_access_token(self, dialect, conn_rec, cargs, cparams):
+        """SQLAlchemy do_connect hook that authenticates pooled connections with the access token"""
+        # Without a username the pyodbc dialect asks for Windows authentication; drop it
+        cargs[0] = cargs[0].replace(';Trusted_Connection=Yes', '')
+        cparams['attrs_before'] = {SQL_COPT_SS_ACCESS_TOKEN: self._access_token_struct()}
 
     def get_connection(self, database='SPISA'):
         """Get database connection"""
         try:
-            connection_string = self.config.CONNECTION_STRING.format(
-                server=self.config.DB_SERVER,
-                database=database,
-                user=self.config.DB_USER,
-                password=self.config.DB_PASSWORD
-            )
+            connection_string = self._odbc_strings.get(database) or self._build_odbc_string(database)
+            if self.use_managed_identity:
+                return pyodbc.connect(connection_string, attrs_before={SQL_COPT_SS_ACCESS_TOKEN: self._access_token_struct()})
             return pyodbc.connect(connection_string)
         except Exception as e:
             self.logger.error(f"Database connection failed: {e}")
             raise
 
-    def execute_query(self, query, database='SPISA', params=None):
-        """Execute query and return pandas DataFrame"""
+    def _query_cache_key(self, query, database, params):
+        """Build a cache key from the SQL text, database and parameters"""
+        digest = hashlib.blake2b(f"{database}\x00{query}\x00{params!r}".encode(), digest_size=16).hexdigest()
+        return f"query_{digest}"
+
+    def execute_query(self, query, database='SPISA', params=None, use_cache=True):
+        """Execute query and return pandas DataFrame, sharing results of identical queries via the cache"""
         try:
-            engine = self.get_sqlalchemy_engine(database)
-            df = pd.read_sql(query, engine, params=params)
-            return df
+            if not use_cache:
+                return self._read_query(query, database, params)
+
+            shared_cache = has_app_context()
+            cache_key = self._query_cache_key(query, database, params)
+            df = self._local_cache.get(cache_key)
+            if df is None and shared_cache:
+                df = cache.get(cache_key)
+                if df is not None:
+                    self._local_cache.set(cache_key, df)
+            if df is not None:
+                return df.copy()
+
+            # Single flight: the first miss reads the query, concurrent misses wait for it
+            with self._inflight_lock:
+                inflight = self._inflight.get(cache_key)
+                if inflight is None:
+                    future = self._inflight[cache_key] = Future()
+            if inflight is not None:
+                return inflight.result().copy()
+
+            try:
+                df = self._read_query(query, database, params)
+                # Queries may declare their own staleness tolerance (QUERY_TTL_SECONDS)
+                ttl = query_ttl(query, get_cache_timeout('query'))
+                cached = df.copy()
+                self._local_cache.set(cache_key, cached, ttl=min(ttl, self.config.CACHE_TIMEOUT))
+                if shared_cache:
+                    cache.set(cache_key, df, timeout=ttl)
+                # Waiters copy the cached frame, which the caller never mutates
+                future.set_result(cached)
+                return df
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with self._inflight_lock:
+                    del self._inflight[cache_key]
         except Exception as e:
             self.logger.error(f"Query execution failed: {e}")
             raise
 
+    def submit_query(self, query, database='SPISA', params=None):
+        """Run execute_query on the worker pool and return a Future with the DataFrame"""
+        if has_app_context():
+            # Carry the app context over so the shared query cache is still used
+            app = current_app._get_current_object()
+
+            def run():
+                with app.app_context():
+                    return self.execute_query(query, database, params)
+
+            return self._executor.submit(carry_query_counter(run))
+        return self._executor.submit(carry_query_counter(self.execute_query), query, database, params)
+
+    def clear_query_cache(self):
+        """Drop this process's copy of cached query results"""
+        self._local_cache.clear()
+
+    def _uses_mssql(self, database):
+        """Check if a database is served by SQL Server rather than PostgreSQL"""
+        return not (database == 'SPISA' and self.config.SPISA_PG_URL)
+
+    def _count_query(self):
+        """Count a database round-trip against the current request's QueryCounter"""
+        counter = _query_counter.get()
+        if counter is not None:
+            counter.increment()
+
+    def _read_query(self, query, database, params):
+        """Run a query with the configured client library and return a DataFrame"""
+        self._count_query()
+        if not params and self._uses_mssql(database):
+            if self.mssql_driver == 'fastmssql':
+                df = asyncio.run(self._read_fastmssql(query, database))
+                if self._read_sql_kwargs:
+                    df = df.convert_dtypes(**self._read_sql_kwargs)
+                return df
+            # connectorx parses the SQL as a single statement, so DECLARE batches go through pyodbc
+            if self.mssql_driver == 'connectorx' and not query.lstrip().upper().startswith('DECLARE'):
+                return self._read_connectorx(query, database)
+            if self.mssql_driver == 'turbodbc':
+                return self._read_turbodbc(query, database)
+        elif not params and self.pg_driver == 'connectorx':
+            return self._read_connectorx(query, database)
+
+        engine = self.get_sqlalchemy_engine(database)
+        return pd.read_sql(query, engine, params=params, **self._read_sql_kwargs)
+
+    async def _read_fastmssql(self, query, database):
+        """Run a SQL Server query over fastmssql's native TDS client"""
+        connection_string = (
+            f"Server={self.config.DB_SERVER};Database={database};"
+            f"User Id={self.config.DB_USER};Password={self.config.DB_PASSWORD};"
+            "Encrypt=true;TrustServerCertificate=true"
+        )
+        async with fastmssql.Connection(connection_string) as conn:
+            result = await conn.query(query)
+            return pd.DataFrame.from_records(result.rows(), columns=result.columns())
+
+    def _read_connectorx(self, query, database):
+        """Load a SQL Server or PostgreSQL query straight into a DataFrame with connectorx"""
+        uri = self._connectorx_uris.get(database)
+        if uri is None:
+            if self._uses_mssql(database):
+                uri = (
+                    f"mssql://{quote(self.config.DB_USER, safe='')}:{quote(self.config.DB_PASSWORD, safe='')}"
+                    f"@{self.config.DB_SERVER}:1433/{database}?encrypt=true&trust_server_certificate=true"
+                )
+            else:
+                # connectorx takes a plain postgresql:// URL, without a SQLAlchemy +driver suffix
+                scheme, rest = self.config.SPISA_PG_URL.split('://', 1)
+                uri = f"{scheme.split('+')[0]}://{rest}"
+            self._connectorx_uris[database] = uri
+
+        # With Arrow dtypes enabled, keep connectorx's Arrow buffers instead of converting to numpy
+        if self._read_sql_kwargs:
+            table = connectorx.read_sql(uri, query, return_type='arrow')
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        return connectorx.read_sql(uri, query, return_type='pandas')
+
+    def _read_turbodbc(self, query, database):
+        """Run a SQL Server query with turbodbc, fetching columns into typed buffers"""
+        connections = self._turbodbc_local.__dict__
+        conn = connections.get(database)
+        if conn is None:
+            conn = connections[database] = turbodbc.connect(
+                connection_string=self._odbc_strings.get(database) or self._build_odbc_string(database),
+                turbodbc_options=turbodbc.make_options(
+                    read_buffer_size=turbodbc.Megabytes(50),
+                    use_async_io=True,
+                ),
+            )
+            if self.config.MSSQL_ISOLATION_LEVEL:
+                conn.cursor().execute(f"SET TRANSACTION ISOLATION LEVEL {self.config.MSSQL_ISOLATION_LEVEL}")
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query)
+            # Column buffers skip building a Python object per cell
+            if HAS_PYARROW:
+                table = cursor.fetchallarrow()
+                if self._read_sql_kwargs:
+                    return table.to_pandas(types_mapper=pd.ArrowDtype)
+                return table.to_pandas()
+            return pd.DataFrame(cursor.fetchallnumpy())
+        finally:
+            cursor.close()
+
     def get_sqlalchemy_engine(self, database='SPISA'):
         """Get SQLAlchemy engine - routes SPISA to PostgreSQL when configured"""
+        engine = self._engines.get(database)
+        if engine is not None:
+            return engine
+
+        with self._engines_lock:
+            engine = self._engines.get(database)
+            if engine is None:
+                engine = self._engines[database] = self._create_engine(database)
+            return engine
+
+    def _create_engine(self, database):
+        """Create the pooled SQLAlchemy engine for a database"""
         try:
             # Route SPISA queries to PostgreSQL if configured
             if database == 'SPISA' and self.config.SPISA_PG_URL:
-                if not self._pg_engine:
-                    self._pg_engine = create_engine(self.config.SPISA_PG_URL)
-                return self._pg_engine
+                engine = create_engine(self.config.SPISA_PG_URL, **self._engine_options)
+                if self.config.NUMERIC_AS_FLOAT:
+                    event.listen(engine, 'connect', _pg_numeric_as_float)
+                return engine
 
             # Default: Azure SQL Server (used for xERP and SPISA fallback)
-            connection_url = URL.create(
-                "mssql+pyodbc",
-                username=self.config.DB_USER,
-                password=self.config.DB_PASSWORD,
-                host=self.config.DB_SERVER,
-                database=database,
-                query={
-                    "driver": "ODBC Driver 17 for SQL Server",
-                    "Encrypt": "yes",
-                    "TrustServerCertificate": "yes",
-                    "Connection Timeout": "30"
-                }
-            )
-            return create_engine(connection_url)
+            connection_url = self._mssql_urls.get(database) or self._build_mssql_url(database)
+            options = self._engine_options
+            if self.config.MSSQL_ISOLATION_LEVEL:
+                options = {**options, 'isolation_level': self.config.MSSQL_ISOLATION_LEVEL}
+            engine = create_engine(connection_url, **options)
+            if self.use_managed_identity:
+                event.listen(engine, 'do_connect', self._inject_access_token)
+            if self.config.NUMERIC_AS_FLOAT:
+                event.listen(engine, 'connect', _mssql_decimal_as_float)
+            return engine
         except Exception as e:
             self.logger.error(f"SQLAlchemy engine creation failed: {e}")
             raise
@@ -69,48 +486,138 @@ class DatabaseManager:
     def execute_scalar(self, query, database='SPISA', params=None):
         """Execute query and return single value"""
         try:
-            # Use PostgreSQL for SPISA if configured
-            if database == 'SPISA' and self.config.SPISA_PG_URL:
-                engine = self.get_sqlalchemy_engine(database)
-                with engine.connect() as conn:
-                    result = conn.execute(query, params or {})
-                    row = result.fetchone()
-                    return row[0] if row else None
-
-            with self.get_connection(database) as conn:
-                cursor = conn.cursor()
-                cursor.execute(query, params or [])
-                result = cursor.fetchone()
-                return result[0] if result else None
+            self._count_query()
+            # Borrow a pooled connection (PostgreSQL or SQL Server) instead of opening a new one
+            engine = self.get_sqlalchemy_engine(database)
+            if self._uses_mssql(database):
+                # pyodbc's fetchval returns the first column without building a Row
+                conn = engine.raw_connection()
+                try:
+                    cursor = conn.cursor()
+                    value = cursor.execute(query, params or []).fetchval()
+                    cursor.close()
+                    return value
+                finally:
+                    conn.close()
+            with engine.connect() as conn:
+                if params:
+                    result = conn.exec_driver_sql(query, params)
+                else:
+                    result = conn.exec_driver_sql(query)
+                return result.scalar()
         except Exception as e:
             self.logger.error(f"Scalar query execution failed: {e}")
             raise
 
-    def test_connection(self):
-        """Test database connectivity"""
+    def execute_scalar_batch(self, named_queries, database='SPISA'):
+        """Run several scalar queries in one round-trip and return {name: value}.
+        Each query must return exactly one row with one column."""
+        if not named_queries:
+            return {}
         try:
-            engine = self.get_sqlalchemy_engine('SPISA')
+            self._count_query()
+            columns = ', '.join(f'({sql}) AS "{name}"' for name, sql in named_queries.items())
+            engine = self.get_sqlalchemy_engine(database)
             with engine.connect() as conn:
-                conn.execute("SELECT 1")
-                return True
-        except:
-            return False
+                row = conn.exec_driver_sql(f"SELECT {columns}").mappings().one()
+            return dict(row)
+        except Exception as e:
+            self.logger.error(f"Scalar batch execution failed: {e}")
+            raise
+
+    def test_connection(self):
+        """Test database connectivity (result reused for one second)"""
+        cached = self._ping_cache.get('SPISA')
+        if cached is not None:
+            return cached
+        try:
+            # Checks out an already-open pooled connection instead of logging in again
+            with self.get_sqlalchemy_engine('SPISA').connect() as conn:
+                conn.exec_driver_sql("SELECT 1")
+            connected = True
+        except Exception as e:
+            self.logger.error(f"Database connectivity check failed: {e}")
+            connected = False
+        self._ping_cache.set('SPISA', connected)
+        return connected
 
     def get_table_info(self, table_name, database='SPISA'):
         """Get table structure information"""
+        info = self._schema_cache.get((database, table_name))
+        if info is None:
+            info = self.prefetch_table_info([table_name], database)[table_name]
+        return info.copy()
+
+    def prefetch_table_info(self, table_names, database='SPISA'):
+        """Load column information for several tables in one query and cache it.
+        Returns {table_name: DataFrame}."""
+        table_names = list(dict.fromkeys(table_names))
+        if not table_names:
+            return {}
         if database == 'SPISA' and self.config.SPISA_PG_URL:
             query = """
-            SELECT column_name, data_type, is_nullable
+            SELECT table_name, column_name, data_type, is_nullable
             FROM information_schema.columns
-            WHERE table_name = %(table)s
-            ORDER BY ordinal_position
+            WHERE table_name = ANY(%(tables)s)
+            ORDER BY table_name, ordinal_position
+            """
+            df = self.execute_query(query, database, {'tables': table_names}, use_cache=False)
+            name_column = 'table_name'
+        else:
+            placeholders = ', '.join('?' * len(table_names))
+            query = f"""
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, IS_NULLABLE
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_NAME IN ({placeholders})
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
             """
-            return self.execute_query(query, database, {'table': table_name})
-
-        query = """
-        SELECT COLUMN_NAME, DATA_TYPE, IS_NULLABLE
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_NAME = ?
-        ORDER BY ORDINAL_POSITION
-        """
-        return self.execute_query(query, database, [table_name])
+            df = self.execute_query(query, database, tuple(table_names), use_cache=False)
+            name_column = 'TABLE_NAME'
+
+        columns = [column for column in df.columns if column != name_column]
+        grouped = {name: group[columns].reset_index(drop=True) for name, group in df.groupby(name_column, sort=False)}
+        result = {}
+        for table_name in table_names:
+            # Unknown tables get an empty frame, as the per-table query returned before
+            result[table_name] = grouped.get(table_name, pd.DataFrame(columns=columns))
+            self._schema_cache[(database, table_name)] = result[table_name]
+        return result
+
+    def refresh_materialized_views(self, skip_if_running=False):
+        """Create or rebuild the SPISA materialized views to match their definitions and
+        recompute all of them.
+        Meant to be run on a schedule (jobs.refresh_matviews, cron or the admin endpoint).
+        Refreshes are serialized with an advisory lock; with skip_if_running, returns None
+        instead of waiting when another process holds it."""
+        if not self.config.SPISA_PG_URL:
+            raise RuntimeError("Materialized views require SPISA on PostgreSQL (SPISA_PG_URL)")
+        lock_id = MaterializedQueries.REFRESH_LOCK_ID
+        try:
+            engine = self.get_sqlalchemy_engine('SPISA')
+            # Autocommit: each statement commits on its own, so a view's refresh releases its
+            # locks before the next view starts; the session-level advisory lock serializes runs
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                if skip_if_running:
+                    if not conn.exec_driver_sql(f"SELECT pg_try_advisory_lock({lock_id})").scalar():
+                        self.logger.info("Materialized view refresh already running, skipped")
+                        return None
+                else:
+                    conn.exec_driver_sql(f"SELECT pg_advisory_lock({lock_id})")
+                try:
+                    existing = {
+                        view: (populated, comment)
+                        for view, populated, comment in conn.exec_driver_sql(MaterializedQueries.EXISTING_VIEWS)
+                    }
+                    for statement in MaterializedQueries.refresh_statements(existing):
+                        conn.exec_driver_sql(statement)
+                finally:
+                    conn.exec_driver_sql(f"SELECT pg_advisory_unlock({lock_id})")
+            self.clear_query_cache()
+            return MaterializedQueries.view_names()
+        except Exception as e:
+            self.logger.error(f"Materialized view refresh failed: {e}")
+            raise
+
+    def clear_schema_cache(self):
+        """Forget cached table information so it is re-read from INFORMATION_SCHEMA"""
+        self._schema_cache.clear()
@@ -2,17 +2,127 @@
 SQL Queries for Dialfa Analytics Dashboard
 Based on the comprehensive database analysis
 """
+import hashlib
+import string
+import sys
+import textwrap
+from functools import lru_cache
+from config import CONFIG
 
-class FinancialQueries:
+# How long (seconds) a query's result may be reused; queries not listed use the
+# 'query' entry of CACHE_TIMEOUTS
+QUERY_TTL_SECONDS = {
+    'EXECUTIVE_SUMMARY': 60,
+    'XERP_EXECUTIVE_SUMMARY': 60,
+    'SPISA_BILLED_TODAY': 60,
+    'XERP_BILLED_TODAY': 60,
+    'SPISA_BILLED_MONTHLY': 300,
+    'XERP_BILLED_MONTHLY': 300,
+    'XERP_MONTHLY_SALES_HISTORY': 21600,
+    'XERP_TOP_CUSTOMERS': 3600,
+    'PAYMENTS_ROLLUP': 300,
+    'REORDER_ANALYSIS': 300,
+    'REORDER_ANALYSIS_MATERIALIZED': 300,
+    'CUSTOMER_PROFITABILITY': 600,
+    'CUSTOMER_PROFITABILITY_MATERIALIZED': 300,
+    'SLOW_MOVING_ANALYSIS': 600,
+    'SLOW_MOVING_ANALYSIS_MATERIALIZED': 300,
+    'OUT_OF_STOCK_ANALYSIS': 600,
+    'AGING_ANALYSIS': 300,
+    'ABC_ANALYSIS': 600,
+    'STOCK_VARIATION_OVER_TIME': 600,
+    'STOCK_VELOCITY_SUMMARY': 600,
+    'SUPPLIER_PERFORMANCE': 600,
+    'CUSTOMER_SEGMENTATION': 600,
+    'PRODUCT_PERFORMANCE': 600,
+    'SEASONAL_ANALYSIS': 3600,
+}
+
+# SQL text -> TTL, filled as templates are defined and rendered
+_QUERY_TTLS = {}
+
+# Query name -> catalog class defining it, for looking queries up by name
+QUERY_REGISTRY = {}
+
+
+def query_ttl(sql, default=None):
+    """Result TTL declared for a query's SQL text, or default"""
+    return _QUERY_TTLS.get(sql, default)
+
+
+_CONVERSIONS = {'r': repr, 's': str, 'a': ascii}
+
+
+def _fill_template(segments, params):
+    """Join a template parsed by string.Formatter with its field values"""
+    parts = []
+    for literal, field, spec, conversion in segments:
+        parts.append(literal)
+        if field is not None:
+            value = params[field]
+            if conversion:
+                value = _CONVERSIONS[conversion](value)
+            parts.append(format(value, spec))
+    return ''.join(parts)
+
+
+@lru_cache(maxsize=512)
+def _render_query(catalog, name, params):
+    """Format a query template once per distinct set of parameters (interned like the constants)"""
+    segments = catalog._templates.get(name)
+    if segments is None:
+        sql = getattr(catalog, name).format(**dict(params))
+    else:
+        sql = _fill_template(segments, dict(params))
+    sql = sys.intern(sql)
+    if name in QUERY_TTL_SECONDS:
+        _QUERY_TTLS[sql] = QUERY_TTL_SECONDS[name]
+    return sql
+
+
+class QueryCatalog:
+    """Base for query collections: templates are dedented and parsed once at import
+    time and formatted results are memoized by render()"""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # name -> string.Formatter segments of templates with {placeholders}
+        cls._templates = {}
+        for name, value in list(vars(cls).items()):
+            # _PREFIXED strings are fragments spliced into other queries; leave them as written
+            if name.isupper() and not name.startswith('_') and isinstance(value, str):
+                # A second definition would silently shadow the first for name lookups
+                if name in QUERY_REGISTRY:
+                    raise TypeError(f"{cls.__name__}.{name} is already defined by {QUERY_REGISTRY[name].__name__}")
+                # Interned so every holder of a query shares one object and cache-key
+                # comparisons on the SQL text short-circuit on identity
+                sql = sys.intern(textwrap.dedent(value).strip())
+                setattr(cls, name, sql)
+                QUERY_REGISTRY[name] = cls
+                if '{' in sql:
+                    cls._templates[name] = tuple(string.Formatter().parse(sql))
+                if name in QUERY_TTL_SECONDS:
+                    _QUERY_TTLS[sql] = QUERY_TTL_SECONDS[name]
+
+    @classmethod
+    def render(cls, name, **params):
+        """Return the named query with its {placeholders} filled in"""
+        return _render_query(cls, name, tuple(sorted(params.items())))
+
+
+class FinancialQueries(QueryCatalog):
     """Financial analysis SQL queries"""
 
     # xERP-based financial queries (ARS currency)
     XERP_EXECUTIVE_SUMMARY = """
+    -- Argentina time (UTC-3), evaluated once per batch
+    DECLARE @asof DATETIME = DATEADD(HOUR, -3, GETDATE());
     SELECT
         COUNT(DISTINCT dm.debtor_no) as UniqueCustomers,
-        SUM(dt.ov_amount * 1.21) as TotalOutstanding,
-        SUM(CASE WHEN dt.due_date < DATEADD(HOUR, -3, GETDATE()) THEN dt.ov_amount * 1.21 ELSE 0 END) as TotalOverdue,
-        AVG(dt.ov_amount * 1.21) as AvgBalance
+        -- Amounts incl. IVA: the 21% is applied to each aggregate, not to every row
+        SUM(dt.ov_amount) * 1.21 as TotalOutstanding,
+        SUM(CASE WHEN dt.due_date < @asof THEN dt.ov_amount ELSE 0 END) * 1.21 as TotalOverdue,
+        AVG(dt.ov_amount) * 1.21 as AvgBalance
     FROM [0_debtor_trans] dt
     INNER JOIN [0_debtors_master] dm ON dt.debtor_no = dm.debtor_no
     WHERE dt.Type = 10
@@ -21,56 +131,76 @@ class FinancialQueries:
     """
 
     XERP_CREDIT_RISK_ANALYSIS = """
+    -- Argentina time (UTC-3), evaluated once per batch
+    DECLARE @asof DATETIME = DATEADD(HOUR, -3, GETDATE());
     SELECT
-        dm.name as Name,
-        SUM(dt.ov_amount * 1.21) as CurrentBalance,
-        SUM(CASE WHEN dt.due_date < DATEADD(HOUR, -3, GETDATE()) THEN dt.ov_amount * 1.21 ELSE 0 END) as OverdueAmount,
-        (SUM(CASE WHEN dt.due_date < DATEADD(HOUR, -3, GETDATE()) THEN dt.ov_amount * 1.21 ELSE 0 END) /
-         NULLIF(SUM(dt.ov_amount * 1.21), 0)) * 100 as OverduePercentage,
+        Name,
+        CurrentBalance,
+        OverdueAmount,
+        (OverdueAmount / NULLIF(CurrentBalance, 0)) * 100 as OverduePercentage,
         CASE
-            WHEN (SUM(CASE WHEN dt.due_date < DATEADD(HOUR, -3, GETDATE()) THEN dt.ov_amount * 1.21 ELSE 0 END) /
-                  NULLIF(SUM(dt.ov_amount * 1.21), 0)) > 0.5 THEN 'HIGH RISK'
-            WHEN (SUM(CASE WHEN dt.due_date < DATEADD(HOUR, -3, GETDATE()) THEN dt.ov_amount * 1.21 ELSE 0 END) /
-                  NULLIF(SUM(dt.ov_amount * 1.21), 0)) > 0.2 THEN 'MEDIUM RISK'
+            WHEN OverdueAmount > CurrentBalance * 0.5 THEN 'HIGH RISK'
+            WHEN OverdueAmount > CurrentBalance * 0.2 THEN 'MEDIUM RISK'
             ELSE 'LOW RISK'
         END as RiskLevel
-    FROM [0_debtor_trans] dt
-    INNER JOIN [0_debtors_master] dm ON dt.debtor_no = dm.debtor_no
-    WHERE dt.Type = 10
-    AND dt.ov_amount > 0
-    AND dt.alloc < dt.ov_amount  -- Not fully paid
-    GROUP BY dm.debtor_no, dm.name
-    HAVING SUM(dt.ov_amount * 1.21) > 1000
+    FROM (
+        -- Balances aggregated once per customer; the ratio and risk level derive from them
+        SELECT
+            dm.name as Name,
+            -- Amounts incl. IVA, applied per customer total
+            SUM(dt.ov_amount) * 1.21 as CurrentBalance,
+            SUM(CASE WHEN dt.due_date < @asof THEN dt.ov_amount ELSE 0 END) * 1.21 as OverdueAmount
+        FROM [0_debtor_trans] dt
+        INNER JOIN [0_debtors_master] dm ON dt.debtor_no = dm.debtor_no
+        WHERE dt.Type = 10
+        AND dt.ov_amount > 0
+        AND dt.alloc < dt.ov_amount  -- Not fully paid
+        GROUP BY dm.debtor_no, dm.name
+        HAVING SUM(dt.ov_amount) * 1.21 > 1000
+    ) balances
     ORDER BY OverduePercentage DESC
     """
 
     XERP_TOP_CUSTOMERS_FINANCIAL = """
-    SELECT TOP {limit}
-        dm.name as Name,
+    -- Argentina time (UTC-3), evaluated once per batch
+    DECLARE @asof DATETIME = DATEADD(HOUR, -3, GETDATE());
+    DECLARE @limit INT = ?;
+    SELECT TOP (@limit)
+        Name,
         'Customer' as Type,
-        SUM(dt.ov_amount * 1.21) as OutstandingBalance,
-        SUM(CASE WHEN dt.due_date < DATEADD(HOUR, -3, GETDATE()) THEN dt.ov_amount * 1.21 ELSE 0 END) as OverdueAmount,
-        (SUM(CASE WHEN dt.due_date < DATEADD(HOUR, -3, GETDATE()) THEN dt.ov_amount * 1.21 ELSE 0 END) /
-         NULLIF(SUM(dt.ov_amount * 1.21), 0)) * 100 as OverduePercentage
-    FROM [0_debtor_trans] dt
-    INNER JOIN [0_debtors_master] dm ON dt.debtor_no = dm.debtor_no
-    WHERE dt.Type = 10
-    AND dt.ov_amount > 0
-    AND dt.alloc < dt.ov_amount  -- Not fully paid
-    GROUP BY dm.debtor_no, dm.name
-    HAVING SUM(dt.ov_amount * 1.21) > 100
-    ORDER BY OutstandingBalance DESC
+        OutstandingBalance,
+        OverdueAmount,
+        (OverdueAmount / NULLIF(OutstandingBalance, 0)) * 100 as OverduePercentage
+    FROM (
+        SELECT
+            dm.name as Name,
+            -- Amounts incl. IVA, applied per customer total
+            SUM(dt.ov_amount) * 1.21 as OutstandingBalance,
+            SUM(CASE WHEN dt.due_date < @asof THEN dt.ov_amount ELSE 0 END) * 1.21 as OverdueAmount
+        FROM [0_debtor_trans] dt
+        INNER JOIN [0_debtors_master] dm ON dt.debtor_no = dm.debtor_no
+        WHERE dt.Type = 10
+        AND dt.ov_amount > 0
+        AND dt.alloc < dt.ov_amount  -- Not fully paid
+        GROUP BY dm.debtor_no, dm.name
+        HAVING SUM(dt.ov_amount) * 1.21 > 100
+    ) balances
+    ORDER BY OutstandingBalance DESC, Name
+    OPTION (RECOMPILE)  -- plan for the actual @limit row goal
     """
 
     # SPISA financial queries (USD currency)
+    # One row of balance totals: the executive summary figures (balances over 100)
+    # and the total due across all balances
     EXECUTIVE_SUMMARY = """
     SELECT
-        COUNT(DISTINCT customer_id) as "UniqueCustomers",
-        SUM(amount) as "TotalOutstanding",
-        SUM(due) as "TotalOverdue",
-        AVG(amount) as "AvgBalance"
+        1 as "SnapshotId",
+        COUNT(DISTINCT customer_id) FILTER (WHERE amount > 100) as "UniqueCustomers",
+        SUM(amount) FILTER (WHERE amount > 100) as "TotalOutstanding",
+        SUM(due) FILTER (WHERE amount > 100) as "TotalOverdue",
+        AVG(amount) FILTER (WHERE amount > 100) as "AvgBalance",
+        SUM(due) as "TotalDue"
     FROM sync_balances
-    WHERE amount > 100
     """
 
     CREDIT_RISK_ANALYSIS = """
@@ -90,23 +220,44 @@ class FinancialQueries:
     ORDER BY "OverduePercentage" DESC
     """
 
-    CASH_FLOW_FORECAST = """
+    # Number of HIGH RISK rows of CREDIT_RISK_ANALYSIS, for the dashboard alerts
+    HIGH_RISK_COUNT = """
+    SELECT COUNT(*) as "HighRiskCount"
+    FROM sync_customers c
+    INNER JOIN sync_balances b ON c.id = b.customer_id
+    WHERE b.amount > 1000
+    AND b.due > b.amount * 0.5
+    """
+
+    # Payments per month for the last %(months)s months through the end of the current
+    # month, in one pass: the Cleared* columns feed the cash flow history and the
+    # current month's row (IsCurrentMonth) the monthly collections summary
+    PAYMENTS_ROLLUP = """
     SELECT
-        EXTRACT(YEAR FROM payment_date)::int as "Year",
-        EXTRACT(MONTH FROM payment_date)::int as "Month",
-        SUM(payment_amount) as "ActualPayments",
-        SUM(CASE WHEN type = 1 THEN payment_amount ELSE 0 END) as "CashPayments",
-        SUM(CASE WHEN type = 0 THEN payment_amount ELSE 0 END) as "ElectronicPayments",
+        EXTRACT(YEAR FROM date_trunc('month', payment_date))::int as "Year",
+        EXTRACT(MONTH FROM date_trunc('month', payment_date))::int as "Month",
+        date_trunc('month', payment_date) = date_trunc('month', NOW()) as "IsCurrentMonth",
+        SUM(payment_amount) as "TotalPayments",
+        COALESCE(SUM(payment_amount) FILTER (WHERE payment_date <= NOW()), 0) as "ClearedPayments",
+        COALESCE(SUM(payment_amount) FILTER (WHERE payment_date > NOW()), 0) as "PendingPayments",
+        COALESCE(SUM(payment_amount) FILTER (WHERE type = 1), 0) as "CashPayments",
+        COALESCE(SUM(payment_amount) FILTER (WHERE type = 0), 0) as "ElectronicPayments",
+        COALESCE(SUM(payment_amount) FILTER (WHERE payment_date <= NOW() AND type = 1), 0) as "ClearedCashPayments",
+        COALESCE(SUM(payment_amount) FILTER (WHERE payment_date <= NOW() AND type = 0), 0) as "ClearedElectronicPayments",
         COUNT(*) as "TransactionCount",
-        COUNT(CASE WHEN type = 1 THEN 1 END) as "CashCount",
-        COUNT(CASE WHEN type = 0 THEN 1 END) as "ElectronicCount"
+        COUNT(*) FILTER (WHERE payment_date <= NOW()) as "ClearedCount",
+        COUNT(*) FILTER (WHERE payment_date > NOW()) as "PendingCount",
+        COUNT(*) FILTER (WHERE type = 1) as "CashCount",
+        COUNT(*) FILTER (WHERE type = 0) as "ElectronicCount",
+        COUNT(*) FILTER (WHERE payment_date <= NOW() AND type = 1) as "ClearedCashCount",
+        COUNT(*) FILTER (WHERE payment_date <= NOW() AND type = 0) as "ClearedElectronicCount"
     FROM sync_transactions
-    WHERE payment_date >= NOW() - INTERVAL '{months} months'
-    AND payment_date <= NOW()
-    AND payment_date IS NOT NULL AND payment_date > '2020-01-01'
+    WHERE payment_date >= LEAST(NOW() - make_interval(months => %(months)s), date_trunc('month', NOW()))
+    AND payment_date < date_trunc('month', NOW()) + INTERVAL '1 month'
+    AND payment_date > '2020-01-01'
     AND payment_amount > 0  -- Solo pagos reales (excluir registros sin pago)
-    GROUP BY EXTRACT(YEAR FROM payment_date)::int, EXTRACT(MONTH FROM payment_date)::int
-    ORDER BY "Year", "Month"
+    GROUP BY date_trunc('month', payment_date)
+    ORDER BY date_trunc('month', payment_date)
     """
 
     TOP_CUSTOMERS = """
@@ -119,8 +270,8 @@ class FinancialQueries:
     FROM sync_customers c
     INNER JOIN sync_balances b ON c.id = b.customer_id
     WHERE b.amount > 100
-    ORDER BY b.amount DESC
-    LIMIT {limit}
+    ORDER BY b.amount DESC, c.id
+    LIMIT %(limit)s
     """
 
     # Retool-compatible queries
@@ -137,43 +288,35 @@ class FinancialQueries:
     WHERE t.type=0 and t.payment_amount<>0 and payment_date >= NOW()
     """
 
-    SPISA_DUE_BALANCE = """
-    SELECT Sum(due) as "Due"
-    FROM sync_balances b
-    """
-
     SPISA_BILLED_MONTHLY = """
     SELECT Sum(invoice_amount) as "InvoiceAmount"
     FROM sync_transactions t
-    WHERE EXTRACT(MONTH FROM invoice_date)::int = EXTRACT(MONTH FROM NOW())::int
-    AND EXTRACT(YEAR FROM invoice_date)::int = EXTRACT(YEAR FROM NOW())::int
+    WHERE invoice_date >= date_trunc('month', NOW())
+    AND invoice_date < date_trunc('month', NOW()) + INTERVAL '1 month'
     AND type=1
     """
 
     SPISA_BILLED_TODAY = """
     SELECT COALESCE(Sum(invoice_amount),0) as "InvoiceAmount"
     FROM sync_transactions t
-    WHERE invoice_date::date = NOW()::date
+    WHERE invoice_date >= CURRENT_DATE
+    AND invoice_date < CURRENT_DATE + 1
     AND type=1
     """
 
-    SPISA_COLLECTED_MONTHLY = """
+    # Tiering over the CustomerMetrics CTE, shared by the live and materialized variants
+    _CUSTOMER_TIERS = """
     SELECT
-        COALESCE(SUM(payment_amount), 0) as "TotalPayments",
-        COALESCE(SUM(CASE WHEN payment_date <= NOW() THEN payment_amount ELSE 0 END), 0) as "ClearedPayments",
-        COALESCE(SUM(CASE WHEN payment_date > NOW() THEN payment_amount ELSE 0 END), 0) as "PendingPayments",
-        COALESCE(SUM(CASE WHEN type = 1 THEN payment_amount ELSE 0 END), 0) as "CashPayments",
-        COALESCE(SUM(CASE WHEN type = 0 THEN payment_amount ELSE 0 END), 0) as "ElectronicPayments",
-        COUNT(*) as "TransactionCount",
-        COUNT(CASE WHEN payment_date <= NOW() THEN 1 END) as "ClearedCount",
-        COUNT(CASE WHEN payment_date > NOW() THEN 1 END) as "PendingCount",
-        COUNT(CASE WHEN type = 1 THEN 1 END) as "CashCount",
-        COUNT(CASE WHEN type = 0 THEN 1 END) as "ElectronicCount"
-    FROM sync_transactions t
-    WHERE EXTRACT(MONTH FROM payment_date)::int = EXTRACT(MONTH FROM NOW())::int
-    AND EXTRACT(YEAR FROM payment_date)::int = EXTRACT(YEAR FROM NOW())::int
-    AND payment_date IS NOT NULL AND payment_date > '2020-01-01'
-    AND payment_amount > 0  -- Solo pagos reales
+        *,
+        "TotalRevenue" / NULLIF("CustomerLifespanDays", 0) * 365 as "AnnualizedRevenue",
+        CASE
+            WHEN "TotalRevenue" > 1000000 AND "OverdueAmount" < "TotalRevenue" * 0.1 THEN 'Premium'
+            WHEN "TotalRevenue" > 500000 AND "OverdueAmount" < "TotalRevenue" * 0.2 THEN 'Gold'
+            WHEN "TotalRevenue" > 100000 THEN 'Silver'
+            ELSE 'Bronze'
+        END as "CustomerTier"
+    FROM CustomerMetrics
+    ORDER BY "TotalRevenue" DESC
     """
 
     CUSTOMER_PROFITABILITY = """
@@ -192,22 +335,58 @@ class FinancialQueries:
         LEFT JOIN sync_balances b ON c.id = b.customer_id
         WHERE t.invoice_date >= '2020-01-01'
         GROUP BY c.id, c.name, b.amount, b.due
-    )
+    )""" + _CUSTOMER_TIERS
+
+    # Same analysis over the nightly mv_customer_totals rollup (see MaterializedQueries);
+    # only names and current balances are read live
+    CUSTOMER_PROFITABILITY_MATERIALIZED = """
+    WITH CustomerMetrics AS (
+        SELECT
+            c.name as "Name",
+            t."TransactionCount",
+            t."TotalRevenue",
+            t."TotalPayments",
+            t."AvgInvoiceSize",
+            t."CustomerLifespanDays",
+            b.amount as "CurrentBalance",
+            b.due as "OverdueAmount"
+        FROM sync_customers c
+        INNER JOIN mv_customer_totals t ON c.id = t.customer_id
+        LEFT JOIN sync_balances b ON c.id = b.customer_id
+    )""" + _CUSTOMER_TIERS
+
+    # Receivables split into aging buckets by the overdue share of each balance
+    AGING_ANALYSIS = """
     SELECT
-        *,
-        "TotalRevenue" / NULLIF("CustomerLifespanDays", 0) * 365 as "AnnualizedRevenue",
+        c.id as "CustomerId",
+        c.name,
+        b.amount as "TotalBalance",
         CASE
-            WHEN "TotalRevenue" > 1000000 AND "OverdueAmount" < "TotalRevenue" * 0.1 THEN 'Premium'
-            WHEN "TotalRevenue" > 500000 AND "OverdueAmount" < "TotalRevenue" * 0.2 THEN 'Gold'
-            WHEN "TotalRevenue" > 100000 THEN 'Silver'
-            ELSE 'Bronze'
-        END as "CustomerTier"
-    FROM CustomerMetrics
-    ORDER BY "TotalRevenue" DESC
+            WHEN b.due = 0 THEN b.amount
+            ELSE 0
+        END as "Current",
+        CASE
+            WHEN b.due > 0 AND b.due <= b.amount * 0.3 THEN b.due
+            ELSE 0
+        END as "Days30",
+        CASE
+            WHEN b.due > b.amount * 0.3 AND b.due <= b.amount * 0.6 THEN b.due
+            ELSE 0
+        END as "Days60",
+        CASE
+            WHEN b.due > b.amount * 0.6 THEN b.due
+            ELSE 0
+        END as "Days90Plus"
+    FROM sync_customers c
+    INNER JOIN sync_balances b ON c.id = b.customer_id
+    WHERE b.amount > 0
+    ORDER BY b.amount DESC
     """
 
     # Expected Collections based on invoice aging (xERP)
     XERP_EXPECTED_COLLECTIONS = """
+    -- Argentina time (UTC-3), evaluated once per batch
+    DECLARE @asof DATETIME = DATEADD(HOUR, -3, GETDATE());
     WITH AgingBuckets AS (
         SELECT
             dt.trans_no,
@@ -216,12 +395,12 @@ class FinancialQueries:
             dt.ov_amount * 1.21 as InvoiceAmount,
             (dt.ov_amount - dt.alloc) * 1.21 as OutstandingAmount,
             dt.due_date as DueDate,
-            DATEDIFF(DAY, DATEADD(HOUR, -3, GETDATE()), dt.due_date) as DaysUntilDue,
+            DATEDIFF(DAY, @asof, dt.due_date) as DaysUntilDue,
             CASE
-                WHEN DATEDIFF(DAY, DATEADD(HOUR, -3, GETDATE()), dt.due_date) > 0 THEN 'NotYetDue'
-                WHEN DATEDIFF(DAY, dt.due_date, DATEADD(HOUR, -3, GETDATE())) BETWEEN 0 AND 30 THEN 'Overdue_0_30'
-                WHEN DATEDIFF(DAY, dt.due_date, DATEADD(HOUR, -3, GETDATE())) BETWEEN 31 AND 60 THEN 'Overdue_31_60'
-                WHEN DATEDIFF(DAY, dt.due_date, DATEADD(HOUR, -3, GETDATE())) BETWEEN 61 AND 90 THEN 'Overdue_61_90'
+                WHEN DATEDIFF(DAY, @asof, dt.due_date) > 0 THEN 'NotYetDue'
+                WHEN DATEDIFF(DAY, dt.due_date, @asof) BETWEEN 0 AND 30 THEN 'Overdue_0_30'
+                WHEN DATEDIFF(DAY, dt.due_date, @asof) BETWEEN 31 AND 60 THEN 'Overdue_31_60'
+                WHEN DATEDIFF(DAY, dt.due_date, @asof) BETWEEN 61 AND 90 THEN 'Overdue_61_90'
                 ELSE 'Overdue_90_Plus'
             END as AgingBucket
         FROM [0_debtor_trans] dt
@@ -251,6 +430,8 @@ class FinancialQueries:
 
     # Collection Performance - Using allocations table (xERP)
     XERP_COLLECTION_PERFORMANCE = """
+    -- Argentina time (UTC-3), evaluated once per batch
+    DECLARE @asof DATETIME = DATEADD(HOUR, -3, GETDATE());
     WITH InvoicePayments AS (
         SELECT
             inv.trans_no as InvoiceNo,
@@ -272,8 +453,8 @@ class FinancialQueries:
             CASE WHEN inv.alloc >= inv.ov_amount THEN 1 ELSE 0 END as IsFullyPaid
         FROM [0_debtor_trans] inv
         WHERE inv.Type = 10  -- Invoices only
-        AND inv.tran_date >= DATEADD(MONTH, -12, DATEADD(HOUR, -3, GETDATE()))
-        AND inv.tran_date <= DATEADD(HOUR, -3, GETDATE())
+        AND inv.tran_date >= DATEADD(MONTH, -12, @asof)
+        AND inv.tran_date <= @asof
         AND inv.ov_amount > 0
     )
     SELECT
@@ -318,9 +499,26 @@ class FinancialQueries:
     ORDER BY Year DESC, Month DESC
     """
 
-class InventoryQueries:
+class InventoryQueries(QueryCatalog):
     """Inventory analysis SQL queries"""
 
+    # Per-article sales rollup over the last two years, shared by the slow-moving
+    # and out-of-stock analyses
+    _ARTICLE_SALES_2Y = """
+            SELECT
+                soi.article_id,
+                MAX(so.order_date) as "LastSaleDate",
+                SUM(soi.quantity) as "TotalSold",
+                SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '90 days' THEN soi.quantity ELSE 0 END) as "Last90DaysSales",
+                SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '180 days' THEN soi.quantity ELSE 0 END) as "Last180DaysSales",
+                SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '365 days' THEN soi.quantity ELSE 0 END) as "Last365DaysSales"
+            FROM sales_order_items soi
+            INNER JOIN sales_orders so ON soi.sales_order_id = so.id
+            WHERE so.order_date >= NOW() - INTERVAL '2 years'
+            AND so.deleted_at IS NULL
+            GROUP BY soi.article_id
+    """
+
     INVENTORY_SUMMARY = """
     SELECT
         COUNT(*) as "TotalProducts",
@@ -332,6 +530,19 @@ class InventoryQueries:
     WHERE a.deleted_at IS NULL
     """
 
+    # Out-of-stock and low-stock counts of the stock alerts, for the dashboard alerts
+    STOCK_ALERT_COUNTS = """
+    SELECT
+        COUNT(*) FILTER (WHERE a.stock = 0) as "OutOfStockCount",
+        COUNT(*) FILTER (WHERE a.stock <> 0) as "LowStockCount"
+    FROM articles a
+    INNER JOIN categories c ON a.category_id = c.id
+    WHERE a.is_discontinued = false
+    AND a.deleted_at IS NULL
+    AND c.deleted_at IS NULL
+    AND a.stock < 10
+    """
+
     TOP_STOCK_VALUE = """
     SELECT
         a.description as "ProductName",
@@ -345,10 +556,11 @@ class InventoryQueries:
     AND a.deleted_at IS NULL
     AND c.deleted_at IS NULL
     ORDER BY "StockValue" DESC
-    LIMIT {limit}
+    LIMIT %(limit)s
     """
 
-    SLOW_MOVING_ANALYSIS = """
+    # Slow-moving analysis around the per-article sales source joined as "sales"
+    _SLOW_MOVING_HEAD = """
     WITH InventoryAnalysis AS (
         SELECT
             a.description as "ProductName",
@@ -360,17 +572,9 @@ class InventoryQueries:
             EXTRACT(EPOCH FROM (NOW() - COALESCE(sales."LastSaleDate", '1900-01-01'::date))) / 86400 as "DaysSinceLastSale"
         FROM articles a
         INNER JOIN categories c ON a.category_id = c.id
-        LEFT JOIN (
-            SELECT
-                soi.article_id,
-                MAX(so.order_date) as "LastSaleDate",
-                SUM(soi.quantity) as "TotalSold"
-            FROM sales_order_items soi
-            INNER JOIN sales_orders so ON soi.sales_order_id = so.id
-            WHERE so.order_date >= NOW() - INTERVAL '2 years'
-            AND so.deleted_at IS NULL
-            GROUP BY soi.article_id
-        ) sales ON a.id = sales.article_id
+        LEFT JOIN"""
+
+    _SLOW_MOVING_TAIL = """ sales ON a.id = sales.article_id
         WHERE a.stock > 0 AND a.is_discontinued = false
         AND a.deleted_at IS NULL
         AND c.deleted_at IS NULL
@@ -388,6 +592,12 @@ class InventoryQueries:
     ORDER BY "StockValue" DESC
     """
 
+    SLOW_MOVING_ANALYSIS = _SLOW_MOVING_HEAD + " (" + _ARTICLE_SALES_2Y + ")" + _SLOW_MOVING_TAIL
+
+    # Same analysis over the nightly mv_article_last_sale rollup (see MaterializedQueries);
+    # stock and prices are read live
+    SLOW_MOVING_ANALYSIS_MATERIALIZED = _SLOW_MOVING_HEAD + " mv_article_last_sale" + _SLOW_MOVING_TAIL
+
     CATEGORY_ANALYSIS = """
     SELECT
         c.name as "Category",
@@ -411,9 +621,10 @@ class InventoryQueries:
             c.name as "Category",
             a.stock as "CurrentStock",
             a.unit_price as "UnitPrice",
-            EXTRACT(YEAR FROM so.order_date)::int as "Year",
-            EXTRACT(MONTH FROM so.order_date)::int as "Month",
-            TO_CHAR(so.order_date, 'Month') as "MonthName",
+            -- Grouped on the month start only; year, month and name derive from it per group
+            EXTRACT(YEAR FROM date_trunc('month', so.order_date))::int as "Year",
+            EXTRACT(MONTH FROM date_trunc('month', so.order_date))::int as "Month",
+            TO_CHAR(date_trunc('month', so.order_date), 'Month') as "MonthName",
             SUM(soi.quantity) as "QuantitySold",
             COUNT(soi.sales_order_id) as "OrderCount",
             AVG(soi.quantity) as "AvgOrderSize",
@@ -429,7 +640,7 @@ class InventoryQueries:
         AND c.deleted_at IS NULL
         AND so.deleted_at IS NULL
         GROUP BY a.id, a.description, c.name, a.stock, a.unit_price,
-                 EXTRACT(YEAR FROM so.order_date)::int, EXTRACT(MONTH FROM so.order_date)::int, TO_CHAR(so.order_date, 'Month')
+                 date_trunc('month', so.order_date)
     ),
     StockTurnoverAnalysis AS (
         SELECT
@@ -472,32 +683,67 @@ class InventoryQueries:
     """
 
     STOCK_VELOCITY_SUMMARY = """
-    WITH VelocityAnalysis AS (
+    WITH WindowedSales AS (
+        -- One pass over the order lines: bucket each sale into the narrowest window it falls in
+        SELECT
+            soi.article_id,
+            CASE
+                WHEN so.order_date >= NOW() - INTERVAL '3 months' THEN 3
+                WHEN so.order_date >= NOW() - INTERVAL '6 months' THEN 6
+                WHEN so.order_date >= NOW() - INTERVAL '12 months' THEN 12
+                ELSE 24
+            END as "WindowMonths",
+            SUM(soi.quantity) as "Quantity",
+            MIN(so.order_date) as "FirstSaleDate",
+            MAX(so.order_date) as "LastSaleDate"
+        FROM sales_order_items soi
+        INNER JOIN sales_orders so ON soi.sales_order_id = so.id
+        WHERE so.deleted_at IS NULL
+        AND so.order_date >= NOW() - INTERVAL '2 years'
+        AND so.order_date <= NOW()
+        GROUP BY soi.article_id, 2
+    ),
+    ArticleSales AS (
+        -- At most four bucket rows per article are rolled up into the cumulative windows
+        SELECT
+            article_id,
+            SUM("Quantity") FILTER (WHERE "WindowMonths" <= 3) as "Last3MonthsSales",
+            SUM("Quantity") FILTER (WHERE "WindowMonths" <= 6) as "Last6MonthsSales",
+            SUM("Quantity") FILTER (WHERE "WindowMonths" <= 12) as "Last12MonthsSales",
+            -- Months 4-12 straight from their buckets, for the trend
+            SUM("Quantity") FILTER (WHERE "WindowMonths" IN (6, 12)) as "Prior9MonthsSales",
+            SUM("Quantity") as "TotalSold",
+            MIN("FirstSaleDate") as "FirstSaleDate",
+            MAX("LastSaleDate") as "LastSaleDate"
+        FROM WindowedSales
+        GROUP BY article_id
+    ),
+    VelocityAnalysis AS (
         SELECT
             a.id as "Id",
             a.description as "ProductName",
             c.name as "Category",
             a.stock as "CurrentStock",
             a.unit_price as "UnitPrice",
-            -- Last 3 months sales
-            COALESCE(SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '3 months' THEN soi.quantity END), 0) as "Last3MonthsSales",
-            -- Last 6 months sales
-            COALESCE(SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '6 months' THEN soi.quantity END), 0) as "Last6MonthsSales",
-            -- Last 12 months sales
-            COALESCE(SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '12 months' THEN soi.quantity END), 0) as "Last12MonthsSales",
+            COALESCE(s."Last3MonthsSales", 0) as "Last3MonthsSales",
+            COALESCE(s."Last6MonthsSales", 0) as "Last6MonthsSales",
+            COALESCE(s."Last12MonthsSales", 0) as "Last12MonthsSales",
             -- Average monthly sales
-            COALESCE(SUM(soi.quantity) / NULLIF(EXTRACT(EPOCH FROM (NOW() - MIN(so.order_date))) / 2592000, 0), 0) as "AvgMonthlySales",
-            -- Last sale date
-            MAX(so.order_date) as "LastSaleDate"
+            COALESCE(s."TotalSold" / NULLIF(EXTRACT(EPOCH FROM (NOW() - s."FirstSaleDate")) / 2592000, 0), 0) as "AvgMonthlySales",
+            -- Trend analysis: last 3 months' monthly rate vs the previous 9 months'
+            CASE
+                WHEN s."Last6MonthsSales" > 0 AND s."Last12MonthsSales" > 0 THEN
+                    (COALESCE(s."Last3MonthsSales", 0) / 3.0 - s."Prior9MonthsSales" / 9.0) /
+                    NULLIF(s."Prior9MonthsSales" / 9.0, 0) * 100
+                ELSE 0
+            END as "TrendPercentage",
+            s."LastSaleDate"
         FROM articles a
         INNER JOIN categories c ON a.category_id = c.id
-        LEFT JOIN sales_order_items soi ON a.id = soi.article_id
-        LEFT JOIN sales_orders so ON soi.sales_order_id = so.id AND so.deleted_at IS NULL
+        LEFT JOIN ArticleSales s ON s.article_id = a.id
         WHERE a.is_discontinued = false
         AND a.deleted_at IS NULL
         AND c.deleted_at IS NULL
-        AND (so.order_date IS NULL OR (so.order_date >= NOW() - INTERVAL '2 years' AND so.order_date <= NOW()))
-        GROUP BY a.id, a.description, c.name, a.stock, a.unit_price
     )
     SELECT
         *,
@@ -512,14 +758,6 @@ class InventoryQueries:
             ELSE 0
         END as "AnnualTurnoverPercentage",
 
-        -- Trend analysis (comparing recent vs historical performance)
-        CASE
-            WHEN "Last6MonthsSales" > 0 AND "Last12MonthsSales" > 0 THEN
-                (("Last3MonthsSales" / 3.0) - (("Last12MonthsSales" - "Last3MonthsSales") / 9.0)) /
-                NULLIF((("Last12MonthsSales" - "Last3MonthsSales") / 9.0), 0) * 100
-            ELSE 0
-        END as "TrendPercentage",
-
         -- Stock health classification
         CASE
             WHEN "CurrentStock" = 0 THEN 'OUT_OF_STOCK'
@@ -539,6 +777,35 @@ class InventoryQueries:
     ORDER BY "AnnualSalesValue" DESC, "StockValue" DESC
     """
 
+    # Stocked articles with their sales over the last year, for the ABC classification
+    ABC_ANALYSIS = """
+    WITH InventoryValue AS (
+        SELECT
+            a.id as "IdArticulo",
+            a.description as "ProductName",
+            a.stock * a.unit_price as "StockValue",
+            COALESCE(sales."TotalSold", 0) as "TotalSold",
+            COALESCE(sales."SalesValue", 0) as "SalesValue"
+        FROM articles a
+        LEFT JOIN (
+            SELECT
+                soi.article_id,
+                SUM(soi.quantity) as "TotalSold",
+                SUM(soi.quantity * a2.unit_price) as "SalesValue"
+            FROM sales_order_items soi
+            INNER JOIN sales_orders so ON soi.sales_order_id = so.id
+            INNER JOIN articles a2 ON soi.article_id = a2.id
+            WHERE so.order_date >= NOW() - INTERVAL '1 year'
+            AND so.deleted_at IS NULL
+            GROUP BY soi.article_id
+        ) sales ON a.id = sales.article_id
+        WHERE a.stock > 0 AND a.is_discontinued = false
+        AND a.deleted_at IS NULL
+    )
+    SELECT * FROM InventoryValue
+    ORDER BY "SalesValue" DESC
+    """
+
     STOCK_VALUE_EVOLUTION = """
     SELECT
         date as "Date",
@@ -547,7 +814,7 @@ class InventoryQueries:
         EXTRACT(MONTH FROM date)::int as "Month",
         TO_CHAR(date, 'Month') as "MonthName"
     FROM stock_snapshots
-    WHERE date >= NOW() - INTERVAL '{months} months'
+    WHERE date >= NOW() - make_interval(months => %(months)s)
     ORDER BY date ASC
     """
 
@@ -577,20 +844,7 @@ class InventoryQueries:
             END as "EstimatedLostSales"
         FROM articles a
         INNER JOIN categories c ON a.category_id = c.id
-        LEFT JOIN (
-            SELECT
-                soi.article_id,
-                MAX(so.order_date) as "LastSaleDate",
-                SUM(soi.quantity) as "TotalSold",
-                SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '90 days' THEN soi.quantity ELSE 0 END) as "Last90DaysSales",
-                SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '180 days' THEN soi.quantity ELSE 0 END) as "Last180DaysSales",
-                SUM(CASE WHEN so.order_date >= NOW() - INTERVAL '365 days' THEN soi.quantity ELSE 0 END) as "Last365DaysSales"
-            FROM sales_order_items soi
-            INNER JOIN sales_orders so ON soi.sales_order_id = so.id
-            WHERE so.order_date >= NOW() - INTERVAL '2 years'
-            AND so.deleted_at IS NULL
-            GROUP BY soi.article_id
-        ) sales ON a.id = sales.article_id
+        LEFT JOIN (""" + _ARTICLE_SALES_2Y + """) sales ON a.id = sales.article_id
         WHERE a.stock = 0  -- Out of stock
         AND a.deleted_at IS NULL
         AND c.deleted_at IS NULL
@@ -622,10 +876,23 @@ class InventoryQueries:
     ORDER BY "Priority" DESC, "EstimatedLostSales" DESC
     """
 
-class PurchaseQueries:
+class PurchaseQueries(QueryCatalog):
     """Purchase order and supplier analysis SQL queries"""
 
-    REORDER_ANALYSIS = """
+    # Safety stock adjusted by ABC class; depends only on the demand estimate, so the
+    # materialized demand snapshot stores it precomputed
+    # A: 95% SL (Z=1.65), B: 90% SL (Z=1.28), C: 80% SL (Z=0.84)
+    _SAFETY_STOCK = """
+            CASE
+                WHEN "ABCClass" = 'A' THEN "DemandStdDev" * SQRT(135.0) * 1.65
+                WHEN "ABCClass" = 'B' THEN "DemandStdDev" * SQRT(135.0) * 1.28
+                ELSE "DemandStdDev" * SQRT(135.0) * 0.84
+            END as "SafetyStock"
+    """
+
+    # REORDER_ANALYSIS is assembled from a demand stage and the reorder math, so the
+    # materialized variant can swap in a different demand stage
+    _REORDER_DEMAND = """
     -- ABC Classification based on revenue contribution (last 365 days)
     WITH ProductRevenue AS (
         SELECT
@@ -654,7 +921,7 @@ class PurchaseQueries:
             END as "ABCClass"
         FROM ProductRevenue
     ),
-    ProductDemand AS (
+    BaseDemand AS (
         SELECT
             a.id,
             a.code as "ProductCode",
@@ -707,27 +974,22 @@ class PurchaseQueries:
         AND a.deleted_at IS NULL
         AND c.deleted_at IS NULL
     ),
+    ProductDemand AS (
+        SELECT
+            *,""" + _SAFETY_STOCK + """
+        FROM BaseDemand
+    ),
+    """
+
+    _REORDER_CALCULATIONS = """
     ReorderCalculations AS (
         SELECT
             *,
             -- Lead time: FIXED at 135 days (90 production + 45 shipping)
             135 as "EstimatedLeadTimeDays",
 
-            -- Safety stock adjusted by ABC class
-            -- A: 95% SL (Z=1.65), B: 90% SL (Z=1.28), C: 80% SL (Z=0.84)
-            CASE
-                WHEN "ABCClass" = 'A' THEN "DemandStdDev" * SQRT(135.0) * 1.65
-                WHEN "ABCClass" = 'B' THEN "DemandStdDev" * SQRT(135.0) * 1.28
-                ELSE "DemandStdDev" * SQRT(135.0) * 0.84
-            END as "SafetyStock",
-
             -- Reorder point = (Avg Daily Demand x Lead Time) + Safety Stock
-            ("AvgDailyDemand" * 135) +
-            CASE
-                WHEN "ABCClass" = 'A' THEN "DemandStdDev" * SQRT(135.0) * 1.65
-                WHEN "ABCClass" = 'B' THEN "DemandStdDev" * SQRT(135.0) * 1.28
-                ELSE "DemandStdDev" * SQRT(135.0) * 0.84
-            END as "ReorderPoint",
+            ("AvgDailyDemand" * 135) + "SafetyStock" as "ReorderPoint",
 
             -- Order quantity adjusted by ABC class (coverage multipliers)
             -- A: 2x lead time, B: 1.5x lead time, C: 1.2x lead time
@@ -746,31 +1008,19 @@ class PurchaseQueries:
     FinalCalculations AS (
         SELECT
             *,
-            -- Quantity to order (gap to reorder point + optimal order quantity)
-            CASE
-                WHEN "CurrentStock" < "ReorderPoint" THEN
-                    CEILING(CASE WHEN "OptimalOrderQuantity" > ("ReorderPoint" - "CurrentStock" + "SafetyStock")
-                                 THEN "OptimalOrderQuantity"
-                                 ELSE ("ReorderPoint" - "CurrentStock" + "SafetyStock")
-                            END)
-                ELSE 0
-            END as "SuggestedOrderQuantity",
-
             -- Calculate coverage percentage relative to demand window
             CASE
                 WHEN "DaysOfCoverage" < 999 THEN ("DaysOfCoverage" / {demand_days}.0) * 100
                 ELSE 999
             END as "CoveragePercent",
 
-            -- Priority classification based on PERCENTAGE of coverage vs demand window
-            -- CRITICAL: < 20% | URGENT: < 40% | HIGH: < 60% | MEDIUM: < 100% | LOW: < 150%
-            CASE
-                WHEN "DaysOfCoverage" <= 0 THEN 'OUT_OF_STOCK'
-                WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 20 THEN 'CRITICAL'
-                WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 40 THEN 'URGENT'
-                WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 60 THEN 'HIGH'
-                WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 100 THEN 'MEDIUM'
-                WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 150 THEN 'LOW'
+            CASE "PriorityRank"
+                WHEN 1 THEN 'OUT_OF_STOCK'
+                WHEN 2 THEN 'CRITICAL'
+                WHEN 3 THEN 'URGENT'
+                WHEN 4 THEN 'HIGH'
+                WHEN 5 THEN 'MEDIUM'
+                WHEN 6 THEN 'LOW'
                 ELSE 'ADEQUATE'
             END as "Priority",
             -- Expected stockout date
@@ -780,38 +1030,67 @@ class PurchaseQueries:
                 ELSE NULL
             END as "ExpectedStockoutDate",
             -- Order value
-            CASE
-                WHEN "CurrentStock" < "ReorderPoint" THEN
-                    CEILING(CASE WHEN "OptimalOrderQuantity" > ("ReorderPoint" - "CurrentStock" + "SafetyStock")
-                                 THEN "OptimalOrderQuantity"
-                                 ELSE ("ReorderPoint" - "CurrentStock" + "SafetyStock")
-                            END) * "UnitPrice"
-                ELSE 0
-            END as "SuggestedOrderValue"
+            "SuggestedOrderQuantity" * "UnitPrice" as "SuggestedOrderValue"
         FROM ReorderCalculations
+        -- Quantity to order (gap to reorder point + optimal order quantity) and priority
+        -- rank, computed once per row and reused by the columns above
+        CROSS JOIN LATERAL (
+            SELECT
+                CASE
+                    WHEN "CurrentStock" < "ReorderPoint" THEN
+                        CEILING(CASE WHEN "OptimalOrderQuantity" > ("ReorderPoint" - "CurrentStock" + "SafetyStock")
+                                     THEN "OptimalOrderQuantity"
+                                     ELSE ("ReorderPoint" - "CurrentStock" + "SafetyStock")
+                                END)
+                    ELSE 0
+                END as "SuggestedOrderQuantity",
+                -- Priority classification based on PERCENTAGE of coverage vs demand window, as
+                -- a sortable rank: 1 OUT_OF_STOCK | 2 CRITICAL < 20% | 3 URGENT < 40% |
+                -- 4 HIGH < 60% | 5 MEDIUM < 100% | 6 LOW < 150% | 7 ADEQUATE
+                CASE
+                    WHEN "DaysOfCoverage" <= 0 THEN 1
+                    WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 20 THEN 2
+                    WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 40 THEN 3
+                    WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 60 THEN 4
+                    WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 100 THEN 5
+                    WHEN "DaysOfCoverage" < 999 AND ("DaysOfCoverage" / {demand_days}.0) * 100 < 150 THEN 6
+                    ELSE 7
+                END as "PriorityRank"
+        ) qty
         WHERE "DemandWindowSales" > 0  -- Only products with recent demand in selected window
     )
     SELECT *
     FROM FinalCalculations
     ORDER BY
-        CASE "Priority"
-            WHEN 'OUT_OF_STOCK' THEN 1
-            WHEN 'CRITICAL' THEN 2
-            WHEN 'URGENT' THEN 3
-            WHEN 'HIGH' THEN 4
-            WHEN 'MEDIUM' THEN 5
-            WHEN 'LOW' THEN 6
-            ELSE 7
-        END,
-        -- Secondary sort: A products first, then by revenue impact
-        CASE "ABCClass"
-            WHEN 'A' THEN 1
-            WHEN 'B' THEN 2
-            ELSE 3
-        END,
+        "PriorityRank",
+        -- Secondary sort: A products first (classes are always 'A'/'B'/'C'), then by revenue impact
+        "ABCClass",
         "SuggestedOrderValue" DESC
     """
 
+    REORDER_ANALYSIS = _REORDER_DEMAND + _REORDER_CALCULATIONS
+
+    # Same analysis over the nightly mv_product_demand / mv_article_daily_sales snapshots
+    # (see MaterializedQueries); only the user-selected demand window is summed live
+    REORDER_ANALYSIS_MATERIALIZED = """
+    WITH ProductDemand AS (
+        SELECT
+            pd.*,
+            COALESCE(w."DemandWindowSales", 0) as "DemandWindowSales",
+            -- Average daily demand (based on user-selected window)
+            COALESCE(w."DemandWindowSales", 0) / {demand_days}.0 as "AvgDailyDemand",
+            EXTRACT(EPOCH FROM (NOW() - pd."LastSaleDate")) / 86400 as "DaysSinceLastSale",
+            {demand_days} as "DemandWindowDays"
+        FROM mv_product_demand pd
+        LEFT JOIN (
+            SELECT article_id, SUM(quantity) as "DemandWindowSales"
+            FROM mv_article_daily_sales
+            WHERE sale_date >= CURRENT_DATE - {demand_days}
+            GROUP BY article_id
+        ) w ON w.article_id = pd.id
+    ),
+    """ + _REORDER_CALCULATIONS
+
     SUPPLIER_PERFORMANCE = """
     WITH SupplierStock AS (
         SELECT
@@ -828,25 +1107,45 @@ class PurchaseQueries:
     ),
     SupplierOrders AS (
         SELECT
-            so.supplier_id::text as "SupplierId",
+            so.supplier_id as "SupplierId",
             COUNT(DISTINCT so.id) as "TotalOrders",
             SUM(soi.quantity * soi.unit_price) as "TotalPurchaseValue"
         FROM supplier_orders so
         LEFT JOIN supplier_order_items soi ON so.id = soi.supplier_order_id
-        GROUP BY so.supplier_id::text
+        GROUP BY so.supplier_id
     )
     SELECT
+        ss.id as "SupplierId",
         ss."SupplierName",
         COALESCE(sord."TotalOrders", 0) as "TotalOrders",
         ss."ProductCount",
         COALESCE(ss."CurrentStockValue", 0) as "CurrentStockValue",
         sord."TotalPurchaseValue"
     FROM SupplierStock ss
-    LEFT JOIN SupplierOrders sord ON ss.code::text = sord."SupplierId"
+    -- Types differ (code vs id); cast once per aggregated supplier, not per order line
+    LEFT JOIN SupplierOrders sord ON ss.code::text = sord."SupplierId"::text
     ORDER BY "CurrentStockValue" DESC
     """
 
-class SalesQueries:
+# Distinct-customer aggregate for the xERP sales templates, keyed by precise:
+# a HyperLogLog estimate (SQL Server 2019+, ~2% error) for the dashboards,
+# the exact hash/sort count for audits
+XERP_CUSTOMER_COUNT = {
+    False: 'APPROX_COUNT_DISTINCT(dm.debtor_no)',
+    True: 'COUNT(DISTINCT dm.debtor_no)',
+}
+
+# ord_date range (start, end) of each XERP_BILLS view in Argentina time (UTC-3).
+# Written inline rather than through variables so SQL Server estimates the range
+# when it compiles each variant, and reuses that plan afterwards
+_XERP_TODAY = 'CAST(DATEADD(HOUR, -3, GETDATE()) AS DATE)'
+_XERP_MONTH_START = 'DATEFROMPARTS(YEAR(DATEADD(HOUR, -3, GETDATE())), MONTH(DATEADD(HOUR, -3, GETDATE())), 1)'
+XERP_BILLS_RANGES = {
+    'month': (_XERP_MONTH_START, f'DATEADD(MONTH, 1, {_XERP_MONTH_START})'),
+    'day': (_XERP_TODAY, f'DATEADD(DAY, 1, {_XERP_TODAY})'),
+}
+
+class SalesQueries(QueryCatalog):
     """Sales analysis SQL queries"""
 
     SALES_SUMMARY = """
@@ -860,23 +1159,87 @@ class SalesQueries:
     AND invoice_date > '2020-01-01'
     """
 
+    # Customers of the last two years with their sales totals, segmented by revenue and recency
+    CUSTOMER_SEGMENTATION = """
+    WITH "CustomerSales" AS (
+        SELECT
+            c.id as "CustomerId",
+            c.name,
+            COUNT(t.id) as "TransactionCount",
+            SUM(t.invoice_amount) as "TotalRevenue",
+            AVG(t.invoice_amount) as "AvgInvoiceSize",
+            EXTRACT(EPOCH FROM (MAX(t.invoice_date) - MIN(t.invoice_date))) / 86400 as "CustomerLifespanDays",
+            MAX(t.invoice_date) as "LastPurchaseDate",
+            EXTRACT(EPOCH FROM (NOW() - MAX(t.invoice_date))) / 86400 as "DaysSinceLastPurchase"
+        FROM sync_customers c
+        INNER JOIN sync_transactions t ON c.id = t.customer_id
+        WHERE t.type = 1
+        AND t.invoice_date >= NOW() - INTERVAL '2 years'
+        AND t.invoice_date > '2020-01-01'
+        GROUP BY c.id, c.name
+    )
+    SELECT
+        *,
+        CASE
+            WHEN "TotalRevenue" > 500000 AND "DaysSinceLastPurchase" < 90 THEN 'Champions'
+            WHEN "TotalRevenue" > 200000 AND "DaysSinceLastPurchase" < 180 THEN 'Loyal Customers'
+            WHEN "TotalRevenue" > 100000 AND "DaysSinceLastPurchase" < 365 THEN 'Potential Loyalists'
+            WHEN "DaysSinceLastPurchase" < 90 THEN 'New Customers'
+            WHEN "DaysSinceLastPurchase" > 365 THEN 'At Risk'
+            ELSE 'Regular Customers'
+        END as "CustomerSegment",
+        "TotalRevenue" / NULLIF("CustomerLifespanDays", 0) * 365 as "AnnualizedRevenue"
+    FROM "CustomerSales"
+    ORDER BY "TotalRevenue" DESC
+    """
+
+    # Products sold in the last year with quantities, revenue and order counts
+    PRODUCT_PERFORMANCE = """
+    SELECT
+        a.id as "ArticleId",
+        a.description as "ProductName",
+        c.name as "Category",
+        SUM(soi.quantity) as "TotalQuantitySold",
+        SUM(soi.quantity * a.unit_price) as "TotalRevenue",
+        COUNT(DISTINCT so.id) as "OrderCount",
+        AVG(a.unit_price) as "AvgSellingPrice",
+        MAX(so.order_date) as "LastSaleDate"
+    FROM sales_order_items soi
+    INNER JOIN sales_orders so ON soi.sales_order_id = so.id
+    INNER JOIN articles a ON soi.article_id = a.id
+    INNER JOIN categories c ON a.category_id = c.id
+    WHERE so.order_date >= NOW() - INTERVAL '1 years'
+    AND a.deleted_at IS NULL
+    AND so.deleted_at IS NULL
+    AND a.is_discontinued = false
+    GROUP BY a.id, a.description, c.name
+    ORDER BY "TotalRevenue" DESC
+    """
+
+    # Invoice averages per calendar month over the last three years
+    SEASONAL_ANALYSIS = """
+    SELECT
+        EXTRACT(MONTH FROM invoice_date)::int as "Month",
+        TO_CHAR(invoice_date, 'Month') as "MonthName",
+        AVG(invoice_amount) as "AvgMonthlyRevenue",
+        COUNT(*) as "AvgTransactionCount",
+        STDDEV(invoice_amount) as "RevenueVolatility"
+    FROM sync_transactions
+    WHERE type = 1
+    AND invoice_date >= NOW() - INTERVAL '3 years'
+    AND invoice_date > '2020-01-01'
+    GROUP BY EXTRACT(MONTH FROM invoice_date)::int, TO_CHAR(invoice_date, 'Month')
+    ORDER BY "Month"
+    """
+
     XERP_SALES_SUMMARY = """
     SELECT
         COUNT(*) as TotalTransactions,
-        SUM(
-            CASE
-                WHEN dt.Type = 10 THEN (total * 1.21)
-                WHEN dt.Type = 11 THEN (total * -1.21)
-                ELSE 0
-            END
-        ) as TotalRevenue,
-        COUNT(DISTINCT dm.debtor_no) as UniqueCustomers,
-        AVG(
-            CASE
-                WHEN dt.Type = 10 THEN (total * 1.21)
-                ELSE NULL
-            END
-        ) as AvgInvoiceSize
+        -- Amounts incl. IVA: invoices (type 10) minus credit notes (type 11), with
+        -- the 21% applied to each aggregate instead of every row
+        SUM(CASE WHEN dt.Type = 10 THEN total ELSE -total END) * 1.21 as TotalRevenue,
+        {customer_count} as UniqueCustomers,
+        AVG(CASE WHEN dt.Type = 10 THEN total END) * 1.21 as AvgInvoiceSize
     FROM [0_debtor_trans] dt
     INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
     INNER JOIN [0_debtors_master] dm ON dm.debtor_no = so.debtor_no
@@ -888,28 +1251,35 @@ class SalesQueries:
     MONTHLY_SALES_TREND = """
     WITH MonthlySales AS (
         SELECT
-            EXTRACT(YEAR FROM invoice_date)::int as "Year",
-            EXTRACT(MONTH FROM invoice_date)::int as "Month",
-            TO_CHAR(invoice_date, 'Month') as "MonthName",
+            -- Grouped on the month start only; year, month and name derive from it per group
+            EXTRACT(YEAR FROM date_trunc('month', invoice_date))::int as "Year",
+            EXTRACT(MONTH FROM date_trunc('month', invoice_date))::int as "Month",
+            TO_CHAR(date_trunc('month', invoice_date), 'Month') as "MonthName",
             SUM(invoice_amount) as "MonthlyRevenue",
             COUNT(DISTINCT customer_id) as "UniqueCustomers",
             COUNT(*) as "TransactionCount"
         FROM sync_transactions
         WHERE type = 1 AND invoice_date >= NOW() - INTERVAL '2 years'
         AND invoice_date > '2020-01-01'
-        GROUP BY EXTRACT(YEAR FROM invoice_date)::int, EXTRACT(MONTH FROM invoice_date)::int, TO_CHAR(invoice_date, 'Month')
+        GROUP BY date_trunc('month', invoice_date)
+    ),
+    -- Previous month bound once and reused by the growth expression
+    Lagged AS (
+        SELECT
+            *,
+            LAG("MonthlyRevenue") OVER (ORDER BY "Year", "Month") as "PreviousMonth"
+        FROM MonthlySales
     )
     SELECT
         *,
-        LAG("MonthlyRevenue") OVER (ORDER BY "Year", "Month") as "PreviousMonth",
-        ("MonthlyRevenue" - LAG("MonthlyRevenue") OVER (ORDER BY "Year", "Month")) /
-        NULLIF(LAG("MonthlyRevenue") OVER (ORDER BY "Year", "Month"), 0) * 100 as "MonthOverMonthGrowth"
-    FROM MonthlySales
+        ("MonthlyRevenue" - "PreviousMonth") / NULLIF("PreviousMonth", 0) * 100 as "MonthOverMonthGrowth"
+    FROM Lagged
     ORDER BY "Year" DESC, "Month" DESC
     """
 
     XERP_TOP_CUSTOMERS = """
-    SELECT TOP {limit}
+    DECLARE @limit INT = ?;
+    SELECT TOP (@limit)
         dm.name as CustomerName,
         COUNT(so.order_no) as OrderCount,
         SUM(dt.ov_amount) as TotalRevenue
@@ -918,13 +1288,12 @@ class SalesQueries:
     INNER JOIN [0_debtor_trans] dt ON so.ID = dt.order_
     WHERE dt.type = 10
     GROUP BY dm.debtor_no, dm.name
-    ORDER BY TotalRevenue DESC
+    ORDER BY TotalRevenue DESC, dm.debtor_no
+    OPTION (RECOMPILE)  -- plan for the actual @limit row goal
     """
 
-    XERP_MONTHLY_SALES_TREND = """
-    DECLARE @FromDate DATETIME
-    SET @FromDate = DATEADD(MONTH, -12, GETDATE())
-
+    # Monthly sales between @from and @to, spliced after the range declarations below
+    _XERP_MONTHLY_SALES = """
     SELECT
       CAST(
         CONCAT(
@@ -935,59 +1304,60 @@ class SalesQueries:
       ) as MonthYear,
       DATEPART(YEAR, ord_date) as Year,
       DATEPART(MONTH, ord_date) as Month,
-      DATENAME(MONTH, ord_date) as MonthName,
-      SUM(
-        CASE
-          WHEN dt.Type = 10 THEN (total * 1.21)
-          WHEN dt.Type = 11 THEN (total * -1.21)
-          ELSE total
-        END
-      ) as MonthlyRevenue,
-      COUNT(DISTINCT dm.debtor_no) as UniqueCustomers,
+      -- Month name from the grouped year/month, so it is not part of the grouping key
+      DATENAME(MONTH, DATEFROMPARTS(DATEPART(YEAR, ord_date), DATEPART(MONTH, ord_date), 1)) as MonthName,
+      -- Invoices minus credit notes, incl. IVA applied once per month
+      SUM(CASE WHEN dt.Type = 10 THEN total ELSE -total END) * 1.21 as MonthlyRevenue,
+      {customer_count} as UniqueCustomers,
       COUNT(*) as TransactionCount
     FROM [0_debtor_trans] dt
       INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
       INNER JOIN [0_debtors_master] dm ON dm.debtor_no = so.debtor_no
     WHERE dt.Type IN (10, 11)
-      AND ord_date >= @FromDate
+      AND ord_date >= @from AND ord_date < @to
     GROUP BY DATEPART(YEAR, ord_date),
-             DATEPART(MONTH, ord_date),
-             DATENAME(MONTH, ord_date)
+             DATEPART(MONTH, ord_date)
     ORDER BY DATEPART(YEAR, ord_date) DESC,
              DATEPART(MONTH, ord_date) DESC
     """
 
+    # Closed months of the last 12 months; they rarely change, so the result is
+    # kept for hours and only the current month is aggregated on each refresh.
+    # Both take the current month start as parameter, which also rolls the cache key
+    XERP_MONTHLY_SALES_HISTORY = """
+    DECLARE @to DATETIME = ?;
+    DECLARE @from DATETIME = DATEADD(MONTH, -12, GETDATE());
+    """ + _XERP_MONTHLY_SALES
+
+    XERP_MONTHLY_SALES_CURRENT = """
+    DECLARE @from DATETIME = ?;
+    DECLARE @to DATETIME = DATEADD(MONTH, 1, @from);
+    """ + _XERP_MONTHLY_SALES
+
     # Retool-compatible xERP queries
     XERP_BILLED_MONTHLY = """
-    WITH FC AS (
-      SELECT COALESCE(SUM(Total) * 1.21, 0) AS BilledMonthlyFC FROM [0_debtor_trans] dt
-      INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
-      WHERE dt.Type=10 AND MONTH(ord_date) = MONTH(DATEADD(HOUR, -3, GETDATE())) AND YEAR(ord_date) = YEAR(DATEADD(HOUR, -3, GETDATE()))
-    ),
-    NC AS (
-      SELECT COALESCE(SUM(Total) * 1.21, 0) AS BilledMonthlyNC FROM [0_debtor_trans] dt
-      INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
-      WHERE dt.Type=11 AND MONTH(ord_date) = MONTH(DATEADD(HOUR, -3, GETDATE())) AND YEAR(ord_date) = YEAR(DATEADD(HOUR, -3, GETDATE()))
-    )
-    SELECT (BilledMonthlyFC - BilledMonthlyNC) AS BilledMonthly
-    FROM FC, NC
+    -- Argentina time (UTC-3), evaluated once per batch
+    DECLARE @asof DATETIME = DATEADD(HOUR, -3, GETDATE());
+    DECLARE @month_start DATE = DATEFROMPARTS(YEAR(@asof), MONTH(@asof), 1);
+    -- Invoices (FC, type 10) minus credit notes (NC, type 11) in one pass
+    SELECT COALESCE(SUM(CASE WHEN dt.Type=10 THEN Total ELSE -Total END) * 1.21, 0) AS BilledMonthly
+    FROM [0_debtor_trans] dt
+    INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
+    WHERE dt.Type IN (10, 11) AND ord_date >= @month_start AND ord_date < DATEADD(MONTH, 1, @month_start)
     """
 
     XERP_BILLED_TODAY = """
-    WITH FC AS (
-      SELECT COALESCE(SUM(Total) * 1.21, 0) AS BilledTodayFC FROM [0_debtor_trans] dt
-      INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
-      WHERE dt.Type=10 AND CAST(ord_date AS DATE) = CAST(DATEADD(HOUR, -3, GETDATE()) AS DATE)
-    ),
-    NC AS (
-      SELECT COALESCE(SUM(Total) * 1.21, 0) AS BilledTodayNC FROM [0_debtor_trans] dt
-      INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
-      WHERE dt.Type=11 AND CAST(ord_date AS DATE) = CAST(DATEADD(HOUR, -3, GETDATE()) AS DATE)
-    )
-    SELECT (BilledTodayFC - BilledTodayNC) AS BilledToday
-    FROM FC, NC
+    -- Argentina time (UTC-3), evaluated once per batch
+    DECLARE @asof DATETIME = DATEADD(HOUR, -3, GETDATE());
+    DECLARE @today DATE = CAST(@asof AS DATE);
+    -- Invoices (FC, type 10) minus credit notes (NC, type 11) in one pass
+    SELECT COALESCE(SUM(CASE WHEN dt.Type=10 THEN Total ELSE -Total END) * 1.21, 0) AS BilledToday
+    FROM [0_debtor_trans] dt
+    INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
+    WHERE dt.Type IN (10, 11) AND ord_date >= @today AND ord_date < DATEADD(DAY, 1, @today)
     """
 
+    # One statement per view, rendered with its XERP_BILLS_RANGES range
     XERP_BILLS = """
     SELECT
     order_no ,
@@ -1004,14 +1374,10 @@ class SalesQueries:
     FROM [0_debtor_trans] dt
       INNER JOIN [0_sales_orders] so ON so.ID = dt.order_
       INNER JOIN [0_debtors_master] dm on dm.debtor_no = so.debtor_no
-      WHERE dt.Type=10 AND
-        (('{view_filter}' = 'month' AND
-    MONTH(ord_date) = MONTH(DATEADD(HOUR, -3, GETDATE())) AND YEAR(ord_date) = YEAR(DATEADD(HOUR, -3, GETDATE()))) OR
-       ('{view_filter}' = 'day'
-    AND CAST(ord_date AS DATE) = CAST(DATEADD(HOUR, -3, GETDATE()) AS DATE)))
+      WHERE dt.Type=10 AND ord_date >= {start} AND ord_date < {end}
     """
 
-class CrossSystemQueries:
+class CrossSystemQueries(QueryCatalog):
     """Cross-system comparison queries"""
 
     SYSTEM_COMPARISON = """
@@ -1031,3 +1397,242 @@ class CrossSystemQueries:
     FROM xERP.dbo.[0_debtor_trans]
     WHERE type = 10
     """
+
+
+class MaterializedQueries(QueryCatalog):
+    """PostgreSQL materialized views for the heaviest SPISA rollups.
+    Views are (re)built by DatabaseManager.refresh_materialized_views(), meant to run
+    nightly (e.g. a 02:00 cron job calling the admin refresh endpoint)."""
+
+    # Per-article sales per day for the last two years; the demand window of the
+    # reorder analysis is summed from this instead of the order lines
+    ARTICLE_DAILY_SALES = """
+    SELECT
+        soi.article_id,
+        so.order_date::date as sale_date,
+        SUM(soi.quantity) as quantity
+    FROM sales_order_items soi
+    INNER JOIN sales_orders so ON soi.sales_order_id = so.id
+    WHERE so.order_date >= NOW() - INTERVAL '2 years'
+    AND so.deleted_at IS NULL
+    GROUP BY soi.article_id, so.order_date::date
+    """
+
+    # Last sale and units sold per article over the two-year daily sales window
+    ARTICLE_LAST_SALE = """
+    SELECT
+        article_id,
+        MAX(sale_date) as "LastSaleDate",
+        SUM(quantity) as "TotalSold"
+    FROM mv_article_daily_sales
+    GROUP BY article_id
+    """
+
+    # Per-customer transaction totals since 2020, the slow-changing part of the
+    # customer profitability analysis
+    CUSTOMER_TOTALS = """
+    SELECT
+        customer_id,
+        COUNT(*) as "TransactionCount",
+        SUM(CASE WHEN type = 1 THEN invoice_amount ELSE 0 END) as "TotalRevenue",
+        SUM(CASE WHEN type = 0 THEN payment_amount ELSE 0 END) as "TotalPayments",
+        AVG(invoice_amount) as "AvgInvoiceSize",
+        EXTRACT(EPOCH FROM (MAX(invoice_date) - MIN(invoice_date))) / 86400 as "CustomerLifespanDays"
+    FROM sync_transactions
+    WHERE invoice_date >= '2020-01-01'
+    GROUP BY customer_id
+    """
+
+    # Demand figures of the reorder analysis that don't depend on the demand window,
+    # including the safety stock
+    PRODUCT_DEMAND = """
+    WITH ArticleSales AS (
+        SELECT
+            article_id,
+            MAX(sale_date) as "LastSaleDate",
+            SUM(quantity) FILTER (WHERE sale_date >= CURRENT_DATE - 30) as "Last30DaysSales",
+            SUM(quantity) FILTER (WHERE sale_date >= CURRENT_DATE - 90) as "Last90DaysSales",
+            SUM(quantity) FILTER (WHERE sale_date >= CURRENT_DATE - 180) as "Last180DaysSales",
+            SUM(quantity) FILTER (WHERE sale_date >= CURRENT_DATE - 365) as "Last365DaysSales"
+        FROM mv_article_daily_sales
+        GROUP BY article_id
+    ),
+    ProductRevenue AS (
+        SELECT
+            a.id,
+            sales."Last365DaysSales" * a.unit_price as "TotalRevenue"
+        FROM articles a
+        INNER JOIN ArticleSales sales ON a.id = sales.article_id
+        WHERE sales."Last365DaysSales" IS NOT NULL
+        AND a.deleted_at IS NULL
+    ),
+    ABCClassification AS (
+        SELECT
+            id,
+            "TotalRevenue",
+            CASE
+                WHEN SUM("TotalRevenue") OVER (ORDER BY "TotalRevenue" DESC) * 100.0 /
+                     SUM("TotalRevenue") OVER () <= 80 THEN 'A'
+                WHEN SUM("TotalRevenue") OVER (ORDER BY "TotalRevenue" DESC) * 100.0 /
+                     SUM("TotalRevenue") OVER () <= 95 THEN 'B'
+                ELSE 'C'
+            END as "ABCClass"
+        FROM ProductRevenue
+    ),
+    BaseDemand AS (
+        SELECT
+            a.id,
+            a.code as "ProductCode",
+            a.description as "ProductName",
+            a.stock as "CurrentStock",
+            a.unit_price as "UnitPrice",
+            a.stock * a.unit_price as "StockValue",
+            c.name as "Category",
+            s.name as "PreferredSupplier",
+            a.supplier_id as "SupplierId",
+            COALESCE(abc."ABCClass", 'C') as "ABCClass",
+            COALESCE(abc."TotalRevenue", 0) as "AnnualRevenue",
+            COALESCE(sales."Last30DaysSales", 0) as "Last30DaysSales",
+            COALESCE(sales."Last90DaysSales", 0) as "Last90DaysSales",
+            COALESCE(sales."Last180DaysSales", 0) as "Last180DaysSales",
+            COALESCE(sales."Last365DaysSales", 0) as "Last365DaysSales",
+            -- Standard deviation estimate (simplified)
+            CASE
+                WHEN sales."Last90DaysSales" > 0 THEN
+                    SQRT(sales."Last90DaysSales" / 90.0) * 1.5
+                ELSE 0
+            END as "DemandStdDev",
+            COALESCE(sales."LastSaleDate", '1900-01-01'::date) as "LastSaleDate"
+        FROM articles a
+        INNER JOIN categories c ON a.category_id = c.id
+        LEFT JOIN suppliers s ON a.supplier_id = s.id
+        LEFT JOIN ABCClassification abc ON a.id = abc.id
+        LEFT JOIN ArticleSales sales ON a.id = sales.article_id
+        WHERE a.is_discontinued = false
+        AND a.deleted_at IS NULL
+        AND c.deleted_at IS NULL
+    )
+    SELECT
+        *,""" + PurchaseQueries._SAFETY_STOCK + """
+    FROM BaseDemand
+    """
+
+    # Covering indexes on synced tables for the date-range SUM/COUNT rollups
+    # (billed/collected totals, cash flow, sales summary and trend), so they run
+    # as index-only scans instead of reading whole sync_transactions rows:
+    # index -> (table, definition)
+    SOURCE_INDEXES = {
+        'ix_sync_transactions_invoice_date': (
+            'sync_transactions',
+            '(invoice_date, type) INCLUDE (invoice_amount, customer_id)',
+        ),
+        'ix_sync_transactions_payment_date': (
+            'sync_transactions',
+            '(payment_date) INCLUDE (type, payment_amount) WHERE payment_amount > 0',
+        ),
+    }
+
+    # Building blocks read by live queries, in dependency order:
+    # view -> (query attribute, unique index columns)
+    BASE_VIEWS = {
+        'mv_article_daily_sales': ('ARTICLE_DAILY_SALES', 'article_id, sale_date'),
+        'mv_product_demand': ('PRODUCT_DEMAND', 'id'),
+        'mv_article_last_sale': ('ARTICLE_LAST_SALE', 'article_id'),
+        'mv_customer_totals': ('CUSTOMER_TOTALS', 'customer_id'),
+    }
+
+    # Views earlier versions created and no longer register; dropped on refresh
+    RETIRED_VIEWS = ('mv_customer_profitability', 'mv_slow_moving_analysis')
+
+    # Comment stamped on each view: marks it as created here and fingerprints its definition
+    _DEFINITION_STAMP = 'dialfa-analytics definition '
+
+    # Materialized views in the current schema with whether they hold data and their comment
+    EXISTING_VIEWS = """
+    SELECT c.relname, c.relispopulated, d.description
+    FROM pg_class c
+    LEFT JOIN pg_description d
+        ON d.objoid = c.oid AND d.classoid = 'pg_class'::regclass AND d.objsubid = 0
+    WHERE c.relkind = 'm'
+    AND c.relnamespace = current_schema()::regnamespace
+    """
+
+    # Advisory lock key held while the views are refreshed, so concurrent refreshes
+    # (several workers, the admin endpoint) run one after another
+    REFRESH_LOCK_ID = 726301
+
+    # Query name -> (view, source query, ORDER BY used when reading the view or None,
+    # unique index columns)
+    VIEWS = {
+        'EXECUTIVE_SUMMARY': ('mv_balance_snapshot', FinancialQueries.EXECUTIVE_SUMMARY, None, '"SnapshotId"'),
+        'AGING_ANALYSIS': ('mv_aging_analysis', FinancialQueries.AGING_ANALYSIS, '"TotalBalance" DESC', '"CustomerId"'),
+        'ABC_ANALYSIS': ('mv_abc_analysis', InventoryQueries.ABC_ANALYSIS, '"SalesValue" DESC', '"IdArticulo"'),
+        'OUT_OF_STOCK_ANALYSIS': ('mv_out_of_stock_analysis', InventoryQueries.OUT_OF_STOCK_ANALYSIS, '"Priority" DESC, "EstimatedLostSales" DESC', '"Id"'),
+        'STOCK_VELOCITY_SUMMARY': ('mv_stock_velocity_summary', InventoryQueries.STOCK_VELOCITY_SUMMARY, '"AnnualSalesValue" DESC, "StockValue" DESC', '"Id"'),
+        'SUPPLIER_PERFORMANCE': ('mv_supplier_performance', PurchaseQueries.SUPPLIER_PERFORMANCE, '"CurrentStockValue" DESC', '"SupplierId"'),
+        'CUSTOMER_SEGMENTATION': ('mv_customer_segmentation', SalesQueries.CUSTOMER_SEGMENTATION, '"TotalRevenue" DESC', '"CustomerId"'),
+        'PRODUCT_PERFORMANCE': ('mv_product_performance', SalesQueries.PRODUCT_PERFORMANCE, '"TotalRevenue" DESC', '"ArticleId"'),
+        'SEASONAL_ANALYSIS': ('mv_seasonal_analysis', SalesQueries.SEASONAL_ANALYSIS, '"Month"', '"Month"'),
+    }
+
+    @classmethod
+    def definitions(cls):
+        """(view, query, unique index columns) of every view, in refresh order"""
+        views = [(view, getattr(cls, attr), key) for view, (attr, key) in cls.BASE_VIEWS.items()]
+        for view, source, order, key in cls.VIEWS.values():
+            # The source query without its final ORDER BY
+            views.append((view, source[:source.rindex('ORDER BY')].rstrip() if order else source, key))
+        return views
+
+    @classmethod
+    def refresh_statements(cls, existing=None):
+        """Statements that bring the views in line with their definitions and recompute
+        them, base views first. existing maps the views already in the schema to
+        (populated, comment), as read by EXISTING_VIEWS.
+        A view whose stamped definition differs is dropped and rebuilt, along with the views
+        reading it; views created here but no longer registered are dropped. Populated views
+        are refreshed CONCURRENTLY (by their unique index), so dashboards keep reading them
+        meanwhile; a view created WITH NO DATA needs one plain REFRESH first"""
+        existing = existing or {}
+        statements = [
+            f"CREATE INDEX IF NOT EXISTS {index} ON {table} {definition}"
+            for index, (table, definition) in cls.SOURCE_INDEXES.items()
+        ]
+        definitions = cls.definitions()
+        registered = {view for view, _, _ in definitions}
+        for view, (_, comment) in existing.items():
+            if view not in registered and (view in cls.RETIRED_VIEWS or (comment or '').startswith(cls._DEFINITION_STAMP)):
+                statements.append(f"DROP MATERIALIZED VIEW IF EXISTS {view} CASCADE")
+        rebuilt = set()
+        for view, body, key in definitions:
+            stamp = cls._DEFINITION_STAMP + hashlib.sha1(f"{body}\n{key}".encode()).hexdigest()
+            if view in existing and (existing[view][1] != stamp or any(name in body for name in rebuilt)):
+                # IF EXISTS: a view reading a rebuilt one went with it (CASCADE)
+                statements.append(f"DROP MATERIALIZED VIEW IF EXISTS {view} CASCADE")
+                rebuilt.add(view)
+            statements.append(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view} AS\n{body}\nWITH NO DATA")
+            statements.append(f"COMMENT ON MATERIALIZED VIEW {view} IS '{stamp}'")
+            statements.append(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{view} ON {view} ({key})")
+            populated = view in existing and existing[view][0] and view not in rebuilt
+            concurrently = 'CONCURRENTLY ' if populated else ''
+            statements.append(f"REFRESH MATERIALIZED VIEW {concurrently}{view}")
+        return statements
+
+    @classmethod
+    def view_names(cls):
+        """Names of all materialized views, in refresh order"""
+        return list(cls.BASE_VIEWS) + [view for view, _, _, _ in cls.VIEWS.values()]
+
+    @staticmethod
+    def enabled():
+        """Whether dashboards should read the materialized views"""
+        return bool(CONFIG.USE_MATERIALIZED_VIEWS and CONFIG.SPISA_PG_URL)
+
+    @classmethod
+    def resolve(cls, name):
+        """SQL the dashboard should run for a query: read the view when materialized views
+        are enabled, otherwise the live query"""
+        view, source, order, _ = cls.VIEWS[name]
+        if cls.enabled():
+            return f"SELECT * FROM {view} ORDER BY {order}" if order else f"SELECT * FROM {view}"
+        return source
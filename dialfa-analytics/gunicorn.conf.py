@@ -0,0 +1,25 @@
+"""
+Gunicorn settings, read automatically when gunicorn starts in this directory:
+
+    gunicorn "app:create_app()"
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Threaded workers: requests spend their time waiting on SQL Server/PostgreSQL, and
+# pyodbc/psycopg2 release the GIL while they wait. (gevent would not help here: both
+# drivers block its event loop, serializing every query of a worker.)
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Keep browser connections open between the dashboard's API calls
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Heavy analytics on a cold cache can take a while
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Each request thread holds at most one pooled connection per database and the query
+# pool (DB_QUERY_WORKERS) up to as many more, so the default DB_POOL_SIZE +
+# DB_MAX_OVERFLOW (10 + 20) covers threads + DB_QUERY_WORKERS (8 + 8) without waiting
@@ -0,0 +1,41 @@
+"""
+Materialized view refresh job
+Keeps the SPISA materialized views (see MaterializedQueries) fresh, either from a
+daemon thread inside the app or as a one-shot command for cron:
+
+    python -m jobs.refresh_matviews
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def seconds_until_next_run(interval):
+    """Seconds until the next wall-clock multiple of interval, so every worker process
+    wakes at the same moment and the advisory lock lets only one of them refresh"""
+    return interval - (time.time() % interval)
+
+def start_refresh_scheduler(db_manager, minutes):
+    """Start a daemon thread refreshing the materialized views every `minutes` minutes"""
+    interval = minutes * 60
+
+    def run():
+        while True:
+            time.sleep(seconds_until_next_run(interval))
+            try:
+                views = db_manager.refresh_materialized_views(skip_if_running=True)
+                if views is not None:
+                    logger.info(f"Scheduled materialized view refresh done: {views}")
+            except Exception as e:
+                logger.error(f"Scheduled materialized view refresh failed: {e}")
+
+    thread = threading.Thread(target=run, name='matview-refresh', daemon=True)
+    thread.start()
+    return thread
+
+if __name__ == '__main__':
+    from database.connection import DatabaseManager
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    print(f"Refreshed: {DatabaseManager().refresh_materialized_views()}")
@@ -0,0 +1,39 @@
+"""
+JSON Provider for Dialfa Analytics
+Serializes API responses with orjson instead of the stdlib json module
+"""
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+
+    # Datetimes are passed through to Flask's default handler so they keep the
+    # same HTTP-date format as jsonify; numpy scalars/arrays are native
+    OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def _dumps_bytes(self, obj, sort_keys, indent, default=None):
+        option = self.OPTIONS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default or self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        """Serialize obj to a JSON string"""
+        return self._dumps_bytes(
+            obj, kwargs.get('sort_keys', self.sort_keys), kwargs.get('indent'), kwargs.get('default')
+        ).decode()
+
+    def response(self, *args, **kwargs):
+        """jsonify(): send orjson's bytes as the body without decoding them to str and back"""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = self._dumps_bytes(obj, self.sort_keys, indent) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+    def loads(self, s, **kwargs):
+        """Deserialize a JSON string or bytes"""
+        return orjson.loads(s)
@@ -2,15 +2,22 @@
 Cache Administration Routes
 Endpoints for cache management (admin only)
 """
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from flask_login import login_required
 from auth.decorators import admin_required
-from cache_config import cache
+from cache_config import cache, clear_cache_prefixes
 import logging
+import pickle
+import statistics
+import time
+from functools import lru_cache
 
 cache_admin_bp = Blueprint('cache_admin', __name__)
 logger = logging.getLogger(__name__)
 
+# Size of the payload written by the cache health check and benchmark
+CACHE_PROBE_BYTES = 16 * 1024
+
 
 @cache_admin_bp.route('/api/admin/cache/clear', methods=['POST'])
 @login_required
@@ -19,6 +26,8 @@ def clear_all_cache():
     """Clear all cache (admin only)"""
     try:
         cache.clear()
+        current_app.db_manager.clear_query_cache()
+        current_app.db_manager.clear_schema_cache()
         logger.info("All cache cleared by admin")
         return jsonify({
             'status': 'success',
@@ -55,15 +64,22 @@ def clear_specific_cache(cache_type):
                 'message': f'Invalid cache type. Valid types: {list(cache_prefixes.keys())}'
             }), 400
         
-        # Clear cache by prefix (note: SimpleCache doesn't support selective clearing)
-        # This is a limitation - with Redis we could use key patterns
-        cache.clear()  # For now, clear all
+        # Raw query results are shared by every type, so they are dropped as well
+        current_app.db_manager.clear_query_cache()
+        if clear_cache_prefixes(cache_prefixes[cache_type] + ['query_']):
+            logger.info(f"Cache cleared for type: {cache_type}")
+            return jsonify({
+                'status': 'success',
+                'message': f'Cache for {cache_type} cleared successfully'
+            })
         
-        logger.info(f"Cache cleared for type: {cache_type}")
+        # Only Redis can delete by key pattern; other backends are cleared entirely
+        cache.clear()
+        logger.info(f"Cache cleared for type: {cache_type} (all entries, {cache.config.get('CACHE_TYPE')})")
         return jsonify({
             'status': 'success',
             'message': f'Cache for {cache_type} cleared successfully',
-            'note': 'Using SimpleCache - all cache cleared. Upgrade to Redis for selective clearing.'
+            'note': f"{cache.config.get('CACHE_TYPE')} cannot clear by prefix - all cache cleared. Set REDIS_URL for selective clearing."
         })
     except Exception as e:
         logger.error(f"Error clearing {cache_type} cache: {e}")
@@ -73,6 +89,28 @@ def clear_specific_cache(cache_type):
         }), 500
 
 
+@cache_admin_bp.route('/api/admin/materialized-views/refresh', methods=['POST'])
+@login_required
+@admin_required
+def refresh_materialized_views():
+    """Rebuild the SPISA materialized views (admin only)"""
+    try:
+        views = current_app.db_manager.refresh_materialized_views()
+        cache.clear()
+        logger.info(f"Materialized views refreshed by admin: {views}")
+        return jsonify({
+            'status': 'success',
+            'message': 'Materialized views refreshed successfully',
+            'views': views
+        })
+    except Exception as e:
+        logger.error(f"Error refreshing materialized views: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
 @cache_admin_bp.route('/api/admin/cache/stats', methods=['GET'])
 @login_required
 @admin_required
@@ -109,28 +147,31 @@ def cache_stats():
 @admin_required
 def test_cache():
     """
-    Test cache functionality (admin only)
+    Health check of the cache backend (admin only)
+    
+    Stores, reads back and deletes an analytics-sized payload, timing each call.
     """
     try:
-        import time
-        
-        # Test cache set/get
-        test_key = 'cache_test_key'
-        test_value = {'timestamp': time.time(), 'message': 'Cache is working'}
-        
-        cache.set(test_key, test_value, timeout=60)
-        retrieved_value = cache.get(test_key)
+        payload = _probe_payload()
+        set_ms, get_ms, ok = _cache_round_trip('cache_test_key', payload)
+        result = {
+            'backend': cache.config.get('CACHE_TYPE', 'Unknown'),
+            'set_ms': round(set_ms, 3),
+            'get_ms': round(get_ms, 3),
+            'payload_bytes': len(pickle.dumps(payload))
+        }
         
-        if retrieved_value:
+        if ok:
             return jsonify({
                 'status': 'success',
                 'message': 'Cache is working correctly',
-                'test_data': retrieved_value
+                'test_data': result
             })
         else:
             return jsonify({
                 'status': 'warning',
-                'message': 'Cache set but retrieval failed'
+                'message': 'Cache set but retrieval failed',
+                'test_data': result
             }), 500
     except Exception as e:
         logger.error(f"Error testing cache: {e}")
@@ -139,3 +180,72 @@ def test_cache():
             'message': str(e)
         }), 500
 
+
+@cache_admin_bp.route('/api/admin/cache/benchmark', methods=['GET'])
+@login_required
+@admin_required
+def benchmark_cache():
+    """
+    Latency percentiles of the cache backend (admin only)
+    
+    Query params: iterations (default 100, 2-1000)
+    """
+    try:
+        iterations = min(max(request.args.get('iterations', 100, type=int), 2), 1000)
+        payload = _probe_payload()
+        set_times, get_times, failures = [], [], 0
+        for i in range(iterations):
+            set_ms, get_ms, ok = _cache_round_trip(f'cache_benchmark_key_{i}', payload)
+            set_times.append(set_ms)
+            get_times.append(get_ms)
+            failures += not ok
+        
+        return jsonify({
+            'status': 'success' if not failures else 'warning',
+            'benchmark': {
+                'backend': cache.config.get('CACHE_TYPE', 'Unknown'),
+                'iterations': iterations,
+                'failures': failures,
+                'payload_bytes': len(pickle.dumps(payload)),
+                'set_ms': _latency_percentiles(set_times),
+                'get_ms': _latency_percentiles(get_times)
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error benchmarking cache: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+
+@lru_cache(maxsize=1)
+def _probe_payload():
+    """About 16 KB of records, the size of a typical cached analytics result"""
+    rows = []
+    while len(pickle.dumps(rows)) < CACHE_PROBE_BYTES:
+        rows.append({
+            'Id': len(rows),
+            'CustomerName': f'Cliente de prueba {len(rows):04d} S.A.',
+            'TotalRevenue': 1234567.89 + len(rows),
+            'OrderCount': 42,
+            'FormattedRevenue': f'ARS {1.2 + len(rows) / 1000:.3f}M'
+        })
+    return rows
+
+
+def _cache_round_trip(key, payload):
+    """Set, get and delete one key; returns (set_ms, get_ms, read back intact)"""
+    start = time.perf_counter()
+    cache.set(key, payload, timeout=60)
+    stored = time.perf_counter()
+    value = cache.get(key)
+    read = time.perf_counter()
+    cache.delete(key)
+    return (stored - start) * 1000, (read - stored) * 1000, value == payload
+
+
+def _latency_percentiles(samples):
+    """p50/p99/max of millisecond timings"""
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50': round(cuts[49], 3), 'p99': round(cuts[98], 3), 'max': round(max(samples), 3)}
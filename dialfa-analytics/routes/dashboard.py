@@ -2,138 +2,256 @@
 Dashboard Routes
 Main dashboard API endpoints
 """
-from flask import Blueprint, render_template, jsonify, current_app
+from flask import Blueprint, render_template, jsonify, request, current_app, copy_current_request_context, stream_with_context
 from flask_login import login_required
+from functools import partial, wraps
 import logging
+from database.connection import carry_query_counter
 
 dashboard_bp = Blueprint('dashboard', __name__)
 logger = logging.getLogger(__name__)
 
+def safe_route(label):
+    """Decorator for API views: an unhandled exception is logged as "<label> error: ..."
+    (with its traceback, on the view module's logger) and answered with a JSON 500"""
+    def decorator(view):
+        view_logger = logging.getLogger(view.__module__)
+        
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                return view(*args, **kwargs)
+            except Exception as e:
+                view_logger.error("%s error: %s", label, e, exc_info=True)
+                return jsonify({'error': str(e), 'status': 'error'}), 500
+        return wrapper
+    return decorator
+
+def register_analytics_views(blueprint, views):
+    """Add a view to blueprint for each (rule, endpoint, error label, analytics module,
+    method, query args) entry. The view calls current_app.<module>.<method> with the query
+    args, given as (name, type, default, (low, high)), and answers {"data": result,
+    "status": "success"}, with total_records when the result is a list; an arg outside
+    its bounds is answered with a JSON 400 before any query runs"""
+    for rule, endpoint, label, module, method, params in views:
+        view = _analytics_view(module, method, params)
+        view.__name__ = view.__qualname__ = endpoint
+        view.__module__ = blueprint.import_name
+        blueprint.add_url_rule(rule, endpoint, safe_route(label)(view))
+
+def _analytics_view(module, method, params):
+    def view():
+        args = []
+        for name, arg_type, default, (low, high) in params:
+            value = request.args.get(name, default, type=arg_type)
+            if not low <= value <= high:
+                return invalid_arg(name, low, high)
+            args.append(value)
+        data = getattr(getattr(current_app, module), method)(*args)
+        body = {'data': data}
+        if isinstance(data, list):
+            body['total_records'] = len(data)
+        body['status'] = 'success'
+        return jsonify(body)
+    return view
+
+def invalid_arg(name, low, high):
+    """JSON 400 answer for a query arg outside [low, high]"""
+    return jsonify({
+        'error': f'{name} must be between {low} and {high}',
+        'status': 'error'
+    }), 400
+
+def first_paint_data(loaders):
+    """{url: response body} of the API calls a page makes on load, rendered into its
+    #bootstrap-data block (base.html) so fetchJSON needs no request for them; None on
+    error, leaving the page to request them itself"""
+    try:
+        return {url: load() for url, load in loaders.items()}
+    except Exception as e:
+        logger.warning(f"First-paint data not embedded: {e}")
+        return None
+
+def run_concurrently(**calls):
+    """Run independent analytics calls on the analytics pool and return {name: result};
+    each call sees a copy of the current request context (cache, current_user)"""
+    pool = current_app.analytics_pool
+    futures = {
+        name: pool.submit(carry_query_counter(copy_current_request_context(call)))
+        for name, call in calls.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+# Rows serialized per chunk by stream_json
+STREAM_CHUNK_ROWS = 500
+
+# Largest page a client may ask for with ?limit=
+MAX_PAGE_ROWS = 5000
+
+def paginate(rows):
+    """Slice rows by ?limit=&offset= (limit capped at MAX_PAGE_ROWS; without one, the first
+    MAX_RECORDS rows). Returns the page and the total_records/returned/next_offset fields,
+    next_offset being None on the last page"""
+    limit = request.args.get('limit', type=int)
+    limit = current_app.config['MAX_RECORDS'] if limit is None else max(0, min(limit, MAX_PAGE_ROWS))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    page = rows[offset:offset + limit]
+    next_offset = offset + len(page) if offset + len(page) < len(rows) else None
+    return page, {'total_records': len(rows), 'returned': len(page), 'next_offset': next_offset}
+
+def wants_columnar():
+    """True when the client asked for ?format=columnar"""
+    return request.args.get('format') == 'columnar'
+
+def to_columnar(rows):
+    """Records as {"columns": [...], "rows": [[...], ...]}: the keys are sent once instead of on
+    every row, which shrinks the payload and spares a dict per row on both ends"""
+    columns = list(rows[0].keys()) if rows else []
+    return {'columns': columns, 'rows': [list(row.values()) for row in rows]}
+
+def stream_json(rows, **fields):
+    """Streamed JSON response {"data": rows, **fields}, serialized STREAM_CHUNK_ROWS rows at a
+    time with the app's JSON provider, so large results never sit in one response buffer.
+    With ?format=columnar, data is {"columns": [...], "rows": [[...], ...]} (see to_columnar)"""
+    dumps = current_app.json.dumps
+    columnar = wants_columnar()
+    
+    def generate():
+        if columnar:
+            columns = list(rows[0].keys()) if rows else []
+            yield f'{{"data":{{"columns":{dumps(columns)},"rows":['
+        else:
+            yield '{"data":['
+        for start in range(0, len(rows), STREAM_CHUNK_ROWS):
+            batch = rows[start:start + STREAM_CHUNK_ROWS]
+            if columnar:
+                batch = [list(row.values()) for row in batch]
+            # The chunk's list without its brackets
+            chunk = dumps(batch)[1:-1]
+            yield chunk if start == 0 else ',' + chunk
+        yield ']}' if columnar else ']'
+        for name, value in fields.items():
+            yield f',{dumps(name)}:{dumps(value)}'
+        yield '}'
+    
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+def add_http_caching(response):
+    """after_request hook for API blueprints: let browsers reuse JSON data for a minute and
+    revalidate it with an ETag (answered with 304 Not Modified when unchanged)"""
+    if request.method == 'GET' and response.status_code == 200 and response.mimetype == 'application/json':
+        response.cache_control.private = True
+        response.cache_control.max_age = 60
+        # Hashing a streamed body would buffer it whole; those only get Cache-Control
+        if not response.is_streamed:
+            response.add_etag()
+            response.make_conditional(request)
+    return response
+
+dashboard_bp.after_request(add_http_caching)
+
 @dashboard_bp.route('/api/dashboard/overview')
 @login_required
+@safe_route('Dashboard overview')
 def dashboard_overview():
     """Get dashboard overview data"""
-    try:
-        # Get financial summary
-        financial_summary = current_app.financial_analytics.get_executive_summary()
-        
-        # Get inventory summary
-        inventory_summary = current_app.inventory_analytics.get_summary()
-        
-        # Get sales summary
-        sales_summary = current_app.sales_analytics.get_summary()
-        
-        return jsonify({
-            'financial': financial_summary,
-            'inventory': inventory_summary,
-            'sales': sales_summary,
-            'status': 'success'
-        })
-        
-    except Exception as e:
-        logger.error(f"Dashboard overview error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    # Financial, inventory and sales summaries, fetched concurrently
+    summaries = run_concurrently(
+        financial=current_app.financial_analytics.get_executive_summary,
+        inventory=current_app.inventory_analytics.get_summary,
+        sales=current_app.sales_analytics.get_summary,
+    )
+    
+    return jsonify({**summaries, 'status': 'success'})
+    
 
 @dashboard_bp.route('/api/dashboard/charts')
 @login_required
+@safe_route('Dashboard charts')
 def dashboard_charts():
     """Get chart data for dashboard"""
-    try:
+    charts = run_concurrently(
         # Cash flow chart with payment type breakdown
-        cash_flow = current_app.financial_analytics.get_cash_flow_history()
-        
+        cash_flow=current_app.financial_analytics.get_cash_flow_history,
         # Top customers chart
-        top_customers = current_app.financial_analytics.get_top_customers(5)
-        
+        top_customers=partial(current_app.financial_analytics.get_top_customers, 5),
         # Monthly sales trend
-        sales_trend = current_app.sales_analytics.get_monthly_trends()
-        
+        sales_trend=current_app.sales_analytics.get_monthly_trends,
         # Category analysis
-        category_analysis = current_app.inventory_analytics.get_category_analysis()
-        
-        return jsonify({
-            'cash_flow': cash_flow,
-            'top_customers': top_customers,
-            'sales_trend': sales_trend[:6],  # Last 6 months
-            'category_analysis': category_analysis[:5],  # Top 5 categories
-            'status': 'success'
-        })
-        
-    except Exception as e:
-        logger.error(f"Dashboard charts error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+        category_analysis=current_app.inventory_analytics.get_category_analysis,
+    )
+    
+    return jsonify({
+        'cash_flow': charts['cash_flow'],
+        'top_customers': charts['top_customers'],
+        'sales_trend': charts['sales_trend'][:6],  # Last 6 months
+        'category_analysis': charts['category_analysis'][:5],  # Top 5 categories
+        'status': 'success'
+    })
+    
 
 @dashboard_bp.route('/api/dashboard/kpis')
 @login_required
+@safe_route('Dashboard KPIs')
 def dashboard_kpis():
     """Get key performance indicators"""
-    try:
-        # Financial KPIs
-        financial_kpis = current_app.financial_analytics.get_financial_kpis()
-        
-        # Inventory KPIs
-        inventory_kpis = current_app.inventory_analytics.get_inventory_kpis()
-        
-        # Sales KPIs
-        sales_kpis = current_app.sales_analytics.get_sales_kpis()
-        
-        return jsonify({
-            'financial_kpis': financial_kpis,
-            'inventory_kpis': inventory_kpis,
-            'sales_kpis': sales_kpis,
-            'status': 'success'
-        })
-        
-    except Exception as e:
-        logger.error(f"Dashboard KPIs error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    # Financial, inventory and sales KPIs, fetched concurrently
+    kpis = run_concurrently(
+        financial_kpis=current_app.financial_analytics.get_financial_kpis,
+        inventory_kpis=current_app.inventory_analytics.get_inventory_kpis,
+        sales_kpis=current_app.sales_analytics.get_sales_kpis,
+    )
+    
+    return jsonify({**kpis, 'status': 'success'})
+    
 
 @dashboard_bp.route('/api/dashboard/alerts')
 @login_required
+@safe_route('Dashboard alerts')
 def dashboard_alerts():
     """Get system alerts and notifications"""
-    try:
-        alerts = []
-        
-        # Credit risk alerts
-        credit_risks = current_app.financial_analytics.get_credit_risk_analysis()
-        high_risk_customers = [c for c in credit_risks if c.get('RiskLevel') == 'HIGH RISK']
-        
-        if high_risk_customers:
-            alerts.append({
-                'type': 'warning',
-                'category': 'Financial',
-                'message': f"{len(high_risk_customers)} customers with high credit risk",
-                'count': len(high_risk_customers)
-            })
-        
-        # Stock alerts
-        stock_alerts = current_app.inventory_analytics.get_stock_alerts()
-        out_of_stock = [s for s in stock_alerts if s.get('AlertType') == 'OUT_OF_STOCK']
-        low_stock = [s for s in stock_alerts if s.get('AlertType') == 'LOW_STOCK']
-        
-        if out_of_stock:
-            alerts.append({
-                'type': 'danger',
-                'category': 'Inventory',
-                'message': f"{len(out_of_stock)} products out of stock",
-                'count': len(out_of_stock)
-            })
-        
-        if low_stock:
-            alerts.append({
-                'type': 'warning',
-                'category': 'Inventory',
-                'message': f"{len(low_stock)} products with low stock",
-                'count': len(low_stock)
-            })
-        
-        return jsonify({
-            'alerts': alerts,
-            'total_alerts': len(alerts),
-            'status': 'success'
+    alerts = []
+    
+    # Only the counts are needed, not the credit risk and stock alert rows
+    counts = run_concurrently(
+        high_risk=current_app.financial_analytics.get_high_risk_count,
+        stock=current_app.inventory_analytics.get_stock_alert_counts,
+    )
+    
+    # Credit risk alerts
+    high_risk_count = counts['high_risk']
+    
+    if high_risk_count:
+        alerts.append({
+            'type': 'warning',
+            'category': 'Financial',
+            'message': f"{high_risk_count} customers with high credit risk",
+            'count': high_risk_count
         })
-        
-    except Exception as e:
-        logger.error(f"Dashboard alerts error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    
+    # Stock alerts
+    out_of_stock_count = counts['stock']['out_of_stock']
+    low_stock_count = counts['stock']['low_stock']
+    
+    if out_of_stock_count:
+        alerts.append({
+            'type': 'danger',
+            'category': 'Inventory',
+            'message': f"{out_of_stock_count} products out of stock",
+            'count': out_of_stock_count
+        })
+    
+    if low_stock_count:
+        alerts.append({
+            'type': 'warning',
+            'category': 'Inventory',
+            'message': f"{low_stock_count} products with low stock",
+            'count': low_stock_count
+        })
+    
+    return jsonify({
+        'alerts': alerts,
+        'total_alerts': len(alerts),
+        'status': 'success'
+    })
+    
@@ -4,11 +4,15 @@ Financial analysis API endpoints
 """
 from flask import Blueprint, render_template, jsonify, request, current_app
 from flask_login import login_required
+from routes.dashboard import add_http_caching, first_paint_data, invalid_arg, paginate, register_analytics_views, run_concurrently, safe_route, stream_json, to_columnar, wants_columnar
 import logging
 
 financial_bp = Blueprint('financial', __name__)
 logger = logging.getLogger(__name__)
 
+# Browser caching with ETag revalidation on the JSON endpoints
+financial_bp.after_request(add_http_caching)
+
 # Protect all routes in this blueprint
 @financial_bp.before_request
 @login_required
@@ -18,210 +22,78 @@ def require_login():
 
 @financial_bp.route('/')
 def financial_dashboard():
-    """Financial dashboard page"""
-    return render_template('financial/dashboard.html')
-
-@financial_bp.route('/api/executive-summary')
-def executive_summary():
-    """Get executive financial summary"""
-    try:
-        summary = current_app.financial_analytics.get_executive_summary()
-        return jsonify({
-            'data': summary,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Executive summary error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/credit-risk')
-def credit_risk():
-    """Get credit risk analysis"""
-    try:
-        risk_analysis = current_app.financial_analytics.get_credit_risk_analysis()
-        return jsonify({
-            'data': risk_analysis,
-            'total_records': len(risk_analysis),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Credit risk error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/cash-flow-history')
-def cash_flow_history():
-    """Get historical cash flow data"""
-    try:
-        months = request.args.get('months', 12, type=int)
-        cash_flow_data = current_app.financial_analytics.get_cash_flow_history(months)
-        return jsonify({
-            'data': cash_flow_data,
-            'total_records': len(cash_flow_data),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Cash flow history error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/cash-flow-forecast')
-def cash_flow_forecast():
-    """Get cash flow forecast with predictions"""
-    try:
-        forecast_months = request.args.get('months', 6, type=int)
-        forecast_data = current_app.financial_analytics.get_cash_flow_forecast(forecast_months)
-        return jsonify({
-            'data': forecast_data,
-            'total_records': len(forecast_data),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Cash flow forecast error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/billing-monthly')
-def billing_monthly():
-    """Get monthly billing from xERP"""
-    try:
-        data = current_app.sales_analytics.get_xerp_billed_monthly()
-        return jsonify({
-            'data': data,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Monthly billing error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/billing-today')
-def billing_today():
-    """Get today's billing from xERP"""
-    try:
-        data = current_app.sales_analytics.get_xerp_billed_today()
-        return jsonify({
-            'data': data,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Today billing error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/collected-monthly')
-def collected_monthly():
-    """Get monthly collections from SPISA"""
-    try:
-        data = current_app.financial_analytics.get_spisa_collected_monthly()
-        return jsonify({
-            'data': data,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Monthly collections error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/future-payments')
-def future_payments():
-    """Get post-dated checks pending to be cashed (Cheques en cartera)"""
-    try:
-        data = current_app.financial_analytics.get_spisa_future_payments()
-        return jsonify({
-            'data': data,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Future payments error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    """Financial dashboard page, rendered with the dashboard bundle it loads first"""
+    bootstrap = first_paint_data({
+        '/financial/api/dashboard-bundle': lambda: {'data': _dashboard_bundle(), 'status': 'success'},
+    })
+    return render_template('financial/dashboard.html', bootstrap=bootstrap)
+
+# Views answering with a single analytics call
+FINANCIAL_VIEWS = [
+    ('/api/executive-summary', 'executive_summary', 'Executive summary', 'financial_analytics', 'get_executive_summary', ()),
+    ('/api/credit-risk', 'credit_risk', 'Credit risk', 'financial_analytics', 'get_credit_risk_analysis', ()),
+    ('/api/cash-flow-history', 'cash_flow_history', 'Cash flow history', 'financial_analytics', 'get_cash_flow_history', (('months', int, 12, (1, 60)),)),
+    ('/api/cash-flow-forecast', 'cash_flow_forecast', 'Cash flow forecast', 'financial_analytics', 'get_cash_flow_forecast', (('months', int, 6, (1, 24)),)),
+    ('/api/billing-monthly', 'billing_monthly', 'Monthly billing', 'sales_analytics', 'get_xerp_billed_monthly', ()),
+    ('/api/billing-today', 'billing_today', 'Today billing', 'sales_analytics', 'get_xerp_billed_today', ()),
+    ('/api/collected-monthly', 'collected_monthly', 'Monthly collections', 'financial_analytics', 'get_spisa_collected_monthly', ()),
+    # Post-dated checks pending to be cashed (Cheques en cartera)
+    ('/api/future-payments', 'future_payments', 'Future payments', 'financial_analytics', 'get_spisa_future_payments', ()),
+    ('/api/payment-trends', 'payment_trends', 'Payment trends', 'financial_analytics', 'get_payment_trends', ()),
+    ('/api/kpis', 'financial_kpis', 'Financial KPIs', 'financial_analytics', 'get_financial_kpis', ()),
+    ('/api/expected-collections', 'expected_collections', 'Expected collections', 'financial_analytics', 'get_expected_collections', ()),
+    ('/api/collection-performance', 'collection_performance', 'Collection performance', 'financial_analytics', 'get_collection_performance', ()),
+]
+register_analytics_views(financial_bp, FINANCIAL_VIEWS)
+
+@financial_bp.route('/api/dashboard-bundle')
+@safe_route('Financial dashboard bundle')
+def dashboard_bundle():
+    """Get everything the financial dashboard shows on load in one response"""
+    return jsonify({
+        'data': _dashboard_bundle(),
+        'status': 'success'
+    })
+
+def _dashboard_bundle():
+    financial = current_app.financial_analytics
+    # The sections read two databases, so they run concurrently rather than as one statement
+    return run_concurrently(
+        executive_summary=financial.get_executive_summary,
+        cash_flow_history=financial.get_cash_flow_history,
+        collection_performance=financial.get_collection_performance,
+        credit_risk=financial.get_credit_risk_analysis,
+        top_customers=financial.get_top_customers,
+        payment_trends=financial.get_payment_trends,
+        future_payments=financial.get_spisa_future_payments,
+        billing_monthly=current_app.sales_analytics.get_xerp_billed_monthly,
+        billing_today=current_app.sales_analytics.get_xerp_billed_today,
+    )
 
 @financial_bp.route('/api/top-customers')
+@safe_route('Top customers')
 def top_customers():
     """Get top customers by balance"""
-    try:
-        limit = request.args.get('limit', 10, type=int)
-        customers = current_app.financial_analytics.get_top_customers(limit)
-        return jsonify({
-            'data': customers,
-            'total_records': len(customers),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Top customers error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    limit = request.args.get('limit', 10, type=int)
+    if not 1 <= limit <= 500:
+        return invalid_arg('limit', 1, 500)
+    customers = current_app.financial_analytics.get_top_customers(limit)
+    return jsonify({
+        'data': to_columnar(customers) if wants_columnar() else customers,
+        'total_records': len(customers),
+        'status': 'success'
+    })
 
 @financial_bp.route('/api/customer-profitability')
+@safe_route('Customer profitability')
 def customer_profitability():
     """Get customer profitability analysis"""
-    try:
-        profitability = current_app.financial_analytics.get_customer_profitability()
-        return jsonify({
-            'data': profitability,
-            'total_records': len(profitability),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Customer profitability error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    profitability, page_fields = paginate(current_app.financial_analytics.get_customer_profitability())
+    return stream_json(profitability, **page_fields, status='success')
 
 @financial_bp.route('/api/aging-analysis')
+@safe_route('Aging analysis')
 def aging_analysis():
     """Get accounts receivable aging analysis"""
-    try:
-        aging = current_app.financial_analytics.get_aging_analysis()
-        return jsonify({
-            'data': aging,
-            'total_records': len(aging),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Aging analysis error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/payment-trends')
-def payment_trends():
-    """Get payment trends analysis"""
-    try:
-        trends = current_app.financial_analytics.get_payment_trends()
-        return jsonify({
-            'data': trends,
-            'total_records': len(trends),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Payment trends error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/kpis')
-def financial_kpis():
-    """Get financial KPIs"""
-    try:
-        kpis = current_app.financial_analytics.get_financial_kpis()
-        return jsonify({
-            'data': kpis,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Financial KPIs error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/expected-collections')
-def expected_collections():
-    """Get expected collections based on invoice aging"""
-    try:
-        collections = current_app.financial_analytics.get_expected_collections()
-        return jsonify({
-            'data': collections,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Expected collections error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@financial_bp.route('/api/collection-performance')
-def collection_performance():
-    """Get collection performance metrics (DSO, on-time %)"""
-    try:
-        performance = current_app.financial_analytics.get_collection_performance()
-        return jsonify({
-            'data': performance,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Collection performance error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    aging, page_fields = paginate(current_app.financial_analytics.get_aging_analysis())
+    return stream_json(aging, **page_fields, status='success')
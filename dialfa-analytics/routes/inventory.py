@@ -2,13 +2,17 @@
 Inventory Routes
 Inventory analysis API endpoints
 """
-from flask import Blueprint, render_template, jsonify, request, current_app
+from flask import Blueprint, render_template, jsonify, current_app
 from flask_login import login_required
+from routes.dashboard import add_http_caching, first_paint_data, paginate, register_analytics_views, safe_route, stream_json
 import logging
 
 inventory_bp = Blueprint('inventory', __name__)
 logger = logging.getLogger(__name__)
 
+# Browser caching with ETag revalidation on the JSON endpoints
+inventory_bp.after_request(add_http_caching)
+
 # Protect all routes in this blueprint
 @inventory_bp.before_request
 @login_required
@@ -18,199 +22,77 @@ def require_login():
 
 @inventory_bp.route('/')
 def inventory_dashboard():
-    """Inventory dashboard page"""
-    return render_template('inventory/dashboard.html')
-
-@inventory_bp.route('/api/summary')
-def inventory_summary():
-    """Get inventory summary"""
-    try:
-        summary = current_app.inventory_analytics.get_summary()
-        return jsonify({
-            'data': summary,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Inventory summary error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/top-stock-value')
-def top_stock_value():
-    """Get products with highest stock value"""
-    try:
-        limit = request.args.get('limit', 10, type=int)
-        top_stock = current_app.inventory_analytics.get_top_stock_value(limit)
-        return jsonify({
-            'data': top_stock,
-            'total_records': len(top_stock),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Top stock value error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    """Inventory dashboard page, rendered with the summary cards' data"""
+    inventory = current_app.inventory_analytics
+    bootstrap = first_paint_data({
+        '/inventory/api/summary': lambda: {'data': inventory.get_summary(), 'status': 'success'},
+        '/inventory/api/stock-variation-kpis': lambda: {'data': inventory.get_stock_variation_kpis(), 'status': 'success'},
+    })
+    return render_template('inventory/dashboard.html', bootstrap=bootstrap)
+
+# Views answering with a single analytics call
+INVENTORY_VIEWS = [
+    ('/api/summary', 'inventory_summary', 'Inventory summary', 'inventory_analytics', 'get_summary', ()),
+    ('/api/top-stock-value', 'top_stock_value', 'Top stock value', 'inventory_analytics', 'get_top_stock_value', (('limit', int, 10, (1, 500)),)),
+    ('/api/category-analysis', 'category_analysis', 'Category analysis', 'inventory_analytics', 'get_category_analysis', ()),
+    ('/api/abc-analysis', 'abc_analysis', 'ABC analysis', 'inventory_analytics', 'get_abc_analysis', ()),
+    ('/api/stock-alerts', 'stock_alerts', 'Stock alerts', 'inventory_analytics', 'get_stock_alerts', ()),
+    ('/api/kpis', 'inventory_kpis', 'Inventory KPIs', 'inventory_analytics', 'get_inventory_kpis', ()),
+    ('/api/stock-velocity-summary', 'stock_velocity_summary', 'Stock velocity summary', 'inventory_analytics', 'get_stock_velocity_summary', ()),
+    ('/api/stock-variation-kpis', 'stock_variation_kpis', 'Stock variation KPIs', 'inventory_analytics', 'get_stock_variation_kpis', ()),
+    ('/api/stock-value-evolution', 'stock_value_evolution', 'Stock value evolution', 'inventory_analytics', 'get_stock_value_evolution', (('months', int, 12, (1, 60)),)),
+]
+register_analytics_views(inventory_bp, INVENTORY_VIEWS)
 
 @inventory_bp.route('/api/slow-moving')
+@safe_route('Slow moving analysis')
 def slow_moving_analysis():
     """Get slow-moving stock analysis"""
-    try:
-        slow_moving = current_app.inventory_analytics.get_slow_moving_analysis()
-        return jsonify({
-            'data': slow_moving,
-            'total_records': len(slow_moving),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Slow moving analysis error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/category-analysis')
-def category_analysis():
-    """Get inventory analysis by category"""
-    try:
-        categories = current_app.inventory_analytics.get_category_analysis()
-        return jsonify({
-            'data': categories,
-            'total_records': len(categories),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Category analysis error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    slow_moving, page_fields = paginate(current_app.inventory_analytics.get_slow_moving_analysis())
+    return jsonify({
+        'data': slow_moving,
+        **page_fields,
+        'status': 'success'
+    })
 
 @inventory_bp.route('/api/reorder-recommendations')
+@safe_route('Reorder recommendations')
 def reorder_recommendations():
     """Get reorder recommendations"""
-    try:
-        recommendations = current_app.inventory_analytics.get_reorder_recommendations()
-        return jsonify({
-            'data': recommendations,
-            'total_records': len(recommendations),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Reorder recommendations error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/abc-analysis')
-def abc_analysis():
-    """Get ABC analysis"""
-    try:
-        abc_data = current_app.inventory_analytics.get_abc_analysis()
-        return jsonify({
-            'data': abc_data,
-            'total_records': len(abc_data),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"ABC analysis error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/stock-alerts')
-def stock_alerts():
-    """Get stock level alerts"""
-    try:
-        alerts = current_app.inventory_analytics.get_stock_alerts()
-        return jsonify({
-            'data': alerts,
-            'total_records': len(alerts),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Stock alerts error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/kpis')
-def inventory_kpis():
-    """Get inventory KPIs"""
-    try:
-        kpis = current_app.inventory_analytics.get_inventory_kpis()
-        return jsonify({
-            'data': kpis,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Inventory KPIs error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    recommendations, page_fields = paginate(current_app.inventory_analytics.get_reorder_recommendations())
+    return jsonify({
+        'data': recommendations,
+        **page_fields,
+        'status': 'success'
+    })
 
 @inventory_bp.route('/api/stock-variation-over-time')
+@safe_route('Stock variation over time')
 def stock_variation_over_time():
     """Get detailed stock variation analysis over time"""
-    try:
-        variation_data = current_app.inventory_analytics.get_stock_variation_over_time()
-        return jsonify({
-            'data': variation_data,
-            'total_records': len(variation_data),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Stock variation over time error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/stock-velocity-summary')
-def stock_velocity_summary():
-    """Get comprehensive stock velocity and turnover analysis"""
-    try:
-        velocity_data = current_app.inventory_analytics.get_stock_velocity_summary()
-        return jsonify({
-            'data': velocity_data,
-            'total_records': len(velocity_data),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Stock velocity summary error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/stock-variation-kpis')
-def stock_variation_kpis():
-    """Get key performance indicators from stock variation analysis"""
-    try:
-        kpis = current_app.inventory_analytics.get_stock_variation_kpis()
-        return jsonify({
-            'data': kpis,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Stock variation KPIs error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@inventory_bp.route('/api/stock-value-evolution')
-def stock_value_evolution():
-    """Get historical stock value evolution"""
-    try:
-        months = request.args.get('months', 12, type=int)
-        evolution_data = current_app.inventory_analytics.get_stock_value_evolution(months)
-        return jsonify({
-            'data': evolution_data,
-            'total_records': len(evolution_data),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Stock value evolution error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    variation_data, page_fields = paginate(current_app.inventory_analytics.get_stock_variation_over_time())
+    return stream_json(variation_data, **page_fields, status='success')
 
 @inventory_bp.route('/api/out-of-stock-analysis')
+@safe_route('Out of stock analysis')
 def out_of_stock_analysis():
     """Get detailed analysis of out of stock items with priority classification"""
-    try:
-        analysis_data = current_app.inventory_analytics.get_out_of_stock_analysis()
-        
-        # Calculate summary stats
-        summary = {
-            'total_count': len(analysis_data),
-            'healthy_count': len([x for x in analysis_data if x['StockProfile'] == 'Healthy']),
-            'slow_moving_count': len([x for x in analysis_data if x['StockProfile'] in ['Slow Moving', 'Moderate']]),
-            'dead_stock_count': len([x for x in analysis_data if x['StockProfile'] == 'Dead Stock']),
-            'discontinued_count': len([x for x in analysis_data if x['StockProfile'] == 'Discontinued']),
-            'total_lost_sales': sum([x['EstimatedLostSales'] for x in analysis_data]),
-            'urgent_reorder_count': len([x for x in analysis_data if x['Priority'] == 4])
-        }
-        
-        return jsonify({
-            'data': analysis_data,
-            'summary': summary,
-            'total_records': len(analysis_data),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Out of stock analysis error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    analysis_data = current_app.inventory_analytics.get_out_of_stock_analysis()
+    
+    # Calculate summary stats
+    summary = {
+        'total_count': len(analysis_data),
+        'healthy_count': len([x for x in analysis_data if x['StockProfile'] == 'Healthy']),
+        'slow_moving_count': len([x for x in analysis_data if x['StockProfile'] in ['Slow Moving', 'Moderate']]),
+        'dead_stock_count': len([x for x in analysis_data if x['StockProfile'] == 'Dead Stock']),
+        'discontinued_count': len([x for x in analysis_data if x['StockProfile'] == 'Discontinued']),
+        'total_lost_sales': sum([x['EstimatedLostSales'] for x in analysis_data]),
+        'urgent_reorder_count': len([x for x in analysis_data if x['Priority'] == 4])
+    }
+    
+    return jsonify({
+        'data': analysis_data,
+        'summary': summary,
+        'total_records': len(analysis_data),
+        'status': 'success'
+    })
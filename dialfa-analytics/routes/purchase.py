@@ -2,13 +2,17 @@
 Purchase Order Routes
 Reorder analysis and supplier management endpoints
 """
-from flask import Blueprint, render_template, jsonify, request, current_app
+from flask import Blueprint, render_template, request, current_app
 from flask_login import login_required
+from routes.dashboard import add_http_caching, invalid_arg, paginate, register_analytics_views, safe_route, stream_json
 import logging
 
 purchase_bp = Blueprint('purchase', __name__)
 logger = logging.getLogger(__name__)
 
+# Browser caching with ETag revalidation on the JSON endpoints
+purchase_bp.after_request(add_http_caching)
+
 # Protect all routes in this blueprint
 @purchase_bp.before_request
 @login_required
@@ -21,58 +25,38 @@ def purchase_dashboard():
     """Purchase orders dashboard page"""
     return render_template('purchase/dashboard.html')
 
+# Views answering with a single analytics call
+PURCHASE_VIEWS = [
+    ('/api/reorder-summary', 'reorder_summary', 'Reorder summary', 'purchase_analytics', 'get_reorder_summary', ()),
+]
+register_analytics_views(purchase_bp, PURCHASE_VIEWS)
+
 @purchase_bp.route('/api/reorder-analysis')
+@safe_route('Reorder analysis')
 def reorder_analysis():
     """Get detailed reorder analysis"""
-    try:
-        # Get demand_days parameter (default: 90)
-        demand_days = request.args.get('demand_days', 90, type=int)
-        
-        # Validate parameter
-        if demand_days < 1 or demand_days > 730:
-            return jsonify({
-                'error': 'demand_days must be between 1 and 730',
-                'status': 'error'
-            }), 400
-        
-        analysis_data = current_app.purchase_analytics.get_reorder_analysis(demand_days)
-        summary = current_app.purchase_analytics.get_reorder_summary()
-        
-        return jsonify({
-            'data': analysis_data,
-            'summary': summary,
-            'total_records': len(analysis_data),
-            'demand_days': demand_days,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Reorder analysis error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@purchase_bp.route('/api/reorder-summary')
-def reorder_summary():
-    """Get reorder summary KPIs"""
-    try:
-        summary = current_app.purchase_analytics.get_reorder_summary()
-        return jsonify({
-            'data': summary,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Reorder summary error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    # Get demand_days parameter (default: 90)
+    demand_days = request.args.get('demand_days', 90, type=int)
+    
+    # Validate parameter
+    if not 1 <= demand_days <= 730:
+        return invalid_arg('demand_days', 1, 730)
+    
+    analysis_data = current_app.purchase_analytics.get_reorder_analysis(demand_days)
+    # Summarizes the analysis above, reused within this request
+    summary = current_app.purchase_analytics.get_reorder_summary(demand_days)
+    
+    return stream_json(
+        analysis_data,
+        summary=summary,
+        total_records=len(analysis_data),
+        demand_days=demand_days,
+        status='success'
+    )
 
 @purchase_bp.route('/api/supplier-performance')
+@safe_route('Supplier performance')
 def supplier_performance():
     """Get supplier performance metrics"""
-    try:
-        suppliers = current_app.purchase_analytics.get_supplier_performance()
-        return jsonify({
-            'data': suppliers,
-            'total_records': len(suppliers),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Supplier performance error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
+    suppliers, page_fields = paginate(current_app.purchase_analytics.get_supplier_performance())
+    return stream_json(suppliers, **page_fields, status='success')
@@ -4,11 +4,15 @@ Sales analysis API endpoints
 """
 from flask import Blueprint, render_template, jsonify, request, current_app
 from flask_login import login_required
+from routes.dashboard import add_http_caching, first_paint_data, invalid_arg, register_analytics_views, run_concurrently, safe_route, stream_json
 import logging
 
 sales_bp = Blueprint('sales', __name__)
 logger = logging.getLogger(__name__)
 
+# Browser caching with ETag revalidation on the JSON endpoints
+sales_bp.after_request(add_http_caching)
+
 # Protect all routes in this blueprint
 @sales_bp.before_request
 @login_required
@@ -18,134 +22,101 @@ def require_login():
 
 @sales_bp.route('/')
 def sales_dashboard():
-    """Sales dashboard page"""
-    return render_template('sales/dashboard.html')
+    """Sales dashboard page, rendered with the dashboard bundle it loads first"""
+    bootstrap = first_paint_data({
+        '/sales/api/dashboard-bundle': lambda: {'data': _dashboard_bundle(), 'status': 'success'},
+    })
+    return render_template('sales/dashboard.html', bootstrap=bootstrap)
+
+# Views answering with a single analytics call
+SALES_VIEWS = [
+    ('/api/seasonal-analysis', 'seasonal_analysis', 'Seasonal analysis', 'sales_analytics', 'get_seasonal_analysis', ()),
+    ('/api/xerp-top-customers', 'xerp_top_customers', 'xERP top customers', 'sales_analytics', 'get_xerp_top_customers', (('limit', int, 10, (1, 500)),)),
+    ('/api/kpis', 'sales_kpis', 'Sales KPIs', 'sales_analytics', 'get_sales_kpis', ()),
+]
+register_analytics_views(sales_bp, SALES_VIEWS)
+
+@sales_bp.route('/api/dashboard-bundle')
+@safe_route('Sales dashboard bundle')
+def dashboard_bundle():
+    """Get everything the sales dashboard shows on load in one response"""
+    return jsonify({
+        'data': _dashboard_bundle(),
+        'status': 'success'
+    })
+
+def _dashboard_bundle():
+    sales = current_app.sales_analytics
+    return run_concurrently(
+        summary=sales.get_summary,
+        monthly_trends=sales.get_monthly_trends,
+        top_customers=sales.get_xerp_top_customers,
+    )
+
+@sales_bp.route('/api/customer-segmentation')
+@safe_route('Customer segmentation')
+def customer_segmentation():
+    """Get customer segmentation, one row per customer, streamed"""
+    segments = current_app.sales_analytics.get_customer_segmentation()
+    return stream_json(segments, total_records=len(segments), status='success')
+
+@sales_bp.route('/api/product-performance')
+@safe_route('Product performance')
+def product_performance():
+    """Get product performance, one row per product sold in the last year, streamed"""
+    products = current_app.sales_analytics.get_product_performance()
+    return stream_json(products, total_records=len(products), status='success')
 
 @sales_bp.route('/api/summary')
+@safe_route('Sales summary')
 def sales_summary():
     """Get sales summary"""
-    try:
-        summary = current_app.sales_analytics.get_summary()
-        return jsonify({
-            'data': summary,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Sales summary error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    # ?precise=1 returns the exact customer count instead of the estimate
+    precise = request.args.get('precise') == '1'
+    summary = current_app.sales_analytics.get_summary(precise)
+    return jsonify({
+        'data': summary,
+        'status': 'success'
+    })
 
 @sales_bp.route('/api/monthly-trends')
+@safe_route('Monthly trends')
 def monthly_trends():
     """Get monthly sales trends"""
-    try:
-        trends = current_app.sales_analytics.get_monthly_trends()
-        return jsonify({
-            'data': trends,
-            'total_records': len(trends),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Monthly trends error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    precise = request.args.get('precise') == '1'
+    trends = current_app.sales_analytics.get_monthly_trends(precise)
+    return jsonify({
+        'data': trends,
+        'total_records': len(trends),
+        'status': 'success'
+    })
 
 @sales_bp.route('/api/performance-by-period')
+@safe_route('Performance by period')
 def performance_by_period():
     """Get sales performance by period"""
-    try:
-        period = request.args.get('period', 'month')  # month, quarter, year
-        performance = current_app.sales_analytics.get_sales_performance_by_period(period)
-        return jsonify({
-            'data': performance,
-            'total_records': len(performance),
-            'period': period,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Performance by period error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@sales_bp.route('/api/customer-segmentation')
-def customer_segmentation():
-    """Get customer segmentation analysis"""
-    try:
-        segmentation = current_app.sales_analytics.get_customer_segmentation()
-        return jsonify({
-            'data': segmentation,
-            'total_records': len(segmentation),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Customer segmentation error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@sales_bp.route('/api/product-performance')
-def product_performance():
-    """Get product sales performance"""
-    try:
-        performance = current_app.sales_analytics.get_product_performance()
-        return jsonify({
-            'data': performance,
-            'total_records': len(performance),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Product performance error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@sales_bp.route('/api/seasonal-analysis')
-def seasonal_analysis():
-    """Get seasonal sales analysis"""
-    try:
-        seasonal = current_app.sales_analytics.get_seasonal_analysis()
-        return jsonify({
-            'data': seasonal,
-            'total_records': len(seasonal),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Seasonal analysis error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@sales_bp.route('/api/xerp-top-customers')
-def xerp_top_customers():
-    """Get top customers from xERP system"""
-    try:
-        limit = request.args.get('limit', 10, type=int)
-        customers = current_app.sales_analytics.get_xerp_top_customers(limit)
-        return jsonify({
-            'data': customers,
-            'total_records': len(customers),
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"xERP top customers error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    period = request.args.get('period', 'month')  # month, quarter, year
+    if period not in ('month', 'quarter'):
+        period = 'year'  # any other value was already the yearly view; one cache entry for all of them
+    performance = current_app.sales_analytics.get_sales_performance_by_period(period)
+    return jsonify({
+        'data': performance,
+        'total_records': len(performance),
+        'period': period,
+        'status': 'success'
+    })
 
 @sales_bp.route('/api/forecast')
+@safe_route('Sales forecast')
 def sales_forecast():
     """Get sales forecast"""
-    try:
-        months_ahead = request.args.get('months', 6, type=int)
-        forecast = current_app.sales_analytics.get_sales_forecast(months_ahead)
-        return jsonify({
-            'data': forecast,
-            'total_records': len(forecast),
-            'months_ahead': months_ahead,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Sales forecast error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
-
-@sales_bp.route('/api/kpis')
-def sales_kpis():
-    """Get sales KPIs"""
-    try:
-        kpis = current_app.sales_analytics.get_sales_kpis()
-        return jsonify({
-            'data': kpis,
-            'status': 'success'
-        })
-    except Exception as e:
-        logger.error(f"Sales KPIs error: {e}")
-        return jsonify({'error': str(e), 'status': 'error'}), 500
+    months_ahead = request.args.get('months', 6, type=int)
+    if not 1 <= months_ahead <= 24:
+        return invalid_arg('months', 1, 24)
+    forecast = current_app.sales_analytics.get_sales_forecast(months_ahead)
+    return jsonify({
+        'data': forecast,
+        'total_records': len(forecast),
+        'months_ahead': months_ahead,
+        'status': 'success'
+    })
@@ -5,11 +5,20 @@ import os
 import sys
 import subprocess
 
+# Directories the dashboard writes to
+DIRECTORIES = (
+    'exports',
+    'logs',
+    'static/uploads',
+)
+
 def install_requirements():
     """Install Python requirements"""
     print("Installing Python requirements...")
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "-r", "requirements.txt"])
+        # Prefer wheels over source builds (pyodbc, psycopg2, numpy, pandas) even when the
+        # sdist is newer; pip's wheel cache keeps re-runs off the network
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "--prefer-binary", "-r", "requirements.txt"])
         print("✓ Requirements installed successfully")
         return True
     except subprocess.CalledProcessError as e:
@@ -35,16 +44,10 @@ def check_database_connection():
 def create_directories():
     """Create necessary directories"""
     print("Creating directories...")
-    directories = [
-        'exports',
-        'logs',
-        'static/uploads'
-    ]
-    
-    for directory in directories:
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-            print(f"✓ Created directory: {directory}")
+    for directory in DIRECTORIES:
+        # Existing directories are left as they are
+        os.makedirs(directory, exist_ok=True)
+        print(f"✓ Directory ready: {directory}")
     
     return True
 
@@ -70,7 +73,7 @@ def main():
         print("\nNote: Database connection failed. Please check:")
         print("- Server: dialfa.database.windows.net")
         print("- Username: fp")
-        print("- Password: Ab1234,,,")
+        print("- Password: DB_PASSWORD in .env (or DB_AUTH=managed_identity)")
         print("- Databases: SPISA, xERP")
     
     print("\n" + "=" * 50)
@@ -306,6 +306,23 @@ async function apiRequest(url, options = {}) {
     }
 }
 
+/**
+ * Parsed JSON of a GET API call; responses the page was rendered with
+ * (the #bootstrap-data block) are used without a request
+ */
+let bootstrapData = null;
+
+function fetchJSON(url) {
+    if (bootstrapData === null) {
+        const element = document.getElementById('bootstrap-data');
+        bootstrapData = element ? JSON.parse(element.textContent) : {};
+    }
+    if (url in bootstrapData) {
+        return Promise.resolve(bootstrapData[url]);
+    }
+    return fetch(CONFIG.API_BASE_URL + url).then(response => response.json());
+}
+
 /**
  * Chart creation utilities
  */
@@ -2,27 +2,43 @@
 Script to get Railway deployment IP address
 Add this as a temporary route to your Flask app to see the outbound IP
 """
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+
+# One keep-alive connection pool per service host, reused by later calls
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(pool_connections=3, pool_maxsize=3))
+
+def fetch_ip(service):
+    response = SESSION.get(service, timeout=5)
+    response.raise_for_status()
+    if 'json' in service:
+        return response.json()['ip']
+    else:
+        return response.text.strip()
 
 def get_public_ip():
     try:
-        # Use multiple services in case one fails
+        # Ask multiple services at once in case one fails; the first answer wins
         services = [
             'https://api.ipify.org?format=json',
             'https://ifconfig.me/ip',
             'https://icanhazip.com',
         ]
         
-        for service in services:
-            try:
-                response = requests.get(service, timeout=5)
-                if 'json' in service:
-                    return response.json()['ip']
-                else:
-                    return response.text.strip()
-            except:
-                continue
-        return "Unable to fetch IP"
+        executor = ThreadPoolExecutor(max_workers=len(services))
+        try:
+            futures = [executor.submit(fetch_ip, service) for service in services]
+            for future in as_completed(futures):
+                try:
+                    return future.result()
+                except Exception:
+                    continue
+            return "Unable to fetch IP"
+        finally:
+            # Don't wait for the slower services once one has answered
+            executor.shutdown(wait=False, cancel_futures=True)
     except Exception as e:
         return f"Error: {str(e)}"
 